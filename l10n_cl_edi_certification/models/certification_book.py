@@ -3,9 +3,29 @@ from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 import base64
 
+from ..services.xsd_registry import XsdRegistry
+
 import logging
 _logger = logging.getLogger(__name__)
 
+# Estado del servicio de integración SII -> estado del libro (o segmento)
+SII_STATUS_STATE_MAP = {
+    'received': 'sent',
+    'validating': 'sent',
+    'accepted': 'accepted',
+    'rejected': 'rejected',
+    'with_repairs': 'accepted',  # Aceptado con reparos
+}
+
+# Mensaje descriptivo de cada estado del SII
+SII_STATUS_MESSAGES = {
+    'received': 'Recibido - En proceso de validación',
+    'validating': 'Validando documentos',
+    'accepted': '✅ Aceptado por el SII',
+    'rejected': '❌ Rechazado por el SII',
+    'with_repairs': '⚠️ Aceptado con reparos',
+}
+
 class CertificationBook(models.Model):
     """
     Libro de Compra/Venta (LibroCompraVenta) para certificación SII.
@@ -54,6 +74,14 @@ class CertificationBook(models.Model):
         tracking=True,
     )
 
+    segment_size = fields.Integer(
+        string='Líneas por Segmento',
+        default=0,
+        help='Si el libro tiene más líneas que este valor, se envía en segmentos '
+             '(TipoEnvio PARCIAL y un último FINAL), cada uno firmado y enviado por separado. '
+             '0 = envío TOTAL en un solo XML.'
+    )
+
     # Líneas/Detalles
     line_ids = fields.One2many(
         'l10n_cl_edi.certification.book.line',
@@ -62,6 +90,13 @@ class CertificationBook(models.Model):
         help='Detalles de documentos incluidos en el libro'
     )
 
+    segment_ids = fields.One2many(
+        'l10n_cl_edi.certification.book.segment',
+        'book_id',
+        string='Segmentos',
+        help='Envíos PARCIAL/FINAL del libro (vacío si se envía TOTAL)'
+    )
+
     lines_count = fields.Integer(
         string='Cantidad Líneas',
         compute='_compute_lines_count',
@@ -168,8 +203,20 @@ class CertificationBook(models.Model):
             try:
                 # Llamar al servicio de generación de libro
                 book_service = self.env['l10n_cl_edi.book.generator.service'].sudo()
-                book_xml = book_service.generate_book_xml(book)
-                xml_encoded = base64.b64encode(book_xml.encode('ISO-8859-1'))
+
+                if book.segment_size and book.lines_count > book.segment_size:
+                    # Envío segmentado: un XML por segmento, generado de a uno
+                    for segment in book._create_segments():
+                        segment.write({
+                            'segment_xml': base64.b64encode(book_service.generate_book_xml(book, segment)),
+                            'state': 'generated',
+                        })
+                        segment.invalidate_recordset(['segment_xml'])
+                    xml_encoded = False
+                else:
+                    book.segment_ids.unlink()
+                    book_xml = book_service.generate_book_xml(book)
+                    xml_encoded = base64.b64encode(book_xml)
 
                 # Guardar XML y cambiar estado
                 book.write({
@@ -191,44 +238,33 @@ class CertificationBook(models.Model):
         return True
 
     def action_sign_book(self):
-        """Firma el libro digitalmente"""
+        """Firma el libro digitalmente (o cada uno de sus segmentos)"""
         for book in self:
-            if not book.book_xml:
+            if not book.book_xml and not book.segment_ids:
                 raise UserError(_('Debe generar el libro primero.'))
 
-            # Decodificar XML
-            xml_string = base64.b64decode(book.book_xml).decode('ISO-8859-1')
-
             try:
-                # Obtener certificado desde client_info
-                if not book.project_id.client_info_id:
-                    raise UserError(_('El proyecto no tiene información de cliente configurada.'))
-
-                client = book.project_id.client_info_id
-
-                # Obtener datos del certificado
-                cert_data, cert_password = client.get_certificate_data()
-
-                # Obtener company
-                company = book.project_id.company_id
-                if not company:
-                    raise UserError(_('El proyecto no tiene una compañía asociada.'))
-
-                # Firmar usando el servicio (sign_xml para firmar el LibroCompraVenta completo)
-                signature_service = self.env['l10n_cl_edi.signature.service'].sudo()
-                xml_signed = signature_service.sign_xml(
-                    xml_string,
-                    cert_data,
-                    cert_password,
-                    company,
-                    reference_uri='#SetDoc'  # Referencia al ID del EnvioLibro
-                )
+                if book.segment_ids:
+                    for segment in book.segment_ids:
+                        # Decodificar XML
+                        xml_string = base64.b64decode(segment.segment_xml).decode('ISO-8859-1')
+                        xml_signed = book._sign_book_xml(xml_string)
+                        segment.write({
+                            'segment_xml_signed': base64.b64encode(xml_signed.encode('ISO-8859-1')),
+                            'state': 'signed',
+                        })
+                        segment.invalidate_recordset(['segment_xml', 'segment_xml_signed'])
+                    book.state = 'signed'
+                else:
+                    # Decodificar XML
+                    xml_string = base64.b64decode(book.book_xml).decode('ISO-8859-1')
+                    xml_signed = book._sign_book_xml(xml_string)
 
-                # Guardar XML firmado
-                book.write({
-                    'book_xml_signed': base64.b64encode(xml_signed.encode('ISO-8859-1')),
-                    'state': 'signed',
-                })
+                    # Guardar XML firmado
+                    book.write({
+                        'book_xml_signed': base64.b64encode(xml_signed.encode('ISO-8859-1')),
+                        'state': 'signed',
+                    })
 
                 book.message_post_with_source(
                     source_ref=self.env.ref('l10n_cl_edi_certification.message_book_signed'),
@@ -243,30 +279,72 @@ class CertificationBook(models.Model):
 
         return True
 
+    def _sign_book_xml(self, xml_string):
+        """
+        Firma un XML LibroCompraVenta (el libro completo o un segmento) con el
+        certificado del cliente del proyecto.
+
+        Args:
+            xml_string (str): XML sin firmar
+
+        Returns:
+            str: XML firmado
+        """
+        self.ensure_one()
+
+        # Obtener certificado desde client_info
+        if not self.project_id.client_info_id:
+            raise UserError(_('El proyecto no tiene información de cliente configurada.'))
+
+        client = self.project_id.client_info_id
+
+        # Obtener datos del certificado
+        cert_data, cert_password = client.get_certificate_data()
+
+        # Obtener company
+        company = self.project_id.company_id
+        if not company:
+            raise UserError(_('El proyecto no tiene una compañía asociada.'))
+
+        # Firmar usando el servicio (sign_xml para firmar el LibroCompraVenta completo)
+        signature_service = self.env['l10n_cl_edi.signature.service'].sudo()
+        return signature_service.sign_xml(
+            xml_string,
+            cert_data,
+            cert_password,
+            company,
+            reference_uri='#SetDoc',  # Referencia al ID del EnvioLibro
+            client_info=client,
+        )
+
     def action_validate_xsd(self):
         """Valida el XML firmado contra el esquema XSD del SII"""
         from lxml import etree
-        import os
 
         for book in self:
             if book.state != 'signed':
                 raise UserError(_('El libro debe estar firmado antes de validar con XSD.'))
 
-            if not book.book_xml_signed:
+            if not book.book_xml_signed and not book.segment_ids:
                 raise UserError(_('No hay XML firmado para validar.'))
 
             try:
-                # Decodificar el XML firmado
-                xml_content = base64.b64decode(book.book_xml_signed)
-
-                # Parsear el XML
-                xml_doc = etree.fromstring(xml_content)
-
-                # Buscar el archivo XSD en el módulo (carpeta schemas)
-                module_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                xsd_path = os.path.join(module_path, 'schemas', 'LibroCV_v10.xsd')
+                # Esquema XSD compilado (si está disponible en la carpeta schemas)
+                xsd_schema = XsdRegistry.get('LibroCV')
+
+                # Parsear y validar el XML (o el de cada segmento, de a uno)
+                errors = []
+                for label, xml_content in book._iter_signed_xmls():
+                    xml_doc = etree.fromstring(xml_content)
+                    if xsd_schema is None:
+                        continue
+                    for error_msg in xsd_schema.validate(xml_doc):
+                        if label:
+                            error_msg = f"{label} - {error_msg}"
+                        errors.append(error_msg)
+                        _logger.warning('XSD libro %s: %s', book.display_name, error_msg)
 
-                if not os.path.exists(xsd_path):
+                if xsd_schema is None:
                     # Si no hay XSD, marcar como validado de todos modos
                     book.write({
                         'state': 'validated',
@@ -284,15 +362,7 @@ class CertificationBook(models.Model):
                         'tag': 'reload',
                     }
 
-                # Cargar el esquema XSD
-                with open(xsd_path, 'rb') as xsd_file:
-                    xsd_doc = etree.parse(xsd_file)
-                    xsd_schema = etree.XMLSchema(xsd_doc)
-
-                # Validar el XML contra el XSD
-                is_valid = xsd_schema.validate(xml_doc)
-
-                if is_valid:
+                if not errors:
                     # Marcar como validado
                     book.write({
                         'state': 'validated',
@@ -310,13 +380,6 @@ class CertificationBook(models.Model):
                         'tag': 'reload',
                     }
                 else:
-                    # Recopilar errores
-                    errors = []
-                    for error in xsd_schema.error_log:
-                        error_msg = f"Línea {error.line}: {error.message}"
-                        errors.append(error_msg)
-                        print(f"❌ {error_msg}")
-
                     error_text = '\n'.join(errors)
 
                     # Guardar errores pero NO cambiar estado
@@ -351,12 +414,33 @@ class CertificationBook(models.Model):
                 })
                 raise UserError(_(error_msg))
 
+    def _iter_signed_xmls(self):
+        """
+        Recorre el XML firmado del libro o, si se envía segmentado, el de cada
+        segmento (leídos de a uno).
+
+        Yields:
+            tuple: (nombre del segmento o False, bytes del XML firmado)
+        """
+        self.ensure_one()
+        if not self.segment_ids:
+            yield False, base64.b64decode(self.book_xml_signed)
+            return
+        for segment in self.segment_ids:
+            yield segment.display_name, base64.b64decode(segment.segment_xml_signed)
+            segment.invalidate_recordset(['segment_xml_signed'])
+
     def action_send_to_sii(self):
         """Envía el libro al SII"""
+        actions = []
         for book in self:
             if book.state not in ['signed', 'validated']:
                 raise UserError(_('El libro debe estar firmado antes de enviar al SII.'))
 
+            if book.segment_ids:
+                actions.append(book._send_segments_to_sii())
+                continue
+
             try:
                 # Llamar al servicio de integración SII
                 sii_service = self.env['l10n_cl_edi.sii.integration.service'].sudo()
@@ -387,39 +471,32 @@ class CertificationBook(models.Model):
                     subtype_xmlid='mail.mt_note'
                 )
 
-                # Recargar la vista para mostrar cambios
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'reload',
-                }
-
             except Exception as e:
                 _logger.error(f'❌ Error enviando libro al SII: {str(e)}')
                 import traceback
                 traceback.print_exc()
                 raise UserError(_('Error al enviar el libro al SII: %s') % str(e))
 
+        return self._merge_client_actions(actions)
+
     def action_check_status(self):
         """Consulta el estado del libro en el SII"""
+        actions = []
         for book in self:
             if not book.sii_track_id:
                 raise UserError(_('El libro no tiene Track ID. Debe enviarlo primero al SII.'))
 
+            if book.segment_ids:
+                actions.append(book._check_segments_status())
+                continue
+
             try:
                 # Llamar al servicio de integración SII
                 sii_service = self.env['l10n_cl_edi.sii.integration.service'].sudo()
                 status, response_xml = sii_service.check_status(book.sii_track_id, book.project_id)
 
                 # Mapear estado del servicio a estado del modelo
-                state_map = {
-                    'received': 'sent',
-                    'validating': 'sent',
-                    'accepted': 'accepted',
-                    'rejected': 'rejected',
-                    'with_repairs': 'accepted',  # Aceptado con reparos
-                }
-
-                new_state = state_map.get(status, 'sent')
+                new_state = SII_STATUS_STATE_MAP.get(status, 'sent')
 
                 # Actualizar estado del libro
                 book.write({
@@ -435,35 +512,199 @@ class CertificationBook(models.Model):
                     })
 
                 # Mensaje descriptivo
-                status_messages = {
-                    'received': 'Recibido - En proceso de validación',
-                    'validating': 'Validando documentos',
-                    'accepted': '✅ Aceptado por el SII',
-                    'rejected': '❌ Rechazado por el SII',
-                    'with_repairs': '⚠️ Aceptado con reparos',
-                }
-                status_msg = status_messages.get(status, f'Estado: {status}')
+                status_msg = SII_STATUS_MESSAGES.get(status, f'Estado: {status}')
 
                 book.with_context(status_msg=status_msg).message_post_with_source(
                     source_ref=self.env.ref('l10n_cl_edi_certification.message_book_status_updated'),
                     subtype_xmlid='mail.mt_note'
                 )
 
-                # Recargar la vista para mostrar cambios
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'reload',
-                }
-
             except Exception as e:
                 _logger.error(f'❌ Error consultando estado: {str(e)}')
                 import traceback
                 traceback.print_exc()
                 raise UserError(_('Error al consultar estado: %s') % str(e))
 
+        return self._merge_client_actions(actions)
+
+    @api.model
+    def _merge_client_actions(self, actions):
+        """
+        Une en una sola acción las que devolvió cada libro: las
+        notificaciones se muestran juntas y, si no hay ninguna, se recarga
+        la vista.
+
+        Args:
+            actions (list): Acciones de cliente de cada libro
+
+        Returns:
+            dict: Acción de cliente
+        """
+        notifications = [action for action in actions if action.get('tag') == 'display_notification']
+        if not notifications:
+            # Recargar la vista para mostrar cambios
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'reload',
+            }
+        if len(notifications) == 1:
+            return notifications[0]
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': notifications[0]['params']['title'],
+                'message': '\n\n'.join(notification['params']['message'] for notification in notifications),
+                'type': 'warning',
+                'sticky': True,
+            }
+        }
+
+    def _send_segments_to_sii(self):
+        """
+        Envía al SII, en orden, los segmentos del libro que aún no se han
+        enviado (PARCIAL primero, FINAL al final).
+
+        Si un segmento falla se detiene el envío: los ya enviados conservan su
+        Track ID y el resto se puede reenviar después con el mismo botón.
+        """
+        self.ensure_one()
+        sii_service = self.env['l10n_cl_edi.sii.integration.service'].sudo()
+
+        sent, error = self.env['l10n_cl_edi.certification.book.segment'], None
+        for segment in self.segment_ids.filtered(lambda s: s.state == 'signed'):
+            try:
+                track_id, response_xml = sii_service.send_book_segment(segment)
+            except Exception as e:
+                _logger.error(f'❌ Error enviando segmento {segment.display_name} al SII: {str(e)}')
+                error = _('%s: %s') % (segment.display_name, str(e))
+                break
+
+            sii_response = self.env['l10n_cl_edi.certification.sii.response'].create({
+                'project_id': self.project_id.id,
+                'response_type': 'send',  # Tipo de respuesta: envío
+                'track_id': track_id,
+                'response_xml': base64.b64encode(response_xml) if isinstance(response_xml, bytes) else base64.b64encode(response_xml.encode('utf-8')),
+                'response_date': fields.Datetime.now(),
+                'status': 'received',  # Estado inicial cuando se envía
+            })
+            segment.write({
+                'sii_track_id': track_id,
+                'sii_send_date': fields.Datetime.now(),
+                'sii_response_id': sii_response.id,
+                'state': 'sent',
+            })
+            sent |= segment
+
+        if error and not sent:
+            raise UserError(_('Error al enviar el libro al SII: %s') % error)
+
+        if sent:
+            track_ids = ', '.join(self.segment_ids.filtered('sii_track_id').mapped('sii_track_id'))
+            vals = {
+                'sii_track_id': track_ids,
+                'sii_send_date': fields.Datetime.now(),
+                'sii_response_id': sent[-1].sii_response_id.id,
+            }
+            if all(segment.state != 'signed' for segment in self.segment_ids):
+                vals['state'] = 'sent'
+            self.write(vals)
+
+            self.with_context(track_id=track_ids).message_post_with_source(
+                source_ref=self.env.ref('l10n_cl_edi_certification.message_book_sent_to_sii'),
+                subtype_xmlid='mail.mt_note'
+            )
+
+        if error:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Envío Parcial'),
+                    'message': _('Se enviaron %d segmentos. Error en el siguiente:\n%s') % (len(sent), error),
+                    'type': 'warning',
+                    'sticky': True,
+                }
+            }
+
+        # Recargar la vista para mostrar cambios
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'reload',
+        }
+
+    def _check_segments_status(self):
+        """
+        Consulta el estado en el SII de cada segmento enviado. El libro queda
+        rechazado si algún segmento lo está y aceptado cuando lo están todos.
+        """
+        self.ensure_one()
+        sii_service = self.env['l10n_cl_edi.sii.integration.service'].sudo()
+
+        status_lines = []
+        for segment in self.segment_ids.filtered('sii_track_id'):
+            try:
+                status, response_xml = sii_service.check_status(segment.sii_track_id, self.project_id)
+            except Exception as e:
+                _logger.error(f'❌ Error consultando estado del segmento {segment.display_name}: {str(e)}')
+                raise UserError(_('Error al consultar estado del segmento %s: %s') % (segment.display_name, str(e)))
+
+            segment.state = SII_STATUS_STATE_MAP.get(status, 'sent')
+            if segment.sii_response_id:
+                segment.sii_response_id.write({
+                    'status': status,
+                    'response_xml': base64.b64encode(response_xml) if isinstance(response_xml, bytes) else base64.b64encode(response_xml.encode('utf-8')),
+                    'response_date': fields.Datetime.now(),
+                })
+            status_lines.append(_('Segmento %s: %s') % (
+                segment.segment_number, SII_STATUS_MESSAGES.get(status, f'Estado: {status}')))
+
+        segment_states = set(self.segment_ids.mapped('state'))
+        if 'rejected' in segment_states:
+            self.state = 'rejected'
+        elif segment_states == {'accepted'}:
+            self.state = 'accepted'
+
+        self.with_context(status_msg='; '.join(status_lines)).message_post_with_source(
+            source_ref=self.env.ref('l10n_cl_edi_certification.message_book_status_updated'),
+            subtype_xmlid='mail.mt_note'
+        )
+
+        # Recargar la vista para mostrar cambios
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'reload',
+        }
+
+    def _create_segments(self):
+        """
+        Divide las líneas del libro, en su orden, en segmentos de
+        segment_size líneas: todos PARCIAL salvo el último, FINAL.
+
+        Returns:
+            l10n_cl_edi.certification.book.segment: Segmentos creados
+        """
+        self.ensure_one()
+        self.segment_ids.unlink()
+
+        line_ids = self.line_ids.ids
+        chunks = [line_ids[start:start + self.segment_size] for start in range(0, len(line_ids), self.segment_size)]
+        segments = self.env['l10n_cl_edi.certification.book.segment'].create([{
+            'book_id': self.id,
+            'segment_number': number,
+            'tipo_envio': 'FINAL' if number == len(chunks) else 'PARCIAL',
+        } for number in range(1, len(chunks) + 1)])
+
+        Line = self.env['l10n_cl_edi.certification.book.line']
+        for segment, chunk in zip(segments, chunks):
+            Line.browse(chunk).write({'segment_id': segment.id})
+        return segments
+
     def action_back_to_draft(self):
         """Regresa el libro a borrador y limpia los campos de envío"""
         for book in self:
+            book.segment_ids.unlink()
+
             # Limpiar XMLs, track_id, fecha de envío, respuesta SII y validación XSD
             book.write({
                 'state': 'draft',
@@ -28,6 +28,15 @@ class CertificationBookLine(models.Model):
         default=10
     )
 
+    segment_id = fields.Many2one(
+        'l10n_cl_edi.certification.book.segment',
+        string='Segmento',
+        ondelete='set null',
+        index=True,
+        copy=False,
+        help='Segmento (envío PARCIAL/FINAL) en que se informa la línea'
+    )
+
     # OPCIÓN A: Referencia a DTE generado (para LIBRO DE VENTAS)
     generated_document_id = fields.Many2one(
         'l10n_cl_edi.certification.generated.document',
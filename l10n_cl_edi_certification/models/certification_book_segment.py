@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, _
+
+import logging
+_logger = logging.getLogger(__name__)
+
+class CertificationBookSegment(models.Model):
+    """
+    Segmento de un Libro de Compra/Venta enviado por partes al SII.
+
+    Un período con muchas líneas se divide en segmentos con TipoEnvio PARCIAL
+    y un último segmento FINAL (que además lleva el ResumenPeriodo). Cada
+    segmento se genera, firma y envía por separado.
+    """
+    _name = 'l10n_cl_edi.certification.book.segment'
+    _description = 'Segmento de Libro de Compra/Venta'
+    _order = 'book_id, segment_number'
+
+    # Relaciones
+    book_id = fields.Many2one(
+        'l10n_cl_edi.certification.book',
+        string='Libro',
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    project_id = fields.Many2one(
+        related='book_id.project_id',
+        store=True,
+        index=True
+    )
+
+    segment_number = fields.Integer(
+        string='Nro. Segmento',
+        required=True,
+        help='NroSegmento informado en la Carátula'
+    )
+    tipo_envio = fields.Selection([
+        ('PARCIAL', 'Parcial'),
+        ('FINAL', 'Final'),
+    ], string='Tipo de Envío', required=True, default='PARCIAL')
+
+    line_ids = fields.One2many(
+        'l10n_cl_edi.certification.book.line',
+        'segment_id',
+        string='Líneas del Segmento'
+    )
+    lines_count = fields.Integer(
+        string='Cantidad Líneas',
+        compute='_compute_lines_count',
+        store=True
+    )
+
+    # Archivos XML
+    segment_xml = fields.Binary(
+        string='XML Segmento',
+        attachment=True
+    )
+    segment_xml_filename = fields.Char(
+        string='Nombre Archivo',
+        compute='_compute_filenames',
+        store=True
+    )
+    segment_xml_signed = fields.Binary(
+        string='XML Segmento Firmado',
+        attachment=True
+    )
+    segment_xml_signed_filename = fields.Char(
+        string='Nombre Archivo Firmado',
+        compute='_compute_filenames',
+        store=True
+    )
+
+    # Estado
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('generated', 'Generado'),
+        ('signed', 'Firmado'),
+        ('sent', 'Enviado'),
+        ('accepted', 'Aceptado'),
+        ('rejected', 'Rechazado'),
+    ], string='Estado', default='draft', required=True)
+
+    # Integración SII
+    sii_track_id = fields.Char(
+        string='Track ID',
+        help='ID de seguimiento del SII'
+    )
+    sii_send_date = fields.Datetime(
+        string='Fecha Envío'
+    )
+    sii_response_id = fields.Many2one(
+        'l10n_cl_edi.certification.sii.response',
+        string='Respuesta SII'
+    )
+
+    @api.depends('line_ids')
+    def _compute_lines_count(self):
+        for segment in self:
+            segment.lines_count = len(segment.line_ids)
+
+    @api.depends('book_id.book_xml_filename', 'segment_number')
+    def _compute_filenames(self):
+        for segment in self:
+            base_name = (segment.book_id.book_xml_filename or 'Libro.xml').removesuffix('.xml')
+            base_name = f"{base_name}_S{segment.segment_number}"
+
+            segment.segment_xml_filename = f"{base_name}.xml"
+            segment.segment_xml_signed_filename = f"{base_name}_signed.xml"
+
+    @api.depends('book_id.name', 'segment_number', 'tipo_envio')
+    def _compute_display_name(self):
+        for segment in self:
+            segment.display_name = _('%s - Segmento %s (%s)') % (
+                segment.book_id.name, segment.segment_number, segment.tipo_envio)
@@ -3,6 +3,8 @@ from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError
 import base64
 
+from ..services.certificate_cache import CertificateCache
+
 
 class CertificationClient(models.Model):
     """
@@ -216,6 +218,16 @@ class CertificationClient(models.Model):
 
         return super().create(vals_list)
 
+    def write(self, vals):
+        """Invalida el certificado en caché si cambia el archivo o la contraseña"""
+        res = super().write(vals)
+        if 'certificate_file' in vals or 'certificate_password' in vals:
+            CertificateCache.invalidate(self.ids)
+        return res
+
+    def unlink(self):
+        CertificateCache.invalidate(self.ids)
+        return super().unlink()
 
     def action_test_certificate(self):
         """Prueba que el certificado y contraseña sean válidos"""
@@ -295,6 +307,18 @@ class CertificationClient(models.Model):
         cert_data = base64.b64decode(self.certificate_file)
         return (cert_data, self.certificate_password)
 
+    def get_signing_certificate(self):
+        """
+        Obtiene el certificado del cliente ya decodificado, listo para firmar.
+        El PKCS#12 se decodifica una sola vez y se reutiliza entre firmas
+        (ver CertificateCache).
+
+        Returns:
+            ClientCertificate
+        """
+        cert_data, password = self.get_certificate_data()
+        return CertificateCache.get(self.id, cert_data, password)
+
     @api.constrains('rut')
     def _check_rut_format(self):
         """Valida el formato básico del RUT"""
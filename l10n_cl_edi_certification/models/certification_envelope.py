@@ -41,6 +41,14 @@ class CertificationEnvelope(models.Model):
         help='Documentos DTE incluidos en este sobre'
     )
 
+    simulation_id = fields.Many2one(
+        'l10n_cl_edi.certification.simulation',
+        string='Simulación',
+        ondelete='set null',
+        index=True,
+        help='Simulación que generó este sobre'
+    )
+
     documents_count = fields.Integer(
         string='Cantidad Documentos',
         compute='_compute_documents_count',
@@ -122,6 +130,32 @@ class CertificationEnvelope(models.Model):
             envelope.envelope_xml_filename = f"EnvioDTE_{base_name}.xml"
             envelope.envelope_xml_signed_filename = f"EnvioDTE_{base_name}_signed.xml"
 
+    @api.model
+    def create_sharded(self, project, documents, name, vals=None):
+        """
+        Crea los sobres necesarios para enviar los documentos, respetando los
+        límites de tamaño y cantidad del proyecto (ver EnvelopePlanner).
+
+        Args:
+            project: l10n_cl_edi.certification.project
+            documents: l10n_cl_edi.certification.generated.document
+            name (str): Nombre base; con más de un sobre se agrega "(n/total)"
+            vals (dict): Valores adicionales para cada sobre (opcional)
+
+        Returns:
+            l10n_cl_edi.certification.envelope: Sobres creados, en orden de envío
+        """
+        shards = self.env['l10n_cl_edi.envelope.service'].plan_envelopes(project, documents)
+        vals_list = []
+        for index, shard in enumerate(shards, 1):
+            vals_list.append(dict(
+                vals or {},
+                project_id=project.id,
+                name=name if len(shards) == 1 else f'{name} ({index}/{len(shards)})',
+                generated_document_ids=[(6, 0, shard.ids)],
+            ))
+        return self.create(vals_list)
+
     # Métodos de Acción
     def action_create_envelope(self):
         """Crea el XML del sobre con los documentos incluidos"""
@@ -143,7 +177,7 @@ class CertificationEnvelope(models.Model):
             envelope_xml = envelope_service.create_envelope(envelope)
 
             envelope.write({
-                'envelope_xml': base64.b64encode(envelope_xml.encode('ISO-8859-1')),
+                'envelope_xml': base64.b64encode(envelope_xml),
                 'state': 'created',
             })
 
@@ -155,16 +189,17 @@ class CertificationEnvelope(models.Model):
         return True
 
     def action_sign_envelope(self):
-        """Firma el sobre digitalmente"""
+        """Firma los sobres digitalmente (en paralelo si son varios)"""
         for envelope in self:
             if not envelope.envelope_xml:
                 raise UserError(_('Debe crear el sobre primero.'))
 
-            signature_service = self.env['l10n_cl_edi.signature.service']
-            signed_xml = signature_service.sign_envelope(envelope)
+        signature_service = self.env['l10n_cl_edi.signature.service']
+        signed_xmls = signature_service.sign_envelopes(self)
 
+        for envelope in self:
             envelope.write({
-                'envelope_xml_signed': base64.b64encode(signed_xml.encode('ISO-8859-1')),
+                'envelope_xml_signed': base64.b64encode(signed_xmls[envelope].encode('ISO-8859-1')),
                 'state': 'signed',
             })
 
@@ -197,7 +232,7 @@ class CertificationEnvelope(models.Model):
         return True
 
     def action_send_to_sii(self):
-        """Envía el sobre al SII"""
+        """Envía los sobres al SII (en paralelo si son varios)"""
         for envelope in self:
             if envelope.state != 'signed':
                 raise UserError(_('El sobre debe estar firmado antes de enviar al SII.'))
@@ -205,10 +240,13 @@ class CertificationEnvelope(models.Model):
             # Validar primero
             envelope.action_validate_envelope()
 
-            # Enviar al SII
-            sii_service = self.env['l10n_cl_edi.sii.integration.service']
-            track_id, response = sii_service.send_envelope(envelope)
+        # Enviar al SII
+        sii_service = self.env['l10n_cl_edi.sii.integration.service']
+        results, errors = sii_service.send_envelopes(self)
+        if errors and not results:
+            raise UserError('\n'.join(errors.values()))
 
+        for envelope, (track_id, response) in results.items():
             # Crear registro de respuesta
             response_vals = {
                 'project_id': envelope.project_id.id,
@@ -239,6 +277,26 @@ class CertificationEnvelope(models.Model):
                 subtype_xmlid='mail.mt_note'
             )
 
+        # Los sobres ya enviados se conservan: los que fallaron quedan firmados
+        # y se pueden reenviar después con el mismo botón
+        for envelope, error in errors.items():
+            envelope.message_post(body=_('Error al enviar al SII: %s') % error)
+
+        if errors:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Envío Parcial'),
+                    'message': _('Se enviaron %d sobres. Error en:\n%s') % (
+                        len(results),
+                        '\n'.join('%s: %s' % (envelope.name, error) for envelope, error in errors.items()),
+                    ),
+                    'type': 'warning',
+                    'sticky': True,
+                }
+            }
+
         return True
 
     def action_check_sii_status(self):
@@ -321,6 +379,20 @@ class CertificationEnvelope(models.Model):
             'view_mode': 'list,form',
         }
 
+    def action_export_merged_pdf(self):
+        """Exporta en un único PDF los PDF impresos de todos los documentos del sobre"""
+        self.ensure_one()
+        attachment = self.env['l10n_cl_edi.export.service'].export_merged_pdf(
+            self.generated_document_ids,
+            self,
+            f'{self.name}_documentos_impresos.pdf',
+        )
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
     def action_download_envelope_xml(self):
         """Descarga el XML firmado del sobre"""
         self.ensure_one()
@@ -2,6 +2,8 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 
+from ..services.caf_cache import CafCache, CafData
+
 
 class CertificationFolioAssignment(models.Model):
     """
@@ -143,6 +145,17 @@ class CertificationFolioAssignment(models.Model):
             else:
                 assignment.usage_percentage = 0.0
 
+    def write(self, vals):
+        """Invalida el CAF en caché si cambia el archivo o el CAF del sistema"""
+        res = super().write(vals)
+        if 'caf_file' in vals or 'caf_id' in vals:
+            CafCache.invalidate(self.ids)
+        return res
+
+    def unlink(self):
+        CafCache.invalidate(self.ids)
+        return super().unlink()
+
     @api.onchange('caf_file')
     def _onchange_caf_file(self):
         """
@@ -157,13 +170,6 @@ class CertificationFolioAssignment(models.Model):
                 # Decodificar el archivo CAF (similar a _decode_caf de Odoo)
                 caf_data = base64.b64decode(self.caf_file).decode('ISO-8859-1')
 
-                # Debug: Verificar contenido
-                print(f'\n{"="*80}')
-                print(f'DEBUG: Procesando archivo CAF')
-                print(f'Tamaño caf_data: {len(caf_data)} caracteres')
-                print(f'Primeros 200 caracteres: {caf_data[:200]}')
-                print(f'{"="*80}\n')
-
                 # Validar que caf_data no esté vacío
                 if not caf_data or not caf_data.strip():
                     raise ValueError('El archivo CAF está vacío')
@@ -337,6 +343,42 @@ class CertificationFolioAssignment(models.Model):
         else:
             raise UserError(_('No hay CAF configurado para esta asignación de folios.'))
 
+    def _get_caf_checksum(self):
+        """
+        Identifica el contenido actual del CAF sin leerlo: checksum del adjunto
+        de caf_file o, para el CAF del sistema, su id y fecha de modificación.
+        El adjunto se busca directamente (no se lee caf_file, que cargaría el
+        archivo completo).
+        """
+        self.ensure_one()
+        if self.id:
+            attachment = self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', self._name),
+                ('res_field', '=', 'caf_file'),
+                ('res_id', '=', self.id),
+            ], limit=1)
+            if attachment:
+                return attachment.checksum
+        if self.caf_id:
+            return 'caf_id:%s:%s' % (self.caf_id.id, self.caf_id.write_date)
+        return False
+
+    def get_caf_data(self):
+        """
+        Obtiene el CAF ya parseado (DA, rango, RSAPK, FRMA, RSASK).
+        El archivo se decodifica y parsea una sola vez por asignación y
+        versión del CAF (ver CafCache).
+
+        Returns:
+            CafData
+        """
+        self.ensure_one()
+        checksum = self._get_caf_checksum()
+        if not checksum:
+            # Sin adjunto identificable (ej: registro aún no guardado): no cachear
+            return CafData(self.get_caf_content())
+        return CafCache.get(self.id, checksum, self.get_caf_content)
+
     def get_next_folio(self):
         """Obtiene y reserva el siguiente folio disponible"""
         self.ensure_one()
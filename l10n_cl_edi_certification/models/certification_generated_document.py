@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from collections import defaultdict
 import base64
 import logging
+
+from ..services.diagnostics import diagnose
+
 _logger = logging.getLogger(__name__)
 
 class CertificationGeneratedDocument(models.Model):
@@ -268,141 +272,77 @@ class CertificationGeneratedDocument(models.Model):
     # Métodos de Acción
     def action_validate(self):
         """Valida el documento contra esquemas XSD y reglas de negocio"""
-        for doc in self:
-            if not doc.xml_dte_signed:
-                raise UserError(_('Debe firmar el documento antes de validar.'))
+        if any(not doc.xml_dte_signed for doc in self):
+            raise UserError(_('Debe firmar el documento antes de validar.'))
 
-            validator = self.env['l10n_cl_edi.validation.service']
-            is_valid, messages = validator.validate_document(doc)
-
-            doc.write({
-                'validation_messages': '\n'.join(messages) if messages else _('Validación exitosa'),
-                'validation_date': fields.Datetime.now(),
-            })
+        results = self.env['l10n_cl_edi.validation.service'].validate_many(self)
 
+        # Escribir en bloque: documentos con el mismo resultado comparten un write
+        validation_date = fields.Datetime.now()
+        groups = defaultdict(list)
+        for doc in self:
+            is_valid, messages = results[doc]
+            groups[(is_valid, '\n'.join(messages) if messages else _('Validación exitosa'))].append(doc.id)
+        for (is_valid, validation_messages), doc_ids in groups.items():
+            vals = {
+                'validation_messages': validation_messages,
+                'validation_date': validation_date,
+            }
             if is_valid:
-                doc.state = 'validated'
-                doc.message_post_with_source(
-                    source_ref=self.env.ref('l10n_cl_edi_certification.message_document_validated'),
-                    subtype_xmlid='mail.mt_note'
-                )
-            else:
-                raise UserError(_('El documento tiene errores de validación:\n%s') % doc.validation_messages)
-
-        return True
+                vals['state'] = 'validated'
+            self.browse(doc_ids).write(vals)
+
+        invalid = self.filtered(lambda doc: not results[doc][0])
+        if invalid:
+            if len(invalid) == 1:
+                raise UserError(_('El documento tiene errores de validación:\n%s') % invalid.validation_messages)
+            raise UserError(_('%s documentos tienen errores de validación:\n\n%s') % (
+                len(invalid),
+                '\n\n'.join(f'{doc.display_name}:\n{doc.validation_messages}' for doc in invalid),
+            ))
 
-    def action_sign(self):
-        """Firma el documento digitalmente usando el certificado del cliente"""
         for doc in self:
-            if not doc.xml_dte_file:
-                raise UserError(_('No hay XML para firmar.'))
-
-            # Obtener certificado digital del cliente (del proyecto)
-            client_info = doc.project_id.client_info_id
-            if not client_info:
-                raise UserError(_('El proyecto no tiene información del cliente configurada.'))
-
-            # Obtener datos del certificado (archivo + contraseña)
-            try:
-                cert_data, cert_password = client_info.get_certificate_data()
-            except Exception as e:
-                raise UserError(_('Error al obtener certificado del cliente:\n%s') % str(e))
-
-            # Decodificar el XML (ISO-8859-1 encoding requerido por SII)
-            import html
-            xml_content = base64.b64decode(doc.xml_dte_file).decode('ISO-8859-1')
-
-            # Des-escapar entidades HTML si están presentes
-            if '&lt;' in xml_content or '&#34;' in xml_content:
-                xml_content = html.unescape(xml_content)
-
-            print('\n' + '=' * 80)
-            print('FIRMANDO DOCUMENTO')
-            print(f'Documento ID: {doc.id}, Folio: {doc.folio}')
-            print(f'Longitud XML original: {len(xml_content)} caracteres')
-
-            # Verificar si el XML original contiene Detalle
-            if '<Detalle>' in xml_content:
-                detalle_count = xml_content.count('<Detalle>')
-                print(f'✓ XML ORIGINAL contiene {detalle_count} elementos <Detalle>')
-            else:
-                print('❌ XML ORIGINAL NO contiene elementos <Detalle>')
-
-            # Preparar ID del documento para la firma
-            doc_id = f"DTE-{doc.document_type_code}-{doc.folio}"
-
-            # Firmar el XML usando el servicio de firma
-            signature_service = self.env['l10n_cl_edi.signature.service']
-            signed_xml = signature_service.sign_xml(
-                xml_content,
-                cert_data,
-                cert_password,
-                doc.project_id.company_id,  # Company ID (cuarto parámetro)
-                doc_id  # Reference URI (quinto parámetro opcional)
-            )
-
-            print(f'Longitud XML firmado: {len(signed_xml)} caracteres')
-
-            # Verificar si el XML firmado contiene Detalle
-            if '<Detalle>' in signed_xml:
-                detalle_count = signed_xml.count('<Detalle>')
-                print(f'✓ XML FIRMADO contiene {detalle_count} elementos <Detalle>')
-            else:
-                print('❌ XML FIRMADO NO contiene elementos <Detalle>')
-                print('\nPrimeros 1500 caracteres del XML firmado:')
-                print(signed_xml[:1500])
-
-            print('=' * 80 + '\n')
-
-            # Guardar XML firmado (ISO-8859-1 encoding requerido por SII)
-            doc.write({
-                'xml_dte_signed': base64.b64encode(signed_xml.encode('ISO-8859-1', 'replace')),
-                'state': 'signed',
-            })
-
-            cert_subject = client_info.social_reason or 'Cliente'
-            doc.with_context(cert_subject=cert_subject).message_post_with_source(
-                source_ref=self.env.ref('l10n_cl_edi_certification.message_document_signed'),
+            doc.message_post_with_source(
+                source_ref=self.env.ref('l10n_cl_edi_certification.message_document_validated'),
                 subtype_xmlid='mail.mt_note'
             )
+        return True
 
+    def action_sign(self):
+        """Firma los documentos digitalmente usando el certificado del cliente"""
+        self.env['l10n_cl_edi.signature.service'].sign_many(self)
         return True
 
     def action_generate_ted(self):
         """Genera el TED (Timbre Electrónico) y su código de barras PDF417"""
+        pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
         for doc in self:
-            print(f'\n[TED] Procesando documento: {doc.complete_name} (ID: {doc.id})')
-            print(f'  - Proyecto: {doc.project_id.name if doc.project_id else "N/A"}')
-            print(f'  - Estado: {doc.state}')
-            print(f'  - Tiene XML firmado: {bool(doc.xml_dte_signed)}')
-            print(f'  - Ya tiene TED: {bool(doc.ted_xml)}')
-            print(f'  - Ya tiene código de barras: {bool(doc.barcode_image)}')
-
             if not doc.xml_dte_signed:
-                print(f'  ✗ ERROR: No tiene XML firmado')
                 raise UserError(_('Debe firmar el documento antes de generar el TED.'))
 
-            if doc.ted_xml and doc.barcode_image:
-                print(f'  ℹ️  Ya tiene TED y código de barras - REGENERANDO...')
-
-            print(f'  → Generando TED XML...')
-            # Generar TED XML
-            pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
-            ted_xml = pdf_service.generate_ted_xml(doc)
-            print(f'  → TED XML generado ({len(ted_xml)} caracteres)')
-
-            print(f'  → Generando código de barras PDF417...')
-            # Generar código de barras PDF417
-            barcode_data = pdf_service.generate_ted_barcode(ted_xml)
-            print(f'  → Código de barras generado ({len(barcode_data)} bytes)')
-
-            # Guardar TED y código de barras
-            print(f'  → Guardando TED y código de barras...')
-            doc.write({
-                'ted_xml': ted_xml,
-                'barcode_image': base64.b64encode(barcode_data),
-            })
-            print(f'  ✓ TED guardado exitosamente')
+            with diagnose('generate_ted', document=doc.id, regenerate=bool(doc.ted_xml)) as diag:
+                # Mismos datos y mismo CAF: el TED y el código de barras guardados siguen vigentes
+                with diag.stage('check'):
+                    reused = pdf_service.is_ted_current(doc)
+                diag.set(reused=reused)
+                if reused:
+                    doc.message_post(body=_('TED sin cambios: se mantiene el timbre existente.'))
+                    continue
+
+                # Generar TED XML
+                with diag.stage('ted'):
+                    ted_xml = pdf_service.generate_ted_xml(doc)
+
+                # Generar código de barras PDF417
+                with diag.stage('barcode'):
+                    barcode_data = pdf_service.generate_ted_barcode(ted_xml)
+
+                # Guardar TED y código de barras
+                with diag.stage('write'):
+                    doc.write({
+                        'ted_xml': ted_xml,
+                        'barcode_image': base64.b64encode(barcode_data),
+                    })
 
             doc.message_post(body=_('TED generado exitosamente.'))
 
@@ -420,32 +360,23 @@ class CertificationGeneratedDocument(models.Model):
         """Genera el PDF impreso del documento con timbre TED"""
         self.ensure_one()
 
-        print(f'\n[PDF] Procesando documento: {self.complete_name} (ID: {self.id})')
-        print(f'  - Proyecto: {self.project_id.name if self.project_id else "N/A"}')
-        print(f'  - Estado: {self.state}')
-        print(f'  - Tiene TED: {bool(self.ted_xml)}')
-        print(f'  - Tiene barcode: {bool(self.barcode_image)}')
-        print(f'  - Ya tiene PDF: {bool(self.pdf_file)}')
-
         if not self.ted_xml or not self.barcode_image:
-            print(f'  ✗ ERROR: Falta TED o código de barras')
             raise UserError(_(
                 'Debe generar el TED primero.\n'
                 'Use el botón "Generar TED" antes de generar el PDF.'
             ))
 
-        # Generar PDF
-        print(f'  → Generando PDF impreso...')
-        pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
-        pdf_data = pdf_service.generate_printed_pdf(self)
-        print(f'  → PDF generado ({len(pdf_data)} bytes)')
-
-        # Guardar PDF
-        print(f'  → Guardando PDF...')
-        self.write({
-            'pdf_file': base64.b64encode(pdf_data),
-        })
-        print(f'  ✓ PDF guardado exitosamente')
+        with diagnose('generate_pdf', document=self.id) as diag:
+            # Generar PDF
+            with diag.stage('render'):
+                pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
+                pdf_data = pdf_service.generate_printed_pdf(self)
+
+            # Guardar PDF
+            with diag.stage('write'):
+                self.write({
+                    'pdf_file': base64.b64encode(pdf_data),
+                })
 
         self.message_post(body=_('PDF impreso generado exitosamente.'))
 
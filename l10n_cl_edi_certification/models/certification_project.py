@@ -2,7 +2,11 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 from datetime import datetime, timedelta
+import base64
 import logging
+
+from ..services.diagnostics import diagnose
+
 _logger = logging.getLogger(__name__)
 
 class CertificationProject(models.Model):
@@ -16,6 +20,9 @@ class CertificationProject(models.Model):
     _order = 'create_date desc, id desc'
     _rec_name = 'complete_name'
 
+    # Documentos por bloque en la generación masiva de PDFs
+    PDF_CHUNK_SIZE = 50
+
     # Información Básica
 
     sequence = fields.Char(
@@ -91,6 +98,18 @@ class CertificationProject(models.Model):
         help='Descripción del proyecto y objetivos'
     )
 
+    # Límites de los sobres de envío (ver EnvelopePlanner)
+    envelope_max_documents = fields.Integer(
+        string='Máx. Documentos por Sobre',
+        default=500,
+        help='Cantidad máxima de documentos por sobre EnvioDTE. 0 = sin límite.'
+    )
+    envelope_max_size_kb = fields.Integer(
+        string='Máx. Tamaño por Sobre (KB)',
+        default=4096,
+        help='Tamaño máximo de cada sobre EnvioDTE firmado, en KB. 0 = sin límite.'
+    )
+
     # Relaciones One2many
     client_info_id = fields.Many2one(
         'l10n_cl_edi.certification.client',
@@ -493,19 +512,33 @@ class CertificationProject(models.Model):
                 }
             }
 
-        # Generar TED para cada documento
-        success_count = 0
-        error_count = 0
-        errors = []
-
-        for doc in documents:
-            try:
-                doc.action_generate_ted()
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                error_msg = str(e)
-                errors.append(f'{doc.complete_name}: {error_msg}')
+        # Generar TED y códigos de barras en lote (ver PDFGeneratorService.generate_ted_many)
+        pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
+        with diagnose('bulk_generate_ted', project=self.id, documents=len(documents)) as diag:
+            with diag.stage('generate'):
+                results, failures = pdf_service.generate_ted_many(documents)
+
+            # Guardar en una sola pasada
+            with diag.stage('write'):
+                for doc, (ted_xml, barcode_data) in results.items():
+                    doc.write({
+                        'ted_xml': ted_xml,
+                        'barcode_image': base64.b64encode(barcode_data),
+                    })
+                documents.flush_recordset(['ted_xml', 'barcode_image'])
+
+        success_count = len(results)
+        error_count = len(failures)
+        errors = [f'{doc.complete_name}: {error_msg}' for doc, error_msg in failures.items()]
+
+        if results:
+            self.with_context(
+                documents_names=[doc.complete_name for doc in results],
+                errors=errors,
+            ).message_post_with_source(
+                source_ref=self.env.ref('l10n_cl_edi_certification.message_project_ted_generated'),
+                subtype_xmlid='mail.mt_note'
+            )
 
         # Mensaje de resultado
         message = _(
@@ -523,6 +556,33 @@ class CertificationProject(models.Model):
             }
         }
 
+    def action_export_merged_pdf(self):
+        """Exporta en un único PDF los PDF impresos de todos los documentos del proyecto"""
+        self.ensure_one()
+        attachment = self.env['l10n_cl_edi.export.service'].export_merged_pdf(
+            self.generated_document_ids,
+            self,
+            f'{self.name}_documentos_impresos.pdf',
+        )
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
+    def action_export_xml_zip(self):
+        """Exporta en un ZIP todos los XML firmados del proyecto (DTEs, sobres, libros e intercambio)"""
+        self.ensure_one()
+        attachment = self.env['l10n_cl_edi.export.service'].export_xml_zip(
+            self,
+            f'{self.name}_xml.zip',
+        )
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
     def action_bulk_generate_pdf(self):
         """
         Genera PDFs impresos para todos los documentos con TED que no tienen PDF.
@@ -548,19 +608,39 @@ class CertificationProject(models.Model):
                 }
             }
 
-        # Generar PDF para cada documento
-        success_count = 0
-        error_count = 0
+        # Generar PDFs por bloques: cada bloque se renderiza en lote
+        # (ver PDFGeneratorService.generate_printed_pdf_many) y se guarda antes
+        # de pasar al siguiente, para no acumular todos los PDF en memoria
+        pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
+        generated = []
         errors = []
 
-        for doc in documents:
-            try:
-                doc.action_generate_pdf()
-                success_count += 1
-            except Exception as e:
-                error_count += 1
-                error_msg = str(e)
-                errors.append(f'{doc.complete_name}: {error_msg}')
+        with diagnose('bulk_generate_pdf', project=self.id, documents=len(documents)) as diag:
+            for start in range(0, len(documents), self.PDF_CHUNK_SIZE):
+                chunk = documents[start:start + self.PDF_CHUNK_SIZE]
+                with diag.stage('render'):
+                    results, failures = pdf_service.generate_printed_pdf_many(chunk)
+
+                with diag.stage('write'):
+                    for doc, pdf_data in results.items():
+                        doc.write({'pdf_file': base64.b64encode(pdf_data)})
+                    chunk.flush_recordset(['pdf_file'])
+                    chunk.invalidate_recordset(['pdf_file', 'barcode_image'])
+
+                generated.extend(doc.complete_name for doc in results)
+                errors.extend(f'{doc.complete_name}: {error_msg}' for doc, error_msg in failures.items())
+
+        success_count = len(generated)
+        error_count = len(errors)
+
+        if generated:
+            self.with_context(
+                documents_names=generated,
+                errors=errors,
+            ).message_post_with_source(
+                source_ref=self.env.ref('l10n_cl_edi_certification.message_project_pdf_generated'),
+                subtype_xmlid='mail.mt_note'
+            )
 
         # Mensaje de resultado
         message = _(
@@ -141,6 +141,13 @@ class CertificationSimulation(models.Model):
         string='Sobre Generado',
         readonly=True
     )
+    # Sobres del envío (más de uno si se superan los límites del proyecto)
+    envelope_ids = fields.One2many(
+        'l10n_cl_edi.certification.envelope',
+        'simulation_id',
+        string='Sobres Generados',
+        readonly=True
+    )
 
     # Estado
     state = fields.Selection([
@@ -427,7 +434,10 @@ class CertificationSimulation(models.Model):
                          (self.invoices_count, self.credit_notes_count, self.debit_notes_count))
 
     def action_create_envelope(self):
-        """Crea el sobre (EnvioDTE) con todos los documentos"""
+        """
+        Crea los sobres (EnvioDTE) con todos los documentos. Si superan los
+        límites de tamaño o cantidad del proyecto, se reparten en varios sobres.
+        """
         self.ensure_one()
 
         if self.state != 'generated':
@@ -438,64 +448,61 @@ class CertificationSimulation(models.Model):
         if unsigned_docs:
             raise UserError(_('Todos los documentos deben estar firmados antes de crear el sobre.'))
 
-        # Crear sobre
-        Envelope = self.env['l10n_cl_edi.certification.envelope']
-        envelope = Envelope.create({
-            'project_id': self.project_id.id,
-            'name': f'Simulación - {self.name}',
-            'generated_document_ids': [(6, 0, self.document_ids.ids)],
-        })
-
-        # Vincular documentos al sobre (actualizar envelope_id en los documentos)
-        self.document_ids.write({'envelope_id': envelope.id})
+        # Crear sobres
+        envelopes = self.env['l10n_cl_edi.certification.envelope'].create_sharded(
+            self.project_id,
+            self.document_ids,
+            f'Simulación - {self.name}',
+            {'simulation_id': self.id},
+        )
 
-        self.envelope_id = envelope
-        self.message_post(body=_('Sobre creado con %d documentos') % self.documents_count)
+        # Vincular documentos a su sobre (actualizar envelope_id en los documentos)
+        for envelope in envelopes:
+            envelope.generated_document_ids.write({'envelope_id': envelope.id})
 
-        # Generar XML del sobre
-        envelope_service = self.env['l10n_cl_edi.envelope.service']
-        envelope_xml = envelope_service.create_envelope(envelope)
+        self.envelope_id = envelopes[:1]
+        self.message_post(body=_('%d sobre(s) creado(s) con %d documentos') % (len(envelopes), self.documents_count))
 
-        # Guardar el XML generado en el sobre
-        envelope.write({
-            'envelope_xml': base64.b64encode(envelope_xml.encode('ISO-8859-1')),
-            'state': 'created',
-        })
-
-        # Firmar sobre
-        envelope.action_sign_envelope()
+        # Generar XML de los sobres y firmarlos
+        envelopes.action_create_envelope()
+        envelopes.action_sign_envelope()
 
         # Validar XSD
         validation_service = self.env['l10n_cl_edi.xml.validation.service']
 
-        # Obtener el XML firmado del sobre
-        if envelope.envelope_xml_signed:
-            envelope_xml_str = base64.b64decode(envelope.envelope_xml_signed).decode('ISO-8859-1')
-        else:
-            raise UserError(_('El sobre debe estar firmado antes de validar.'))
+        for envelope in envelopes:
+            # Obtener el XML firmado del sobre
+            if envelope.envelope_xml_signed:
+                envelope_xml_str = base64.b64decode(envelope.envelope_xml_signed).decode('ISO-8859-1')
+            else:
+                raise UserError(_('El sobre debe estar firmado antes de validar.'))
 
-        is_valid, messages = validation_service.validate_envio_dte_xml(envelope_xml_str)
+            is_valid, messages = validation_service.validate_envio_dte_xml(envelope_xml_str)
 
-        if is_valid:
-            self.state = 'envelope_created'
-        else:
-            raise UserError(_('Error en validación XSD del sobre:\n%s') % '\n'.join(messages))
+            if not is_valid:
+                raise UserError(_('Error en validación XSD del sobre %s:\n%s') % (envelope.name, '\n'.join(messages)))
 
-        return {
-            'type': 'ir.actions.act_window',
-            'res_model': 'l10n_cl_edi.certification.envelope',
-            'res_id': envelope.id,
-            'view_mode': 'form',
-            'target': 'current',
-        }
+        self.state = 'envelope_created'
+
+        return self.action_view_envelope()
 
     def action_view_envelope(self):
-        """Ver el sobre generado"""
+        """Ver el sobre generado (o la lista, si son varios)"""
         self.ensure_one()
+        envelopes = self.envelope_ids or self.envelope_id
+        if len(envelopes) > 1:
+            return {
+                'type': 'ir.actions.act_window',
+                'name': _('Sobres'),
+                'res_model': 'l10n_cl_edi.certification.envelope',
+                'domain': [('id', 'in', envelopes.ids)],
+                'view_mode': 'list,form',
+                'target': 'current',
+            }
         return {
             'type': 'ir.actions.act_window',
             'res_model': 'l10n_cl_edi.certification.envelope',
-            'res_id': self.envelope_id.id,
+            'res_id': envelopes.id,
             'view_mode': 'form',
             'target': 'current',
         }
@@ -504,9 +511,8 @@ class CertificationSimulation(models.Model):
         """Regresar a borrador"""
         self.ensure_one()
 
-        # Eliminar documentos y sobre si existen
-        if self.envelope_id:
-            self.envelope_id.unlink()
+        # Eliminar documentos y sobres si existen
+        (self.envelope_ids | self.envelope_id).unlink()
 
         self.document_ids.unlink()
 
@@ -514,81 +520,79 @@ class CertificationSimulation(models.Model):
         self.message_post(body=_('Simulación regresada a borrador. Documentos eliminados.'))
 
     def action_send_to_sii(self):
-        """Envía el sobre al SII"""
+        """Envía los sobres al SII (en paralelo si son varios)"""
         self.ensure_one()
 
         if self.state != 'envelope_created':
             raise UserError(_('Debe crear el sobre primero.'))
 
-        if not self.envelope_id:
+        envelopes = self.envelope_ids or self.envelope_id
+        if not envelopes:
             raise UserError(_('No hay sobre para enviar.'))
 
-        # Enviar el sobre al SII usando el servicio de integración
-        sii_service = self.env['l10n_cl_edi.sii.integration.service']
-        result = sii_service.send_envelope(self.envelope_id)
+        # Enviar los sobres al SII (ver CertificationEnvelope.action_send_to_sii)
+        envelopes.filtered(lambda e: e.state == 'signed').action_send_to_sii()
 
-        if result and result.get('track_id'):
-            self.write({
-                'sii_track_id': result['track_id'],
-                'sii_send_date': fields.Datetime.now(),
-                'state': 'sent',
-            })
+        sent = envelopes.filtered('sii_track_id')
+        if not sent:
+            raise UserError(_('Error al enviar al SII: ningún sobre fue enviado.'))
 
-            self.message_post(body=_('Sobre enviado al SII. Track ID: %s') % result['track_id'])
+        track_ids = ', '.join(sent.mapped('sii_track_id'))
+        self.write({
+            'sii_track_id': track_ids,
+            'sii_send_date': fields.Datetime.now(),
+            'state': 'sent' if sent == envelopes else self.state,
+        })
 
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Enviado al SII'),
-                    'message': _('El sobre fue enviado exitosamente. Track ID: %s') % result['track_id'],
-                    'type': 'success',
-                    'sticky': False,
-                }
+        self.message_post(body=_('Sobre(s) enviado(s) al SII. Track ID: %s') % track_ids)
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Enviado al SII'),
+                'message': _('%d de %d sobre(s) enviado(s). Track ID: %s') % (len(sent), len(envelopes), track_ids),
+                'type': 'success' if sent == envelopes else 'warning',
+                'sticky': False,
             }
-        else:
-            raise UserError(_('Error al enviar al SII: %s') % result.get('error', 'Error desconocido'))
+        }
 
     def action_check_sii_status(self):
-        """Consulta el estado en el SII"""
+        """Consulta el estado de los sobres en el SII"""
         self.ensure_one()
 
         if not self.sii_track_id:
             raise UserError(_('No hay Track ID. Debe enviar al SII primero.'))
 
-        # Consultar estado en el SII
-        sii_service = self.env['l10n_cl_edi.sii.integration.service']
-        result = sii_service.check_status(
-            self.sii_track_id,
-            self.project_id
-        )
-
-        if result:
-            estado = result.get('estado', 'DESCONOCIDO')
-            glosa = result.get('glosa', '')
-
-            # Actualizar estado según respuesta
-            if 'ACEPTADO' in estado.upper() or 'LOK' in estado.upper() or 'SOK' in estado.upper():
-                self.state = 'accepted'
-                tipo_notif = 'success'
-            elif 'RECHAZADO' in estado.upper() or 'RCH' in estado.upper():
-                self.state = 'rejected'
-                tipo_notif = 'danger'
-            else:
-                tipo_notif = 'info'
+        # Consultar estado de cada sobre enviado (ver CertificationEnvelope.action_check_sii_status)
+        envelopes = (self.envelope_ids or self.envelope_id).filtered('sii_track_id')
+        envelopes.action_check_sii_status()
+
+        # Actualizar estado según respuesta
+        states = set(envelopes.mapped('state'))
+        if states == {'accepted'}:
+            self.state = 'accepted'
+            tipo_notif = 'success'
+        elif 'rejected' in states:
+            self.state = 'rejected'
+            tipo_notif = 'danger'
+        else:
+            tipo_notif = 'info'
 
-            mensaje = f'Estado SII: {estado}\n{glosa}'
-            self.message_post(body=mensaje)
+        state_labels = dict(envelopes._fields['state']._description_selection(self.env))
+        mensaje = '\n'.join(
+            f'{envelope.name} ({envelope.sii_track_id}): {state_labels[envelope.state]}'
+            for envelope in envelopes
+        )
+        self.message_post(body=mensaje)
 
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Estado SII'),
-                    'message': mensaje,
-                    'type': tipo_notif,
-                    'sticky': True,
-                }
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Estado SII'),
+                'message': mensaje,
+                'type': tipo_notif,
+                'sticky': True,
             }
-        else:
-            raise UserError(_('No se pudo consultar el estado en el SII.'))
+        }
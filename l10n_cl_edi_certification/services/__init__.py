@@ -9,3 +9,4 @@ from . import book_generator_service
 from . import simulation_generator_service
 from . import exchange_generator_service
 from . import pdf_generator_service
+from . import export_service
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 from odoo import models, api, _
 from odoo.exceptions import UserError
+from odoo.tools import SQL
 from datetime import datetime
+import io
 import pytz
-from collections import defaultdict
+
+from .book_xml_writer import BookXmlWriter
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -17,30 +20,44 @@ class BookGeneratorService(models.AbstractModel):
     _name = 'l10n_cl_edi.book.generator.service'
     _description = 'Servicio de Generación de Libros de Compra/Venta'
 
-    def generate_book_xml(self, book):
+    # Líneas del libro que se leen de cada vez al generar los Detalles
+    BOOK_LINE_CHUNK_SIZE = 2000
+
+    # Campos de l10n_cl_edi.certification.book.line usados en los Detalles
+    DETALLE_FIELDS = [
+        'document_type_code', 'folio', 'issue_date', 'partner_rut', 'partner_name',
+        'mnt_neto', 'mnt_exento', 'mnt_iva', 'mnt_total',
+        'iva_uso_comun', 'iva_no_recuperable', 'cod_iva_no_rec', 'iva_ret_total', 'iva_ret_parcial',
+    ]
+
+    def generate_book_xml(self, book, segment=None):
         """
         Genera el XML del LibroCompraVenta.
 
         Args:
             book: Registro de l10n_cl_edi.certification.book
+            segment: l10n_cl_edi.certification.book.segment para un envío
+                PARCIAL/FINAL (por defecto, el libro completo con TipoEnvio TOTAL)
 
         Returns:
-            str: XML del libro sin firmar
+            bytes: XML del libro sin firmar (ISO-8859-1)
         """
 
         if not book.line_ids:
             raise UserError(_('El libro no tiene líneas para generar.'))
 
         # Preparar datos del libro
-        book_data = self._prepare_book_data(book)
+        book_data = self._prepare_book_data(book, segment)
 
-        # Generar XML usando template QWeb
-        xml_string = self._generate_book_xml_with_template(book_data, book)
+        # Escribir el XML elemento a elemento. El destino es un BytesIO y no un
+        # archivo: el XML se firma y se guarda completo en un campo Binary
+        output = io.BytesIO()
+        self._write_book_xml(output, book_data, book)
 
-        return xml_string
+        return output.getvalue()
 
-    def _prepare_book_data(self, book):
-        """Prepara los datos del libro para el template"""
+    def _prepare_book_data(self, book, segment=None):
+        """Prepara los datos del libro (o de uno de sus segmentos) para el XML"""
 
         # Obtener información del cliente (quien envía/firma con certificado)
         client_info = book.project_id.client_info_id
@@ -74,96 +91,53 @@ class BookGeneratorService(models.AbstractModel):
 
             # Configuración del libro
             'TipoOperacion': 'COMPRA' if book.book_type == 'purchase' else 'VENTA',
-            'TipoLibro': 'MENSUAL',  # MENSUAL para libros normales (ESPECIAL requiere FolioNotificacion)
-            'TipoEnvio': 'TOTAL',  # TOTAL, PARCIAL, FINAL, AJUSTE
+            # MENSUAL para libros normales (ESPECIAL requiere FolioNotificacion);
+            # el libro de compras de certificación se envía como ESPECIAL
+            'TipoLibro': 'ESPECIAL' if book.book_type == 'purchase' else 'MENSUAL',
+            'TipoEnvio': segment.tipo_envio if segment else 'TOTAL',  # TOTAL, PARCIAL, FINAL, AJUSTE
         }
 
+        # NroSegmento: Solo para envíos segmentados (PARCIAL/FINAL)
+        if segment:
+            caratula['NroSegmento'] = segment.segment_number
+
         # FolioNotificacion: Solo para libros de COMPRAS ESPECIALES
         if book.book_type == 'purchase' and book.folio_notificacion:
             caratula['FolioNotificacion'] = book.folio_notificacion
 
-        # Preparar ResumenPeriodo (agrupado por tipo de documento)
-        resumen = self._prepare_resumen_periodo(book)
-
-        # Preparar Detalles
-        detalles = self._prepare_detalles(book)
-
-        return {
+        # Detalles: se generan por bloques a medida que se escriben
+        book_data = {
             'Caratula': caratula,
-            'ResumenPeriodo': resumen,
-            'Detalles': detalles,
+            'Detalles': self._iter_detalles(book, segment),
             'TipoLibro': book.book_type,  # 'sale' o 'purchase'
         }
 
-    def _prepare_resumen_periodo(self, book):
-        """
-        Prepara el ResumenPeriodo agrupando por tipo de documento.
+        # ResumenSegmento: totales de las líneas del segmento
+        if segment:
+            book_data['ResumenSegmento'] = self._prepare_resumen_periodo(book, segment)
 
-        Returns:
-            list: Lista de diccionarios con totales por tipo de documento
-        """
-
-        # Agrupar líneas por tipo de documento
-        doc_groups = defaultdict(lambda: {
-            'cantidad': 0,
-            'mnt_neto': 0,
-            'mnt_exento': 0,
-            'mnt_iva': 0,
-            'mnt_total': 0,
-            'iva_uso_comun': 0,
-            'iva_uso_comun_count': 0,  # Cantidad de operaciones con IVA Uso Común
-            'iva_no_recuperable': 0,
-            'iva_no_rec_count': 0,  # Cantidad de operaciones con IVA No Rec
-            'cod_iva_no_rec': None,  # Código del primer IVA No Rec encontrado
-            'iva_ret_total': 0,
-            'iva_ret_total_count': 0,  # Cantidad de operaciones con IVA Ret Total
-            'iva_ret_parcial': 0,
-            'iva_ret_parcial_count': 0,  # Cantidad de operaciones con IVA Ret Parcial
-        })
-
-        for line in book.line_ids:
-            tipo_doc = line.document_type_code
-            if not tipo_doc:
-                continue
-
-            doc_groups[tipo_doc]['cantidad'] += 1
-            doc_groups[tipo_doc]['mnt_neto'] += line.mnt_neto or 0
-            doc_groups[tipo_doc]['mnt_exento'] += line.mnt_exento or 0
-
-            # Solo sumar MntIVA si NO hay IVA No Recuperable NI IVA Uso Común
-            # Cuando hay IVA No Rec o Uso Común, el IVA va en campos específicos, NO en MntIVA
-            if book.book_type == 'purchase' and (line.iva_no_recuperable or line.iva_uso_comun):
-                # No sumar al mnt_iva (quedará en 0)
-                pass
-            else:
-                doc_groups[tipo_doc]['mnt_iva'] += line.mnt_iva or 0
+        # ResumenPeriodo (agrupado por tipo de documento): en envíos segmentados
+        # solo lo lleva el segmento FINAL
+        if not segment or segment.tipo_envio == 'FINAL':
+            book_data['ResumenPeriodo'] = self._prepare_resumen_periodo(book)
 
-            doc_groups[tipo_doc]['mnt_total'] += line.mnt_total or 0
+        return book_data
 
-            # Campos específicos de libro de COMPRAS
-            if book.book_type == 'purchase':
-                # IVA Uso Común
-                if line.iva_uso_comun:
-                    doc_groups[tipo_doc]['iva_uso_comun'] += line.iva_uso_comun
-                    doc_groups[tipo_doc]['iva_uso_comun_count'] += 1
+    def _prepare_resumen_periodo(self, book, segment=None):
+        """
+        Prepara el ResumenPeriodo (o el ResumenSegmento, si se indica un
+        segmento) agrupando por tipo de documento.
 
-                # IVA No Recuperable
-                if line.iva_no_recuperable:
-                    doc_groups[tipo_doc]['iva_no_recuperable'] += line.iva_no_recuperable
-                    doc_groups[tipo_doc]['iva_no_rec_count'] += 1
-                    # Capturar el código del primer documento que lo tenga
-                    if line.cod_iva_no_rec and not doc_groups[tipo_doc]['cod_iva_no_rec']:
-                        doc_groups[tipo_doc]['cod_iva_no_rec'] = line.cod_iva_no_rec
+        Args:
+            book: l10n_cl_edi.certification.book
+            segment: l10n_cl_edi.certification.book.segment (opcional)
 
-                # IVA Retenido Total
-                if line.iva_ret_total:
-                    doc_groups[tipo_doc]['iva_ret_total'] += line.iva_ret_total
-                    doc_groups[tipo_doc]['iva_ret_total_count'] += 1
+        Returns:
+            list: Lista de diccionarios con totales por tipo de documento
+        """
 
-                # IVA Retenido Parcial
-                if line.iva_ret_parcial:
-                    doc_groups[tipo_doc]['iva_ret_parcial'] += line.iva_ret_parcial
-                    doc_groups[tipo_doc]['iva_ret_parcial_count'] += 1
+        # Totales por tipo de documento en una sola consulta agregada
+        doc_groups = self._aggregate_book_lines(book, segment)
 
         # Convertir a lista de diccionarios
         resumen = []
@@ -231,133 +205,219 @@ class BookGeneratorService(models.AbstractModel):
 
         return resumen
 
-    def _prepare_detalles(self, book):
+    def _aggregate_book_lines(self, book, segment=None):
         """
-        Prepara los Detalles (líneas individuales) del libro.
+        Totaliza las líneas del libro por tipo de documento con un único
+        GROUP BY en la base de datos (sin cargar las líneas en el ORM).
+
+        Las reglas son las del ResumenPeriodo: en COMPRAS, el IVA de las
+        líneas con IVA No Recuperable o IVA Uso Común no se suma a MntIVA, y
+        CodIVANoRec es el de la primera línea (según el orden del libro) que
+        lo informa.
+
+        Args:
+            book: l10n_cl_edi.certification.book
+            segment: l10n_cl_edi.certification.book.segment (opcional): solo
+                las líneas de ese segmento
 
         Returns:
-            list: Lista de diccionarios con datos de cada documento
+            dict: Tipo de documento -> totales (ver _prepare_resumen_periodo)
         """
-        detalles = []
-
-        for line in book.line_ids:
-            # Calcular MntIVA según reglas del SII
-            # Cuando hay IVA No Recuperable o IVA Uso Común, MntIVA debe ser 0
-            mnt_iva = 0
-            if book.book_type == 'purchase':
-                if line.iva_no_recuperable or line.iva_uso_comun:
-                    mnt_iva = 0  # IVA No Recuperable o Uso Común: MntIVA = 0
-                else:
-                    mnt_iva = int(line.mnt_iva) if line.mnt_iva else 0
-            else:
-                mnt_iva = int(line.mnt_iva) if line.mnt_iva else 0
-
-            # Datos comunes para COMPRAS y VENTAS
-            detalle = {
-                'TpoDoc': line.document_type_code,
-                'NroDoc': line.folio,  # En LibroCompraVenta se llama NroDoc, no Folio
-                'FchDoc': line.issue_date.strftime('%Y-%m-%d') if line.issue_date else '',
-                'RUTDoc': line.partner_rut,
-                'RznSoc': line.partner_name[:50] if line.partner_name else '',  # Máx 50 caracteres
-                'MntNeto': int(line.mnt_neto) if line.mnt_neto else 0,
-                'MntExe': int(line.mnt_exento) if line.mnt_exento else 0,
-                'MntIVA': mnt_iva,
-                'MntTotal': int(line.mnt_total),
+        Line = self.env['l10n_cl_edi.certification.book.line']
+        Line.flush_model(['book_id', 'segment_id', 'sequence'] + self.DETALLE_FIELDS)
+
+        is_purchase = book.book_type == 'purchase'
+        self.env.cr.execute(SQL(
+            """
+            SELECT document_type_code,
+                   COUNT(*),
+                   SUM(COALESCE(mnt_neto, 0)),
+                   SUM(COALESCE(mnt_exento, 0)),
+                   SUM(COALESCE(mnt_iva, 0)) FILTER (
+                       WHERE NOT %(is_purchase)s
+                          OR (COALESCE(iva_no_recuperable, 0) = 0 AND COALESCE(iva_uso_comun, 0) = 0)),
+                   SUM(COALESCE(mnt_total, 0)),
+                   SUM(COALESCE(iva_uso_comun, 0)),
+                   COUNT(*) FILTER (WHERE COALESCE(iva_uso_comun, 0) != 0),
+                   SUM(COALESCE(iva_no_recuperable, 0)),
+                   COUNT(*) FILTER (WHERE COALESCE(iva_no_recuperable, 0) != 0),
+                   (ARRAY_AGG(cod_iva_no_rec ORDER BY sequence, id) FILTER (
+                       WHERE COALESCE(iva_no_recuperable, 0) != 0 AND COALESCE(cod_iva_no_rec, '') != ''))[1],
+                   SUM(COALESCE(iva_ret_total, 0)),
+                   COUNT(*) FILTER (WHERE COALESCE(iva_ret_total, 0) != 0),
+                   SUM(COALESCE(iva_ret_parcial, 0)),
+                   COUNT(*) FILTER (WHERE COALESCE(iva_ret_parcial, 0) != 0)
+              FROM %(table)s
+             WHERE book_id = %(book_id)s
+               AND %(segment_filter)s
+               AND COALESCE(document_type_code, '') != ''
+          GROUP BY document_type_code
+            """,
+            table=SQL.identifier(Line._table),
+            book_id=book.id,
+            segment_filter=SQL('segment_id = %s', segment.id) if segment else SQL('TRUE'),
+            is_purchase=is_purchase,
+        ))
+
+        doc_groups = {}
+        for row in self.env.cr.fetchall():
+            (tipo_doc, cantidad, mnt_neto, mnt_exento, mnt_iva, mnt_total,
+             iva_uso_comun, iva_uso_comun_count, iva_no_recuperable, iva_no_rec_count, cod_iva_no_rec,
+             iva_ret_total, iva_ret_total_count, iva_ret_parcial, iva_ret_parcial_count) = row
+            # Los montos (digits=(16, 0)) son columnas numeric: SUM devuelve Decimal
+            mnt_neto, mnt_exento, mnt_iva, mnt_total, iva_uso_comun, iva_no_recuperable, iva_ret_total, iva_ret_parcial = (
+                float(amount or 0) for amount in (
+                    mnt_neto, mnt_exento, mnt_iva, mnt_total,
+                    iva_uso_comun, iva_no_recuperable, iva_ret_total, iva_ret_parcial))
+            totales = {
+                'cantidad': cantidad,
+                'mnt_neto': mnt_neto,
+                'mnt_exento': mnt_exento,
+                'mnt_iva': mnt_iva,
+                'mnt_total': mnt_total,
             }
+            # Campos específicos de libro de COMPRAS
+            if is_purchase:
+                totales.update({
+                    'iva_uso_comun': iva_uso_comun,
+                    'iva_uso_comun_count': iva_uso_comun_count,  # Cantidad de operaciones con IVA Uso Común
+                    'iva_no_recuperable': iva_no_recuperable,
+                    'iva_no_rec_count': iva_no_rec_count,  # Cantidad de operaciones con IVA No Rec
+                    'cod_iva_no_rec': cod_iva_no_rec,  # Código del primer IVA No Rec encontrado
+                    'iva_ret_total': iva_ret_total,
+                    'iva_ret_total_count': iva_ret_total_count,  # Cantidad de operaciones con IVA Ret Total
+                    'iva_ret_parcial': iva_ret_parcial,
+                    'iva_ret_parcial_count': iva_ret_parcial_count,  # Cantidad de operaciones con IVA Ret Parcial
+                })
+            doc_groups[tipo_doc] = totales
+        return doc_groups
+
+    def _iter_detalles(self, book, segment=None):
+        """
+        Genera los Detalles del libro leyendo las líneas por bloques de
+        BOOK_LINE_CHUNK_SIZE, como valores simples (sin registros del ORM).
 
-            # TasaImp: Tasa de IVA cuando el documento tiene IVA
-            # El SII requiere este campo en certificación aunque sea opcional en el esquema XSD
-            if line.mnt_iva and line.mnt_iva > 0:
-                detalle['TasaImp'] = 19  # Tasa IVA en Chile
-
-            # Campos específicos de LIBRO DE COMPRAS
-            if book.book_type == 'purchase':
-
-                # IVA Uso Común
-                if line.iva_uso_comun:
-                    detalle['IVAUsoComun'] = int(line.iva_uso_comun)
-
-                # IVA No Recuperable
-                if line.iva_no_recuperable:
-                    detalle['IVANoRec'] = {
-                        'CodIVANoRec': line.cod_iva_no_rec or '1',
-                        'MntIVANoRec': int(line.iva_no_recuperable),
-                    }
-
-                # OtrosImp: Otros Impuestos (IVA Retenido Total/Parcial)
-                otros_imp_detalle = []
-                if line.iva_ret_total:
-                    otros_imp_detalle.append({
-                        'CodImp': 15,  # Código 15 = IVA Retenido Total
-                        'TasaImp': 19,
-                        'MntImp': int(line.iva_ret_total)
-                    })
-
-                if line.iva_ret_parcial:
-                    otros_imp_detalle.append({
-                        'CodImp': 16,  # Código 16 = IVA Retenido Parcial
-                        'TasaImp': 19,
-                        'MntImp': int(line.iva_ret_parcial)
-                    })
-
-                if otros_imp_detalle:
-                    detalle['OtrosImp'] = otros_imp_detalle
-
-                # IVA Retenido Total (para FC Electrónica tipo 46)
-                if line.iva_ret_total:
-                    detalle['IVARetTotal'] = int(line.iva_ret_total)
+        Args:
+            book: l10n_cl_edi.certification.book
+            segment: l10n_cl_edi.certification.book.segment (opcional): solo
+                las líneas de ese segmento
 
-                # IVA Retenido Parcial
-                if line.iva_ret_parcial:
-                    detalle['IVARetParcial'] = int(line.iva_ret_parcial)
+        Yields:
+            dict: Datos de cada documento, en el orden del libro
+        """
+        Line = self.env['l10n_cl_edi.certification.book.line']
+        domain = [('book_id', '=', book.id)]
+        if segment:
+            domain.append(('segment_id', '=', segment.id))
+        line_ids = Line.search(domain).ids
+        for start in range(0, len(line_ids), self.BOOK_LINE_CHUNK_SIZE):
+            lines = Line.browse(line_ids[start:start + self.BOOK_LINE_CHUNK_SIZE])
+            for line in lines.read(self.DETALLE_FIELDS, load=None):
+                yield self._prepare_detalle(line, book.book_type)
+            lines.invalidate_recordset()
+
+    def _prepare_detalle(self, line, book_type):
+        """
+        Detalle de una línea del libro.
 
-                # CreditoIVAUsoComun NO se incluye (no está en esquema XSD del SII)
-                # Observaciones NO se incluyen en LibroCompraVenta (no es válido según esquema SII)
+        Args:
+            line (dict): Valores de la línea (ver DETALLE_FIELDS)
+            book_type (str): 'sale' o 'purchase'
 
-            detalles.append(detalle)
+        Returns:
+            dict: Datos del documento
+        """
+        # Calcular MntIVA según reglas del SII
+        # Cuando hay IVA No Recuperable o IVA Uso Común, MntIVA debe ser 0
+        mnt_iva = 0
+        if book_type == 'purchase':
+            if line['iva_no_recuperable'] or line['iva_uso_comun']:
+                mnt_iva = 0  # IVA No Recuperable o Uso Común: MntIVA = 0
+            else:
+                mnt_iva = int(line['mnt_iva']) if line['mnt_iva'] else 0
+        else:
+            mnt_iva = int(line['mnt_iva']) if line['mnt_iva'] else 0
+
+        # Datos comunes para COMPRAS y VENTAS
+        detalle = {
+            'TpoDoc': line['document_type_code'],
+            'NroDoc': line['folio'],  # En LibroCompraVenta se llama NroDoc, no Folio
+            'FchDoc': line['issue_date'].strftime('%Y-%m-%d') if line['issue_date'] else '',
+            'RUTDoc': line['partner_rut'],
+            'RznSoc': line['partner_name'][:50] if line['partner_name'] else '',  # Máx 50 caracteres
+            'MntNeto': int(line['mnt_neto']) if line['mnt_neto'] else 0,
+            'MntExe': int(line['mnt_exento']) if line['mnt_exento'] else 0,
+            'MntIVA': mnt_iva,
+            'MntTotal': int(line['mnt_total']),
+        }
 
-        return detalles
+        # TasaImp: Tasa de IVA cuando el documento tiene IVA
+        # El SII requiere este campo en certificación aunque sea opcional en el esquema XSD
+        if line['mnt_iva'] and line['mnt_iva'] > 0:
+            detalle['TasaImp'] = 19  # Tasa IVA en Chile
+
+        # Campos específicos de LIBRO DE COMPRAS
+        if book_type == 'purchase':
+
+            # IVA Uso Común
+            if line['iva_uso_comun']:
+                detalle['IVAUsoComun'] = int(line['iva_uso_comun'])
+
+            # IVA No Recuperable
+            if line['iva_no_recuperable']:
+                detalle['IVANoRec'] = {
+                    'CodIVANoRec': line['cod_iva_no_rec'] or '1',
+                    'MntIVANoRec': int(line['iva_no_recuperable']),
+                }
+
+            # OtrosImp: Otros Impuestos (IVA Retenido Total/Parcial)
+            otros_imp_detalle = []
+            if line['iva_ret_total']:
+                otros_imp_detalle.append({
+                    'CodImp': 15,  # Código 15 = IVA Retenido Total
+                    'TasaImp': 19,
+                    'MntImp': int(line['iva_ret_total'])
+                })
+
+            if line['iva_ret_parcial']:
+                otros_imp_detalle.append({
+                    'CodImp': 16,  # Código 16 = IVA Retenido Parcial
+                    'TasaImp': 19,
+                    'MntImp': int(line['iva_ret_parcial'])
+                })
+
+            if otros_imp_detalle:
+                detalle['OtrosImp'] = otros_imp_detalle
+
+            # IVA Retenido Total (para FC Electrónica tipo 46)
+            if line['iva_ret_total']:
+                detalle['IVARetTotal'] = int(line['iva_ret_total'])
+
+            # IVA Retenido Parcial
+            if line['iva_ret_parcial']:
+                detalle['IVARetParcial'] = int(line['iva_ret_parcial'])
+
+            # CreditoIVAUsoComun NO se incluye (no está en esquema XSD del SII)
+            # Observaciones NO se incluyen en LibroCompraVenta (no es válido según esquema SII)
+
+        return detalle
+
+    def _write_book_xml(self, output, book_data, book):
+        """
+        Escribe el XML del libro en un archivo.
 
-    def _generate_book_xml_with_template(self, book_data, book):
-        """Genera el XML usando template QWeb"""
+        Args:
+            output: Archivo binario de destino
+            book_data (dict): Datos de _prepare_book_data
+            book: l10n_cl_edi.certification.book
+        """
         try:
             # Timestamp de firma (va al final del EnvioLibro, NO en la Carátula)
             santiago_tz = pytz.timezone('America/Santiago')
             now_santiago = datetime.now(santiago_tz)
-            tmst_firma = now_santiago.strftime('%Y-%m-%dT%H:%M:%S')
-
-            # Agregar timestamp (TmstFirma va al final del EnvioLibro)
-            book_data['TmstFirma'] = tmst_firma
+            book_data['TmstFirma'] = now_santiago.strftime('%Y-%m-%dT%H:%M:%S')
 
-            # Seleccionar template según tipo de operación
-            if book.book_type == 'purchase':
-                template_id = 'l10n_cl_edi_certification.book_purchase_template'
-            else:  # sale
-                template_id = 'l10n_cl_edi_certification.book_sales_template'
-
-            xml_string = self.env['ir.qweb']._render(template_id, {
-                'book_data': book_data,
-            })
-
-            # Limpiar el XML
-            if isinstance(xml_string, bytes):
-                xml_string = xml_string.decode('utf-8')
-
-            # Eliminar líneas vacías y espacios extras
-            lines = [line for line in xml_string.split('\n') if line.strip()]
-            xml_string = '\n'.join(lines)
-
-            # IMPORTANTE: QWeb/lxml pueden reordenar los atributos xmlns alfabéticamente.
-            # Necesitamos asegurar que xmlns venga ANTES de xmlns:xsi (como en Enterprise).
-            # Este reemplazo se hace ANTES de firmar, por lo que no afecta la firma.
-            import re
-            xml_string = re.sub(
-                r'<LibroCompraVenta\s+xmlns:xsi="([^"]+)"\s+xmlns="([^"]+)"',
-                r'<LibroCompraVenta xmlns="\2" xmlns:xsi="\1"',
-                xml_string
-            )
-
-            return xml_string
+            BookXmlWriter(output, book.book_type).write(book_data)
 
         except Exception as e:
             _logger.error(f'Error generando XML de libro: {str(e)}')
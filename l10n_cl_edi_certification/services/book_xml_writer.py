@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Escritura del XML LibroCompraVenta (IECV).
+
+Emite la Carátula, el ResumenPeriodo y cada Detalle directamente sobre un
+archivo binario, sin renderizar el documento como texto ni volver a
+recorrerlo para limpiarlo. El destino lo elige quien llama: generate_book_xml
+escribe en un io.BytesIO, porque el libro se firma y se guarda completo en
+un campo Binary.
+
+La salida es idéntica, byte a byte, a la que producían las plantillas QWeb
+del libro una vez eliminadas las líneas vacías: misma indentación, mismo
+escape y xmlns antes de xmlns:xsi en el elemento raíz.
+
+Los envíos segmentados (TipoEnvio PARCIAL/FINAL) agregan NroSegmento a la
+Carátula y un ResumenSegmento; solo el segmento FINAL lleva ResumenPeriodo.
+"""
+from markupsafe import escape
+
+BOOK_ENCODING = 'ISO-8859-1'
+
+LIBRO_ROOT_TAG = (
+    '<LibroCompraVenta xmlns="http://www.sii.cl/SiiDte" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.sii.cl/SiiDte LibroCV_v10.xsd" version="1.0">'
+)
+
+
+def _text(value):
+    """
+    Contenido de un elemento tal como lo escribía t-out: None y False no se
+    escriben y las líneas en blanco internas del valor se descartan.
+    """
+    if value is None or value is False:
+        return ''
+    text = str(escape(value))
+    if '\n' in text:
+        first, *middle, last = text.split('\n')
+        text = '\n'.join([first, *(line for line in middle if line.strip()), last])
+    return text
+
+
+class BookXmlWriter:
+    """
+    Escribe un LibroCompraVenta en un archivo binario (codificado en
+    ISO-8859-1), un elemento de primer nivel a la vez (ver
+    tests/test_book_xml_writer.py).
+    """
+
+    def __init__(self, output, book_type):
+        """
+        Args:
+            output: Archivo binario de destino (write(bytes))
+            book_type (str): 'sale' o 'purchase'
+        """
+        self._output = output
+        self._purchase = book_type == 'purchase'
+        self._parts = []
+
+    def write(self, book_data):
+        """
+        Escribe el libro completo.
+
+        Args:
+            book_data (dict): Caratula, ResumenSegmento (opcional),
+                ResumenPeriodo (opcional), Detalles (iterable, se consume una
+                sola vez) y TmstFirma
+        """
+        self._parts.append(LIBRO_ROOT_TAG)
+        self._line(4, '<EnvioLibro ID="SetDoc">')
+        self._write_caratula(book_data['Caratula'])
+        if 'ResumenSegmento' in book_data:
+            self._write_resumen('ResumenSegmento', 'TotalesSegmento', book_data['ResumenSegmento'])
+        if 'ResumenPeriodo' in book_data:
+            self._write_resumen('ResumenPeriodo', 'TotalesPeriodo', book_data['ResumenPeriodo'])
+        self._flush()
+        for detalle in book_data['Detalles']:
+            self._write_detalle(detalle)
+            self._flush()
+        self._element(8, 'TmstFirma', book_data['TmstFirma'])
+        self._line(4, '</EnvioLibro>')
+        self._line(0, '</LibroCompraVenta>')
+        self._flush()
+
+    def _line(self, indent, markup):
+        self._parts.append('\n' + ' ' * indent + markup)
+
+    def _element(self, indent, tag, value):
+        self._line(indent, f'<{tag}>{_text(value)}</{tag}>')
+
+    def _flush(self):
+        self._output.write(''.join(self._parts).encode(BOOK_ENCODING))
+        self._parts.clear()
+
+    def _write_caratula(self, caratula):
+        self._line(8, '<Caratula>')
+        for tag in ('RutEmisorLibro', 'RutEnvia', 'PeriodoTributario', 'FchResol', 'NroResol',
+                    'TipoOperacion', 'TipoLibro', 'TipoEnvio'):
+            self._element(12, tag, caratula[tag])
+        if caratula.get('NroSegmento'):
+            self._element(12, 'NroSegmento', caratula['NroSegmento'])
+        if self._purchase and caratula.get('FolioNotificacion'):
+            self._element(12, 'FolioNotificacion', caratula['FolioNotificacion'])
+        self._line(8, '</Caratula>')
+
+    def _write_resumen(self, tag, item_tag, resumen):
+        self._line(8, f'<{tag}>')
+        for item in resumen:
+            self._line(12, f'<{item_tag}>')
+            self._element(16, 'TpoDoc', item['TpoDoc'])
+            self._element(16, 'TotDoc', item['TotDoc'])
+            self._element(16, 'TotMntExe', item.get('MntExe', 0))
+            self._element(16, 'TotMntNeto', item.get('MntNeto', 0))
+            self._element(16, 'TotMntIVA', item.get('MntIVA', 0))
+            if self._purchase:
+                self._write_totales_compras(item)
+            self._element(16, 'TotMntTotal', item['TotMntTotal'])
+            self._line(12, f'</{item_tag}>')
+        self._line(8, f'</{tag}>')
+
+    def _write_totales_compras(self, item):
+        if item.get('IVANoRec'):
+            self._line(16, '<TotIVANoRec>')
+            self._element(20, 'CodIVANoRec', item['IVANoRec']['CodIVANoRec'])
+            self._element(20, 'TotOpIVANoRec', item['IVANoRec']['TotOpIVANoRec'])
+            self._element(20, 'TotMntIVANoRec', item['IVANoRec']['TotMntIVANoRec'])
+            self._line(16, '</TotIVANoRec>')
+        for tag, key in (('TotOpIVAUsoComun', 'TotOpIVAUsoComun'), ('TotIVAUsoComun', 'IVAUsoComun'),
+                         ('FctProp', 'FctProp'), ('TotCredIVAUsoComun', 'TotCredIVAUsoComun')):
+            if item.get(key):
+                self._element(16, tag, item[key])
+        # La plantilla indentaba TotOtrosImp un nivel más que sus hermanos
+        for otro_imp in item.get('OtrosImpuestos') or ():
+            self._line(20, '<TotOtrosImp>')
+            self._element(24, 'CodImp', otro_imp['CodImp'])
+            self._element(24, 'TotMntImp', otro_imp['TotMntImp'])
+            self._line(20, '</TotOtrosImp>')
+        for tag, key in (('TotOpIVARetTotal', 'TotOpIVARetTotal'), ('TotIVARetTotal', 'IVARetTotal'),
+                         ('TotOpIVARetParcial', 'TotOpIVARetParcial'), ('TotIVARetParcial', 'IVARetParcial')):
+            if item.get(key):
+                self._element(16, tag, item[key])
+
+    def _write_detalle(self, detalle):
+        self._line(8, '<Detalle>')
+        self._element(12, 'TpoDoc', detalle['TpoDoc'])
+        self._element(12, 'NroDoc', detalle['NroDoc'])
+        if detalle.get('TasaImp'):
+            self._element(12, 'TasaImp', detalle['TasaImp'])
+        self._element(12, 'FchDoc', detalle['FchDoc'])
+        self._element(12, 'RUTDoc', detalle['RUTDoc'])
+        self._element(12, 'RznSoc', detalle['RznSoc'])
+        if detalle.get('MntExe'):
+            self._element(12, 'MntExe', detalle['MntExe'])
+        if detalle.get('MntNeto'):
+            self._element(12, 'MntNeto', detalle['MntNeto'])
+        if self._purchase:
+            self._element(12, 'MntIVA', detalle.get('MntIVA', 0))
+            self._write_detalle_compras(detalle)
+        elif detalle.get('MntIVA'):
+            self._element(12, 'MntIVA', detalle['MntIVA'])
+        self._element(12, 'MntTotal', detalle['MntTotal'])
+        self._line(8, '</Detalle>')
+
+    def _write_detalle_compras(self, detalle):
+        if detalle.get('IVANoRec'):
+            self._line(12, '<IVANoRec>')
+            self._element(16, 'CodIVANoRec', detalle['IVANoRec']['CodIVANoRec'])
+            self._element(16, 'MntIVANoRec', detalle['IVANoRec']['MntIVANoRec'])
+            self._line(12, '</IVANoRec>')
+        if detalle.get('IVAUsoComun'):
+            self._element(12, 'IVAUsoComun', detalle['IVAUsoComun'])
+        # La plantilla indentaba OtrosImp un nivel más que sus hermanos
+        for otro_imp in detalle.get('OtrosImp') or ():
+            self._line(16, '<OtrosImp>')
+            self._element(20, 'CodImp', otro_imp['CodImp'])
+            if otro_imp.get('TasaImp'):
+                self._element(20, 'TasaImp', otro_imp['TasaImp'])
+            self._element(20, 'MntImp', otro_imp['MntImp'])
+            self._line(16, '</OtrosImp>')
+        if detalle.get('IVARetTotal'):
+            self._element(12, 'IVARetTotal', detalle['IVARetTotal'])
+        if detalle.get('IVARetParcial'):
+            self._element(12, 'IVARetParcial', detalle['IVARetParcial'])
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Renderizado masivo en procesos separados.
+
+Las funciones de este módulo son puras (no usan el ORM ni el cursor) para
+poder ejecutarse en un ProcessPoolExecutor. Por defecto todo se ejecuta en
+serie en el proceso actual; el pool solo se usa si quien llama lo pide
+(max_workers > 1, ver PDFGeneratorService._get_render_workers). Si el pool
+no se puede usar (plataforma sin fork, pocos elementos, pool roto), se
+ejecuta en serie con el mismo resultado.
+"""
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import logging
+_logger = logging.getLogger(__name__)
+
+try:
+    import pdf417gen
+except ImportError:
+    _logger.warning('pdf417gen library not found. TED barcode generation will not work.')
+    pdf417gen = None
+
+# Con menos elementos, levantar el pool cuesta más que renderizar en serie
+MIN_PARALLEL_ITEMS = 8
+MAX_WORKERS = 4
+
+TMST_FIRMA_RE = re.compile(r'<TmstFirma>.*?</TmstFirma>')
+
+
+def ted_barcode_content(ted_xml):
+    """
+    Contenido del código de barras: el TED sin el tag TmstFirma
+    (igual que el módulo enterprise).
+    """
+    return TMST_FIRMA_RE.sub('', ted_xml)
+
+
+def render_ted_barcode(ted_xml):
+    """
+    Genera el código de barras PDF417 del TED como imagen PNG.
+
+    Parámetros según módulo enterprise: columns=13, security_level=5,
+    padding=15, scale=1.
+
+    Args:
+        ted_xml (str): XML del TED completo con TmstFirma
+
+    Returns:
+        bytes: Imagen PNG del código de barras
+    """
+    if pdf417gen is None:
+        raise ImportError('pdf417gen library not found')
+    barcode = pdf417gen.encode(ted_barcode_content(ted_xml), columns=13, security_level=5)
+    image = pdf417gen.render_image(barcode, padding=15, scale=1)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _capture(func, item):
+    """Ejecuta func(item) retornando (resultado, error) en vez de propagar."""
+    try:
+        return func(item), None
+    except Exception as e:
+        return None, '%s: %s' % (type(e).__name__, e)
+
+
+def _pool_context():
+    # fork: el hijo hereda los módulos ya importados y no reimporta Odoo
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def run_many(func, items, max_workers=0):
+    """
+    Aplica func a cada elemento, en serie o, si max_workers > 1, en paralelo
+    en un pool de procesos.
+
+    func debe ser una función de nivel de módulo (serializable con pickle) y
+    sus argumentos y resultados, datos simples.
+
+    Args:
+        func (callable): Función pura de un argumento
+        items (list): Elementos a procesar
+        max_workers (int): Procesos del pool, acotado a MAX_WORKERS y a los
+                           CPUs (por defecto 0: en serie)
+
+    Returns:
+        list: Tuplas (resultado, error) en el mismo orden que items; error es
+              None si func no lanzó excepción
+    """
+    items = list(items)
+    context = _pool_context()
+    workers = min(max_workers or 0, MAX_WORKERS, os.cpu_count() or 1, len(items))
+
+    if context is not None and workers > 1 and len(items) >= MIN_PARALLEL_ITEMS:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                chunksize = max(1, len(items) // (workers * 4))
+                return list(executor.map(_capture, [func] * len(items), items, chunksize=chunksize))
+        except (BrokenProcessPool, OSError) as e:
+            _logger.warning('Pool de procesos no disponible (%s), se renderiza en serie', e)
+
+    return [_capture(func, item) for item in items]
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+import base64
+import functools
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from lxml import etree
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+def _text(node):
+    return node.text if node is not None else None
+
+
+class CafSigner:
+    """
+    Firma SHA1withRSA de DDs (TED) con la llave privada del CAF ya cargada.
+
+    Reemplaza a certificate.key._sign_with_key, que deserializa el PEM del
+    RSASK en cada firma.
+    """
+
+    def __init__(self, private_key):
+        self.private_key = private_key
+
+    def sign(self, dd_bytes):
+        """
+        Firma un DD ya limpio (sin saltos de línea ni indentación).
+
+        Args:
+            dd_bytes (bytes): DD codificado en ISO-8859-1
+
+        Returns:
+            str: Firma (FRMT) en base64
+        """
+        signature = self.private_key.sign(
+            dd_bytes,
+            padding.PKCS1v15(),  # SHA1withRSA usa PKCS1v15 padding
+            hashes.SHA1()  # SII requiere SHA1
+        )
+        return base64.b64encode(signature).decode()
+
+    def sign_many(self, dd_list):
+        """
+        Firma varios DDs con la misma llave.
+
+        Args:
+            dd_list (list): DDs (bytes) ya limpios
+
+        Returns:
+            list: Firmas (FRMT) en base64, en el mismo orden
+        """
+        return [self.sign(dd_bytes) for dd_bytes in dd_list]
+
+
+class CafData:
+    """
+    Contenido de un archivo CAF ya parseado.
+
+    Todo lo que el timbraje (TED) necesita del CAF se extrae una sola vez:
+    fragmento DA, bloque <CAF> serializado, rango autorizado, FA, RSAPK,
+    FRMA y la llave privada RSASK (cargada en el primer uso).
+    """
+
+    def __init__(self, caf_content):
+        """
+        Args:
+            caf_content (str): XML del CAF (decodificado en ISO-8859-1)
+        """
+        # Parsear con encoding ISO-8859-1 (formato del SII)
+        parser = etree.XMLParser(encoding='ISO-8859-1')
+        caf_root = etree.fromstring(caf_content.strip().encode('ISO-8859-1'), parser)
+
+        # Estructura: <AUTORIZACION><CAF><DA>...</DA><FRMA>...</FRMA></CAF><RSASK>...</RSASK></AUTORIZACION>
+        da = caf_root.find('.//DA')
+        if da is None:
+            raise ValueError('No se encontró el nodo DA en el CAF')
+
+        self.rut_emisor = _text(da.find('RE'))
+        self.type_code = _text(da.find('TD'))
+        self.rng_d = _text(da.find('RNG/D'))
+        self.rng_h = _text(da.find('RNG/H'))
+        self.fa = _text(da.find('FA'))
+        self.rsapk_m = _text(da.find('RSAPK/M'))
+        self.rsapk_e = _text(da.find('RSAPK/E'))
+
+        frma = caf_root.find('.//FRMA')
+        self.frma = _text(frma)
+        self.frma_algorithm = frma.get('algoritmo') if frma is not None else None
+
+        rsask = _text(caf_root.find('.//RSASK'))
+        self.rsask_pem = rsask.strip() if rsask else None
+
+        # Contenido del DA tal como se embebe en el DD del TED
+        self.da_fragment = etree.tostring(da, encoding='unicode', method='html').replace(
+            '<DA>', '').replace('</DA>', '').strip()
+
+        # Bloque <CAF> completo del DD (sin la TSTED, que cambia por documento)
+        self.caf_block = None
+        if frma is not None:
+            self.caf_block = (
+                '<CAF version="1.0">\n'
+                '<DA>\n%s\n</DA>\n'
+                '<FRMA algoritmo="%s">%s</FRMA>\n'
+                '</CAF>'
+            ) % (self.da_fragment, self.frma_algorithm, self.frma)
+
+    @property
+    def rng_start(self):
+        return int(self.rng_d) if self.rng_d else None
+
+    @property
+    def rng_end(self):
+        return int(self.rng_h) if self.rng_h else None
+
+    def covers(self, folio):
+        """
+        Indica si el folio está dentro del rango autorizado (RNG) del CAF.
+        Si el CAF no declara rango, no se restringe.
+        """
+        if self.rng_start is None or self.rng_end is None:
+            return True
+        return self.rng_start <= int(folio) <= self.rng_end
+
+    @functools.cached_property
+    def private_key(self):
+        """Llave privada RSA del CAF (RSASK), deserializada una sola vez."""
+        if not self.rsask_pem:
+            raise ValueError('No se encontró RSASK (clave privada) en el CAF')
+        return serialization.load_pem_private_key(
+            self.rsask_pem.encode('utf-8'),
+            password=None,  # CAF no tiene password en RSASK
+            backend=default_backend()
+        )
+
+    @functools.cached_property
+    def signer(self):
+        """CafSigner con la llave privada de este CAF."""
+        return CafSigner(self.private_key)
+
+
+class CafCache:
+    """
+    Caché de CAF parseados, local al proceso.
+
+    Las entradas se indexan por (id de la asignación de folios, checksum del
+    archivo CAF), de modo que un CAF reemplazado nunca coincide con una entrada
+    antigua. Además se invalidan explícitamente al modificar el CAF de la
+    asignación (ver CertificationFolioAssignment.write).
+    """
+
+    TTL = 3600
+    MAX_ENTRIES = 64
+
+    _entries = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, assignment_id, checksum, load_content):
+        """
+        Retorna el CAF parseado, parseándolo solo si no está en caché.
+
+        Args:
+            assignment_id (int): ID de l10n_cl_edi.certification.folio.assignment
+            checksum (str): Checksum del archivo CAF
+            load_content (callable): Retorna el XML del CAF (solo se llama si no está en caché)
+
+        Returns:
+            CafData
+        """
+        key = (assignment_id, checksum)
+        now = time.monotonic()
+
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+
+        caf_data = CafData(load_content())
+        _logger.debug('CAF de la asignación %s cargado en caché', assignment_id)
+
+        with cls._lock:
+            cls._evict(now)
+            cls._entries[key] = (caf_data, now + cls.TTL)
+        return caf_data
+
+    @classmethod
+    def _evict(cls, now):
+        """Elimina entradas expiradas y, si sigue lleno, las más antiguas."""
+        for key in [key for key, entry in cls._entries.items() if entry[1] <= now]:
+            del cls._entries[key]
+        while len(cls._entries) >= cls.MAX_ENTRIES:
+            del cls._entries[min(cls._entries, key=lambda key: cls._entries[key][1])]
+
+    @classmethod
+    def invalidate(cls, assignment_ids):
+        """
+        Descarta los CAF en caché de las asignaciones indicadas.
+
+        Args:
+            assignment_ids (list): IDs de l10n_cl_edi.certification.folio.assignment
+        """
+        assignment_ids = set(assignment_ids)
+        with cls._lock:
+            for key in [key for key in cls._entries if key[0] in assignment_ids]:
+                del cls._entries[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import base64
+import functools
+import hashlib
+import textwrap
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+def _format_value(value, formatting):
+    """Replica el formateo de salida de certificate.certificate / certificate.key."""
+    if formatting == 'encodebytes':
+        return base64.encodebytes(value)
+    if formatting == 'base64':
+        return base64.b64encode(value)
+    return value
+
+
+def _int_to_bytes(value):
+    return value.to_bytes((value.bit_length() + 7) // 8, 'big')
+
+
+class KeyInfoBlock:
+    """
+    Contenido del KeyInfo de la firma (RSAKeyValue + X509Data) ya formateado.
+
+    Se calcula una vez por certificado: cada firma solo necesita calcular
+    su digest y su valor RSA.
+    """
+
+    def __init__(self, certificate):
+        e, n = certificate._get_public_key_numbers_bytes(formatting='base64')
+        self.modulus = n.decode()
+        self.exponent = e.decode()
+        self.certificate = '\n' + textwrap.fill(
+            certificate._get_der_certificate_bytes(formatting='base64').decode(),
+            64
+        )
+
+
+class ClientCertificate:
+    """
+    Certificado del cliente ya decodificado (llave privada + X.509).
+
+    Expone la misma API de firma que certificate.certificate (_sign,
+    _get_public_key_numbers_bytes, _get_der_certificate_bytes) para que
+    los métodos de firma puedan usarlo sin volver a abrir el PKCS#12.
+    """
+
+    HASH_ALGORITHMS = {
+        'sha1': hashes.SHA1,
+        'sha256': hashes.SHA256,
+    }
+
+    def __init__(self, private_key, certificate):
+        self.private_key = private_key
+        self.certificate = certificate
+
+    @classmethod
+    def from_pkcs12(cls, cert_data, password):
+        """
+        Decodifica un archivo .pfx/.p12.
+
+        Args:
+            cert_data (bytes): Contenido del archivo .pfx/.p12
+            password (str): Contraseña del certificado
+
+        Returns:
+            ClientCertificate
+        """
+        private_key, certificate, _additional = pkcs12.load_key_and_certificates(
+            cert_data,
+            password.encode() if password else None,
+            backend=default_backend()
+        )
+        return cls(private_key, certificate)
+
+    @functools.cached_property
+    def key_info(self):
+        """KeyInfoBlock de este certificado (calculado en el primer uso)."""
+        return KeyInfoBlock(self)
+
+    def _sign(self, message, hashing_algorithm='sha256', formatting='encodebytes'):
+        if isinstance(message, str):
+            message = message.encode()
+        signature = self.private_key.sign(
+            message,
+            padding.PKCS1v15(),
+            self.HASH_ALGORITHMS[hashing_algorithm]()
+        )
+        return _format_value(signature, formatting)
+
+    def _get_public_key_numbers_bytes(self, formatting='encodebytes'):
+        numbers = self.private_key.public_key().public_numbers()
+        return (
+            _format_value(_int_to_bytes(numbers.e), formatting),
+            _format_value(_int_to_bytes(numbers.n), formatting),
+        )
+
+    def _get_der_certificate_bytes(self, formatting='encodebytes'):
+        return _format_value(self.certificate.public_bytes(serialization.Encoding.DER), formatting)
+
+
+class CertificateCache:
+    """
+    Caché de certificados de cliente, local al proceso.
+
+    Las entradas se indexan por (id del cliente, checksum del certificado y
+    contraseña), de modo que un certificado reemplazado en otro worker nunca
+    coincide con una entrada antigua. Además expiran tras TTL segundos y se
+    invalidan explícitamente al modificar el certificado del cliente.
+    """
+
+    TTL = 3600
+    MAX_ENTRIES = 32
+
+    _entries = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _checksum(cls, cert_data, password):
+        digest = hashlib.sha1(cert_data)
+        digest.update(b'\0')
+        digest.update((password or '').encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def get(cls, client_id, cert_data, password):
+        """
+        Retorna el certificado decodificado, cargándolo solo si no está en caché.
+
+        Args:
+            client_id (int): ID de l10n_cl_edi.certification.client (o False)
+            cert_data (bytes): Contenido del archivo .pfx/.p12
+            password (str): Contraseña del certificado
+
+        Returns:
+            ClientCertificate
+        """
+        key = (client_id or False, cls._checksum(cert_data, password))
+        now = time.monotonic()
+
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+
+        certificate = ClientCertificate.from_pkcs12(cert_data, password)
+        _logger.debug('Certificado del cliente %s cargado en caché', client_id)
+
+        with cls._lock:
+            cls._evict(now)
+            cls._entries[key] = (certificate, now + cls.TTL)
+        return certificate
+
+    @classmethod
+    def _evict(cls, now):
+        """Elimina entradas expiradas y, si sigue lleno, las más antiguas."""
+        for key in [key for key, entry in cls._entries.items() if entry[1] <= now]:
+            del cls._entries[key]
+        while len(cls._entries) >= cls.MAX_ENTRIES:
+            del cls._entries[min(cls._entries, key=lambda key: cls._entries[key][1])]
+
+    @classmethod
+    def invalidate(cls, client_ids):
+        """
+        Descarta los certificados en caché de los clientes indicados.
+
+        Args:
+            client_ids (list): IDs de l10n_cl_edi.certification.client
+        """
+        client_ids = set(client_ids)
+        with cls._lock:
+            for key in [key for key in cls._entries if key[0] in client_ids]:
+                del cls._entries[key]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
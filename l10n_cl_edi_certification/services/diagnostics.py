@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Canal de diagnóstico de firma y generación de documentos.
+
+Desactivado por defecto. Se activa solo con el nivel de log del logger
+``odoo.addons.l10n_cl_edi_certification.diagnostics``, por ejemplo:
+
+    --log-handler=odoo.addons.l10n_cl_edi_certification.diagnostics:DEBUG
+
+Cuando está activo emite una línea por operación con los tiempos de cada
+etapa (nunca el contenido de los XML). Cuando no lo está, el costo es una
+comprobación de nivel por operación.
+"""
+import contextlib
+import logging
+import time
+
+_diagnostics_logger = logging.getLogger('odoo.addons.l10n_cl_edi_certification.diagnostics')
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def diagnostics_enabled():
+    return _diagnostics_logger.isEnabledFor(logging.DEBUG)
+
+
+class _NullOperation:
+    """Operación sin diagnóstico: todas las llamadas son no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_OPERATION = _NullOperation()
+
+
+class _TimedOperation:
+    """Acumula los tiempos de cada etapa y los emite en una sola línea."""
+
+    def __init__(self, operation, fields):
+        self.operation = operation
+        self.fields = fields
+        self.stages = []
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        _diagnostics_logger.debug(
+            'op=%s status=%s %s%s total_ms=%.1f',
+            self.operation,
+            'error' if exc_type else 'ok',
+            ''.join('%s=%s ' % item for item in self.fields.items()),
+            ''.join('%s_ms=%.1f ' % item for item in self.stages),
+            total_ms,
+        )
+        return False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, (time.perf_counter() - started) * 1000))
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+
+def diagnose(operation, **fields):
+    """
+    Abre una operación de diagnóstico.
+
+    Uso:
+        with diagnose('sign_xml', company=company_id) as diag:
+            with diag.stage('parse'):
+                ...
+            diag.set(xml_type='env')
+
+    Args:
+        operation (str): Nombre de la operación
+        **fields: Campos adicionales a emitir (se formatean solo si el canal está activo)
+
+    Returns:
+        Context manager con los métodos stage(name) y set(**fields)
+    """
+    if not diagnostics_enabled():
+        return _NULL_OPERATION
+    return _TimedOperation(operation, fields)
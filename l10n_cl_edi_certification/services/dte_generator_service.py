@@ -222,7 +222,7 @@ class DteGeneratorService(models.AbstractModel):
 
         # Validación: siempre debe haber al menos un detalle
         if not detalle:
-            print('❌ ERROR CRÍTICO: No se generó ningún detalle')
+            _logger.error('No se generó ningún detalle para el caso %s, se usa un item de emergencia', case.name)
             detalle.append({
                 'NroLinDet': 1,
                 'NmbItem': 'Item de emergencia',
@@ -280,7 +280,7 @@ class DteGeneratorService(models.AbstractModel):
             },
             'Detalle': detalle,
             'DscRcgGlobal': desc_rcg_global if desc_rcg_global else False,
-            'Referencia': referencias if referencias else False,
+            'Referencias': referencias,
             'TmstFirma': tmst_firma,
         }
 
@@ -310,9 +310,7 @@ class DteGeneratorService(models.AbstractModel):
 
         # Verificar si el XML contiene elementos Detalle
         if '<Detalle>' not in xml_str:
-            print("❌ ERROR: XML NO contiene elementos <Detalle>")
-            print("Primeros 1000 caracteres del XML:")
-            print(xml_str[:1000])
+            _logger.error('El XML generado no contiene elementos <Detalle>')
 
         return xml_str
 
@@ -343,66 +341,35 @@ class DteGeneratorService(models.AbstractModel):
                 'Debe cargar un CAF que cubra este folio en "Folios Asignados".'
             ) % (folio, case.document_type_id.name))
 
-        print(f'\n✓ Datos extraídos del CAF para Folio {folio}:')
-        print(f'  Asignación Odoo: {assignment.folio_start} - {assignment.folio_end}')
-
-        # Obtener el contenido XML del CAF
+        # CAF ya parseado (se decodifica una sola vez por asignación, ver CafCache)
         try:
-            caf_content = assignment.get_caf_content()
-            # Parsear el CAF con encoding ISO-8859-1 (formato del SII)
-            # Igual que Odoo Enterprise en l10n_cl.dte.caf._decode_caf()
-            parser = etree.XMLParser(encoding='ISO-8859-1', remove_blank_text=True)
-            caf_xml = etree.fromstring(caf_content.encode('ISO-8859-1'), parser)
+            caf = assignment.get_caf_data()
+        except UserError:
+            raise
         except Exception as e:
             raise UserError(_('Error al leer el CAF: %s') % str(e))
 
-        # Extraer datos del CAF siguiendo el método de Odoo Enterprise
-        try:
-            # Estructura: //AUTORIZACION/CAF/DA
-            da_node = caf_xml.xpath('//AUTORIZACION/CAF/DA')
-            if not da_node:
-                raise UserError(_('No se encontró el nodo DA en el archivo CAF.'))
-
-            da = da_node[0]
-
-            # Extraer RNG (Rango de folios)
-            rng_d = da.xpath('RNG/D')[0].text  # Desde
-            rng_h = da.xpath('RNG/H')[0].text  # Hasta
-
-            print(f'  RNG del archivo CAF: {rng_d} - {rng_h}')
-
-            # VALIDACIÓN: Verificar que el folio esté en el rango del CAF
-            if int(folio) < int(rng_d) or int(folio) > int(rng_h):
-                raise UserError(_(
-                    '❌ ERROR CRÍTICO: El folio %s NO está en el rango del archivo CAF.\n\n'
-                    'Asignación en Odoo: %s-%s\n'
-                    'Rango en archivo CAF: %s-%s\n\n'
-                    'El archivo CAF cargado NO corresponde a la asignación.\n'
-                    'SOLUCIÓN: Sube el archivo CAF correcto en la asignación de folios %s-%s.'
-                ) % (
-                    folio,
-                    assignment.folio_start, assignment.folio_end,
-                    rng_d, rng_h,
-                    assignment.folio_start, assignment.folio_end
-                ))
-
-            print(f'  ✓ Folio {folio} está dentro del rango del CAF')
-
-            # Extraer FA (Fecha de Autorización)
-            fa = da.xpath('FA')[0].text
-
-            # Extraer RSAPK (RSA Public Key)
-            rsapk_m = da.xpath('RSAPK/M')[0].text  # Módulo
-            rsapk_e = da.xpath('RSAPK/E')[0].text  # Exponente
-
-            # Extraer FRMA (Firma del CAF)
-            frma_node = caf_xml.xpath('//AUTORIZACION/CAF/FRMA')
-            frma = frma_node[0].text if frma_node else ''
+        # Datos del CAF requeridos para el DD
+        rng_d, rng_h = caf.rng_d, caf.rng_h
+        fa, rsapk_m, rsapk_e = caf.fa, caf.rsapk_m, caf.rsapk_e
+        frma = caf.frma or ''
+        if not (rng_d and rng_h and fa and rsapk_m and rsapk_e):
+            raise UserError(_('Error al extraer datos del CAF: faltan RNG, FA o RSAPK en el nodo DA.'))
 
-        except UserError:
-            raise
-        except Exception as e:
-            raise UserError(_('Error al extraer datos del CAF: %s') % str(e))
+        # VALIDACIÓN: Verificar que el folio esté en el rango del CAF
+        if not caf.covers(folio):
+            raise UserError(_(
+                '❌ ERROR CRÍTICO: El folio %s NO está en el rango del archivo CAF.\n\n'
+                'Asignación en Odoo: %s-%s\n'
+                'Rango en archivo CAF: %s-%s\n\n'
+                'El archivo CAF cargado NO corresponde a la asignación.\n'
+                'SOLUCIÓN: Sube el archivo CAF correcto en la asignación de folios %s-%s.'
+            ) % (
+                folio,
+                assignment.folio_start, assignment.folio_end,
+                rng_d, rng_h,
+                assignment.folio_start, assignment.folio_end
+            ))
 
         # Obtener el nombre del primer item
         item1_name = dte_data['Detalle'][0]['NmbItem'] if dte_data['Detalle'] else ''
@@ -443,50 +410,15 @@ class DteGeneratorService(models.AbstractModel):
         if isinstance(dd_xml_str, Markup):
             dd_xml_str = str(dd_xml_str)
 
-        # Paso 2: Extraer RSASK (clave privada RSA) del CAF
-        try:
-            rsask_node = caf_xml.xpath('//RSASK')
-            if not rsask_node:
-                # Intentar con ruta completa
-                rsask_node = caf_xml.xpath('//AUTORIZACION/CAF/RSASK')
-
-            if not rsask_node:
-                raise UserError(_('No se encontró RSASK (clave privada) en el CAF.'))
-
-            rsask_pem = rsask_node[0].text
-            if not rsask_pem:
-                raise UserError(_('El nodo RSASK está vacío en el CAF.'))
-
-            rsask_pem = rsask_pem.strip()  # Limpiar espacios y saltos de línea
-        except Exception as e:
-            raise UserError(_('Error al extraer RSASK del CAF: %s') % str(e))
-
-        # Paso 3: Firmar el DD con RSASK usando SHA1withRSA (como lo hace Odoo Enterprise)
+        # Paso 2 y 3: Firmar el DD con RSASK usando SHA1withRSA (como lo hace Odoo Enterprise)
         import re
-        from cryptography.hazmat.primitives import hashes, serialization
-        from cryptography.hazmat.primitives.asymmetric import padding
-        from cryptography.hazmat.backends import default_backend
 
         try:
             # Limpiar el DD: remover saltos de línea y espacios (igual que Odoo Enterprise)
             dd_clean = re.sub(r'\n\s*', '', dd_xml_str)
 
-            # Cargar la clave privada RSA desde PEM
-            private_key = serialization.load_pem_private_key(
-                rsask_pem.encode('utf-8'),
-                password=None,  # CAF no tiene password en RSASK
-                backend=default_backend()
-            )
-
-            # Firmar el DD con SHA1 (algoritmo requerido por SII)
-            signature = private_key.sign(
-                dd_clean.encode('ISO-8859-1'),
-                padding.PKCS1v15(),  # SHA1withRSA usa PKCS1v15 padding
-                hashes.SHA1()  # SII requiere SHA1
-            )
-
-            # Codificar firma en base64
-            frmt = base64.b64encode(signature).decode('utf-8')
+            # Llave privada del CAF ya cargada (ver CafSigner)
+            frmt = caf.signer.sign(dd_clean.encode('ISO-8859-1'))
 
         except Exception as e:
             raise UserError(_('Error al firmar el DD con RSASK: %s') % str(e))
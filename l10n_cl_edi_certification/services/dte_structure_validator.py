@@ -0,0 +1,640 @@
+# -*- coding: utf-8 -*-
+"""
+Validación estructural de DTEs sin esquema XSD.
+
+Revisa los DTEs que emite este módulo (tipos 33, 34, 46, 52, 56 y 61) con
+tablas de reglas del formato del SII: elementos obligatorios, orden de los
+elementos, largo y formato de cada campo, aritmética de los montos
+(líneas, descuentos globales, neto, IVA y total), coherencia de las
+referencias y del TED con el documento, y los subtotales de la Carátula de
+un EnvioDTE.
+
+Cada documento se recorre con una sola pasada de iterparse y se informan
+todos los errores a la vez, por lo que es lo bastante barato para
+ejecutarse antes de cada firma (ver SignatureService.sign_many).
+"""
+import io
+import re
+from collections import Counter, namedtuple
+from datetime import date, datetime
+
+from lxml import etree
+
+SII_NS = 'http://www.sii.cl/SiiDte'
+SII_PREFIX = '{%s}' % SII_NS
+
+XML_DECLARATION_RE = re.compile(r'^\s*<\?xml[^>]+\?>\s*')
+
+# Tolerancia de redondeo en la aritmética de montos (pesos)
+AMOUNT_TOLERANCE = 1
+
+# Tipos de DTE: nombre, si es exento (todas las líneas van a MntExe) y si
+# requiere una referencia con CodRef (notas de crédito y débito)
+DteType = namedtuple('DteType', 'name exempt requires_reference')
+DTE_TYPES = {
+    '33': DteType('Factura Electrónica', False, False),
+    '34': DteType('Factura No Afecta o Exenta Electrónica', True, False),
+    '46': DteType('Factura de Compra Electrónica', False, False),
+    '52': DteType('Guía de Despacho Electrónica', False, False),
+    '56': DteType('Nota de Débito Electrónica', False, True),
+    '61': DteType('Nota de Crédito Electrónica', False, True),
+}
+
+# Códigos de ImptoReten que son IVA retenido (se descuentan del total);
+# los demás impuestos adicionales se suman
+IVA_RETENIDO_CODES = {'15', '30', '31', '32', '33', '34', '36', '37', '38', '39', '41', '47', '48'}
+
+# Contenedores: secuencia de hijos (orden del XSD), obligatorios y máximo de
+# ocurrencias de los que se pueden repetir (el resto, una vez)
+ContainerRule = namedtuple('ContainerRule', 'sequence required max_occurs')
+
+CONTAINER_RULES = {
+    'EnvioDTE': ContainerRule(('SetDTE',), ('SetDTE',), {}),
+    'SetDTE': ContainerRule(('Caratula', 'DTE'), ('Caratula', 'DTE'), {'DTE': 2000}),
+    'Caratula': ContainerRule(
+        ('RutEmisor', 'RutEnvia', 'RutReceptor', 'FchResol', 'NroResol', 'TmstFirmaEnv', 'SubTotDTE'),
+        ('RutEmisor', 'RutEnvia', 'RutReceptor', 'FchResol', 'NroResol', 'TmstFirmaEnv', 'SubTotDTE'),
+        {'SubTotDTE': 20},
+    ),
+    'SubTotDTE': ContainerRule(('TpoDTE', 'NroDTE'), ('TpoDTE', 'NroDTE'), {}),
+    'DTE': ContainerRule(('Documento',), ('Documento',), {}),
+    'Documento': ContainerRule(
+        ('Encabezado', 'Detalle', 'SubTotInfo', 'DscRcgGlobal', 'Referencia', 'Comisiones', 'TED', 'TmstFirma'),
+        ('Encabezado', 'Detalle', 'TED', 'TmstFirma'),
+        {'Detalle': 60, 'SubTotInfo': 20, 'DscRcgGlobal': 20, 'Referencia': 40, 'Comisiones': 20},
+    ),
+    'Encabezado': ContainerRule(
+        ('IdDoc', 'Emisor', 'RUTMandante', 'Receptor', 'RUTSolicita', 'Transporte', 'Totales', 'OtraMoneda'),
+        ('IdDoc', 'Emisor', 'Receptor', 'Totales'),
+        {},
+    ),
+    'IdDoc': ContainerRule(
+        ('TipoDTE', 'Folio', 'FchEmis', 'IndNoRebaja', 'TipoDespacho', 'IndTraslado', 'TpoImpresion',
+         'IndServicio', 'MntBruto', 'TpoTranCompra', 'TpoTranVenta', 'FmaPago', 'FmaPagExp', 'FchCancel',
+         'MntCancel', 'SaldoInsol', 'MntPagos', 'PeriodoDesde', 'PeriodoHasta', 'MedioPago', 'TpoCtaPago',
+         'NumCtaPago', 'BcoPago', 'TermPagoCdg', 'TermPagoGlosa', 'TermPagoDias', 'FchVenc'),
+        ('TipoDTE', 'Folio', 'FchEmis'),
+        {'MntPagos': 30},
+    ),
+    'Emisor': ContainerRule(
+        ('RUTEmisor', 'RznSoc', 'GiroEmis', 'Telefono', 'CorreoEmisor', 'Acteco', 'GuiaExport', 'Sucursal',
+         'CdgSIISucur', 'DirOrigen', 'CmnaOrigen', 'CiudadOrigen', 'CdgVendedor', 'IdAdicEmisor'),
+        ('RUTEmisor', 'RznSoc', 'GiroEmis', 'Acteco'),
+        {'Telefono': 2, 'Acteco': 4},
+    ),
+    'Receptor': ContainerRule(
+        ('RUTRecep', 'CdgIntRecep', 'RznSocRecep', 'Extranjero', 'GiroRecep', 'Contacto', 'CorreoRecep',
+         'DirRecep', 'CmnaRecep', 'CiudadRecep', 'DirPostal', 'CmnaPostal', 'CiudadPostal'),
+        ('RUTRecep', 'RznSocRecep'),
+        {},
+    ),
+    'Totales': ContainerRule(
+        ('MntNeto', 'MntExe', 'MntBase', 'MntMargenCom', 'TasaIVA', 'IVA', 'IVAProp', 'IVATerc', 'ImptoReten',
+         'IVANoRet', 'CredEC', 'GrntDep', 'Comisiones', 'MntTotal', 'MontoNF', 'MontoPeriodo',
+         'SaldoAnterior', 'VlrPagar'),
+        ('MntTotal',),
+        {'ImptoReten': 20},
+    ),
+    'ImptoReten': ContainerRule(('TipoImp', 'TasaImp', 'MontoImp'), ('TipoImp', 'MontoImp'), {}),
+    'Detalle': ContainerRule(
+        ('NroLinDet', 'CdgItem', 'IndExe', 'Retenedor', 'NmbItem', 'DscItem', 'QtyRef', 'UnmdRef', 'PrcRef',
+         'QtyItem', 'Subcantidad', 'FchElabor', 'FchVencim', 'UnmdItem', 'PrcItem', 'OtrMnda',
+         'DescuentoPct', 'DescuentoMonto', 'SubDscto', 'RecargoPct', 'RecargoMonto', 'SubRecargo',
+         'CodImpAdic', 'MontoItem'),
+        ('NroLinDet', 'NmbItem', 'MontoItem'),
+        {'CdgItem': 5, 'Subcantidad': 5, 'SubDscto': 5, 'SubRecargo': 5, 'CodImpAdic': 2},
+    ),
+    'DscRcgGlobal': ContainerRule(
+        ('NroLinDR', 'TpoMov', 'GlosaDR', 'TpoValor', 'ValorDR', 'ValorDROtrMnda', 'IndExeDR'),
+        ('NroLinDR', 'TpoMov', 'TpoValor', 'ValorDR'),
+        {},
+    ),
+    'Referencia': ContainerRule(
+        ('NroLinRef', 'TpoDocRef', 'IndGlobal', 'FolioRef', 'RUTOtr', 'FchRef', 'CodRef', 'RazonRef'),
+        ('NroLinRef', 'TpoDocRef', 'FolioRef', 'FchRef'),
+        {},
+    ),
+}
+
+# Campos: (contenedor, campo) -> (tipo, parámetro)
+#   text: largo máximo; int: dígitos máximos; amount: monto entero no
+#   negativo de hasta 18 dígitos; decimal: (dígitos enteros, decimales);
+#   enum: valores permitidos; rut, date y datetime: sin parámetro
+FIELD_RULES = {
+    ('Caratula', 'RutEmisor'): ('rut', None),
+    ('Caratula', 'RutEnvia'): ('rut', None),
+    ('Caratula', 'RutReceptor'): ('rut', None),
+    ('Caratula', 'FchResol'): ('date', None),
+    ('Caratula', 'NroResol'): ('int', 6),
+    ('Caratula', 'TmstFirmaEnv'): ('datetime', None),
+    ('SubTotDTE', 'TpoDTE'): ('int', 3),
+    ('SubTotDTE', 'NroDTE'): ('int', 5),
+
+    ('Documento', 'TmstFirma'): ('datetime', None),
+
+    ('IdDoc', 'TipoDTE'): ('int', 3),
+    ('IdDoc', 'Folio'): ('int', 10),
+    ('IdDoc', 'FchEmis'): ('date', None),
+    ('IdDoc', 'TipoDespacho'): ('enum', ('1', '2', '3')),
+    ('IdDoc', 'IndTraslado'): ('enum', ('1', '2', '3', '4', '5', '6', '7', '8', '9')),
+    ('IdDoc', 'IndServicio'): ('enum', ('1', '2', '3', '4')),
+    ('IdDoc', 'FmaPago'): ('enum', ('1', '2', '3')),
+    ('IdDoc', 'FchVenc'): ('date', None),
+
+    ('Emisor', 'RUTEmisor'): ('rut', None),
+    ('Emisor', 'RznSoc'): ('text', 100),
+    ('Emisor', 'GiroEmis'): ('text', 80),
+    ('Emisor', 'Telefono'): ('text', 20),
+    ('Emisor', 'CorreoEmisor'): ('text', 80),
+    ('Emisor', 'Acteco'): ('int', 6),
+    ('Emisor', 'Sucursal'): ('text', 20),
+    ('Emisor', 'CdgSIISucur'): ('int', 9),
+    ('Emisor', 'DirOrigen'): ('text', 70),
+    ('Emisor', 'CmnaOrigen'): ('text', 20),
+    ('Emisor', 'CiudadOrigen'): ('text', 20),
+    ('Emisor', 'CdgVendedor'): ('text', 60),
+
+    ('Receptor', 'RUTRecep'): ('rut', None),
+    ('Receptor', 'CdgIntRecep'): ('text', 20),
+    ('Receptor', 'RznSocRecep'): ('text', 100),
+    ('Receptor', 'GiroRecep'): ('text', 40),
+    ('Receptor', 'Contacto'): ('text', 80),
+    ('Receptor', 'CorreoRecep'): ('text', 80),
+    ('Receptor', 'DirRecep'): ('text', 70),
+    ('Receptor', 'CmnaRecep'): ('text', 20),
+    ('Receptor', 'CiudadRecep'): ('text', 20),
+
+    ('Totales', 'MntNeto'): ('amount', None),
+    ('Totales', 'MntExe'): ('amount', None),
+    ('Totales', 'TasaIVA'): ('decimal', (3, 2)),
+    ('Totales', 'IVA'): ('amount', None),
+    ('Totales', 'IVANoRet'): ('amount', None),
+    ('Totales', 'MntTotal'): ('amount', None),
+    ('ImptoReten', 'TipoImp'): ('int', 3),
+    ('ImptoReten', 'TasaImp'): ('decimal', (3, 2)),
+    ('ImptoReten', 'MontoImp'): ('amount', None),
+
+    ('Detalle', 'NroLinDet'): ('int', 4),
+    ('Detalle', 'IndExe'): ('enum', ('1', '2', '3', '4', '5', '6')),
+    ('Detalle', 'NmbItem'): ('text', 80),
+    ('Detalle', 'DscItem'): ('text', 1000),
+    ('Detalle', 'QtyItem'): ('decimal', (12, 6)),
+    ('Detalle', 'UnmdItem'): ('text', 4),
+    ('Detalle', 'PrcItem'): ('decimal', (12, 6)),
+    ('Detalle', 'DescuentoPct'): ('decimal', (3, 2)),
+    ('Detalle', 'DescuentoMonto'): ('amount', None),
+    ('Detalle', 'RecargoPct'): ('decimal', (3, 2)),
+    ('Detalle', 'RecargoMonto'): ('amount', None),
+    ('Detalle', 'MontoItem'): ('amount', None),
+
+    ('DscRcgGlobal', 'NroLinDR'): ('int', 2),
+    ('DscRcgGlobal', 'TpoMov'): ('enum', ('D', 'R')),
+    ('DscRcgGlobal', 'GlosaDR'): ('text', 45),
+    ('DscRcgGlobal', 'TpoValor'): ('enum', ('%', '$')),
+    ('DscRcgGlobal', 'ValorDR'): ('decimal', (16, 2)),
+    ('DscRcgGlobal', 'IndExeDR'): ('enum', ('1', '2')),
+
+    ('Referencia', 'NroLinRef'): ('int', 2),
+    ('Referencia', 'TpoDocRef'): ('text', 3),
+    ('Referencia', 'IndGlobal'): ('enum', ('1',)),
+    ('Referencia', 'FolioRef'): ('text', 18),
+    ('Referencia', 'RUTOtr'): ('rut', None),
+    ('Referencia', 'FchRef'): ('date', None),
+    ('Referencia', 'CodRef'): ('enum', ('1', '2', '3')),
+    ('Referencia', 'RazonRef'): ('text', 90),
+}
+
+RUT_RE = re.compile(r'^\d{1,8}-[\dK]$')
+DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$')
+
+
+def _compile_container_rules(rules):
+    """Índice de posición de cada hijo en la secuencia de su contenedor."""
+    return {
+        container: (rule, {child: position for position, child in enumerate(rule.sequence)})
+        for container, rule in rules.items()
+    }
+
+
+def _compile_field_check(kind, param):
+    """
+    Retorna la función que valida el texto de un campo: texto -> mensaje de
+    error o None.
+    """
+    if kind == 'text':
+        return lambda text: 'excede el largo máximo de %s (%s)' % (param, len(text)) if len(text) > param else None
+    if kind == 'int':
+        pattern = re.compile(r'^\d{1,%d}$' % param)
+        return lambda text: None if pattern.match(text) else 'debe ser un entero de hasta %s dígitos' % param
+    if kind == 'amount':
+        pattern = re.compile(r'^\d{1,18}$')
+        return lambda text: None if pattern.match(text) else 'debe ser un monto entero no negativo'
+    if kind == 'decimal':
+        digits, decimals = param
+        pattern = re.compile(r'^\d{1,%d}(\.\d{1,%d})?$' % (digits, decimals))
+        return lambda text: None if pattern.match(text) else (
+            'debe ser un número con hasta %s enteros y %s decimales' % (digits, decimals))
+    if kind == 'enum':
+        return lambda text: None if text in param else 'valor "%s" no permitido (%s)' % (text, ', '.join(param))
+    if kind == 'rut':
+        return lambda text: None if RUT_RE.match(text) else 'RUT "%s" inválido (formato 12345678-9)' % text
+    if kind == 'date':
+        def check_date(text):
+            try:
+                date.fromisoformat(text)
+            except ValueError:
+                return 'fecha "%s" inválida (formato AAAA-MM-DD)' % text
+            return None
+        return check_date
+    if kind == 'datetime':
+        def check_datetime(text):
+            if not DATETIME_RE.match(text):
+                return 'fecha y hora "%s" inválida (formato AAAA-MM-DDTHH:MM:SS)' % text
+            try:
+                datetime.fromisoformat(text)
+            except ValueError:
+                return 'fecha y hora "%s" inválida' % text
+            return None
+        return check_datetime
+    raise ValueError('Tipo de campo desconocido: %s' % kind)
+
+
+_CONTAINERS = _compile_container_rules(CONTAINER_RULES)
+_FIELD_CHECKS = {key: _compile_field_check(kind, param) for key, (kind, param) in FIELD_RULES.items()}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _round(value):
+    """Redondeo aritmético (0.5 hacia arriba), como el SII."""
+    return int(value + 0.5) if value >= 0 else -int(-value + 0.5)
+
+
+class _Frame:
+    """Elemento abierto durante el recorrido: hijos vistos y campos leídos."""
+
+    __slots__ = ('name', 'children', 'values', 'records')
+
+    def __init__(self, name):
+        self.name = name
+        self.children = []
+        self.values = {}
+        self.records = None
+
+
+class _DocumentState:
+    """Datos de un Documento reunidos durante el recorrido."""
+
+    def __init__(self, document_id):
+        self.document_id = document_id
+        self.errors = []
+        self.sections = {}
+        self.lines = []
+        self.discounts = []
+        self.references = []
+        self.retentions = []
+
+
+class DteStructureValidator:
+    """
+    Valida la estructura de un DTE o de un EnvioDTE (con todos sus DTEs) en
+    una sola pasada de iterparse.
+
+    Uso:
+        errors = DteStructureValidator().validate(xml, root_tag='EnvioDTE')
+    """
+
+    def validate(self, xml, root_tag='DTE'):
+        """
+        Args:
+            xml (str | bytes): XML a validar (firmado o no)
+            root_tag (str): Elemento raíz esperado ('DTE' o 'EnvioDTE')
+
+        Returns:
+            list: Errores encontrados; vacía si la estructura es válida
+        """
+        if isinstance(xml, str):
+            xml = XML_DECLARATION_RE.sub('', xml).encode('utf-8')
+
+        self._root_tag = root_tag
+        self._errors = []
+        self._stack = []
+        self._document = None
+        self._documents = []
+        self._caratula = None
+        self._subtotals = []
+        skip_depth = 0
+
+        try:
+            for event, element in etree.iterparse(io.BytesIO(xml), events=('start', 'end')):
+                tag = element.tag
+                # Elementos fuera del namespace del SII (p. ej. ds:Signature) se omiten
+                if skip_depth or not tag.startswith(SII_PREFIX):
+                    if event == 'start':
+                        skip_depth += 1
+                    else:
+                        skip_depth -= 1
+                    continue
+
+                name = tag[len(SII_PREFIX):]
+                if event == 'start':
+                    self._start(name, element)
+                else:
+                    self._end(name, element)
+        except etree.XMLSyntaxError as e:
+            return self._errors + ['Error de sintaxis XML: %s' % e]
+
+        if not self._documents and not self._errors:
+            self._errors.append('El XML no contiene ningún Documento')
+        if root_tag == 'EnvioDTE' and self._caratula is not None:
+            self._check_caratula()
+        return self._errors
+
+    # ------------------------------------------------------------------
+    # Recorrido
+    # ------------------------------------------------------------------
+
+    def _start(self, name, element):
+        if not self._stack:
+            if name != self._root_tag:
+                self._errors.append('El elemento raíz es %s (se esperaba %s)' % (name, self._root_tag))
+        else:
+            self._stack[-1].children.append(name)
+        if name == 'Documento':
+            self._document = _DocumentState(element.get('ID') or 'Documento %s' % (len(self._documents) + 1))
+        self._stack.append(_Frame(name))
+
+    def _end(self, name, element):
+        frame = self._stack.pop()
+        parent = self._stack[-1] if self._stack else None
+
+        if name in _CONTAINERS:
+            self._check_container(frame)
+        elif parent is not None and not frame.children:
+            text = (element.text or '').strip()
+            parent.values.setdefault(name, text)
+            check = _FIELD_CHECKS.get((parent.name, name))
+            if check is not None:
+                # Un campo opcional vacío (p. ej. <DscItem/>) no es un error
+                if text:
+                    error = check(text)
+                elif parent.name in _CONTAINERS and name in _CONTAINERS[parent.name][0].required:
+                    error = 'está vacío'
+                else:
+                    error = None
+                if error:
+                    self._error('%s/%s %s' % (parent.name, name, error))
+
+        self._collect(name, frame, parent)
+        element.clear(keep_tail=True)
+
+    def _collect(self, name, frame, parent):
+        """Guarda los campos leídos para las validaciones de documento."""
+        document = self._document
+        if name in ('IdDoc', 'Emisor', 'Receptor', 'Totales', 'DD') and document is not None:
+            document.sections[name] = frame.values
+        elif name == 'Detalle' and document is not None:
+            document.lines.append(frame.values)
+        elif name == 'DscRcgGlobal' and document is not None:
+            document.discounts.append(frame.values)
+        elif name == 'Referencia' and document is not None:
+            document.references.append(frame.values)
+        elif name == 'ImptoReten' and document is not None:
+            document.retentions.append(frame.values)
+        elif name == 'Caratula':
+            self._caratula = frame.values
+        elif name == 'SubTotDTE':
+            self._subtotals.append(frame.values)
+        elif name == 'Documento' and document is not None:
+            self._check_document(document)
+            self._documents.append(document)
+            self._document = None
+
+    def _error(self, message):
+        if self._document is not None:
+            self._document.errors.append(message)
+        else:
+            self._errors.append(message)
+
+    # ------------------------------------------------------------------
+    # Estructura
+    # ------------------------------------------------------------------
+
+    def _check_container(self, frame):
+        rule, positions = _CONTAINERS[frame.name]
+        counts = Counter()
+        last_position = -1
+        last_child = None
+        for child in frame.children:
+            position = positions.get(child)
+            if position is None:
+                self._error('%s: elemento %s no permitido' % (frame.name, child))
+                continue
+            counts[child] += 1
+            if position < last_position:
+                self._error('%s: %s debe ir antes de %s' % (frame.name, child, last_child))
+            else:
+                last_position, last_child = position, child
+        for child in rule.required:
+            if not counts[child]:
+                self._error('%s: falta el elemento obligatorio %s' % (frame.name, child))
+        for child, count in counts.items():
+            max_occurs = rule.max_occurs.get(child, 1)
+            if count > max_occurs:
+                self._error('%s: %s aparece %s veces (máximo %s)' % (frame.name, child, count, max_occurs))
+
+    # ------------------------------------------------------------------
+    # Reglas de documento
+    # ------------------------------------------------------------------
+
+    def _check_document(self, document):
+        id_doc = document.sections.get('IdDoc', {})
+        doc_type = id_doc.get('TipoDTE')
+        dte_type = DTE_TYPES.get(doc_type)
+        if doc_type and dte_type is None:
+            document.errors.append('TipoDTE %s no soportado (se esperan %s)' % (doc_type, ', '.join(DTE_TYPES)))
+
+        folio = id_doc.get('Folio')
+        if doc_type and folio and document.document_id != 'F%sT%s' % (folio, doc_type):
+            document.errors.append('ID del Documento (%s) no corresponde a Folio %s y TipoDTE %s'
+                                   % (document.document_id, folio, doc_type))
+
+        self._check_numbering(document, document.lines, 'Detalle', 'NroLinDet')
+        self._check_numbering(document, document.discounts, 'DscRcgGlobal', 'NroLinDR')
+        self._check_numbering(document, document.references, 'Referencia', 'NroLinRef')
+
+        for line in document.lines:
+            self._check_line_amount(document, line)
+        if dte_type is not None:
+            self._check_totals(document, dte_type)
+            self._check_references(document, dte_type)
+        self._check_ted(document)
+
+        label = document.document_id
+        self._errors.extend('%s: %s' % (label, error) for error in document.errors)
+
+    @staticmethod
+    def _check_numbering(document, records, name, field):
+        numbers = [_to_int(record.get(field)) for record in records]
+        if numbers != list(range(1, len(records) + 1)):
+            document.errors.append('%s: %s debe ser correlativo desde 1 (%s)'
+                                   % (name, field, ', '.join(str(record.get(field)) for record in records)))
+
+    @staticmethod
+    def _check_line_amount(document, line):
+        qty = _to_float(line.get('QtyItem'))
+        price = _to_float(line.get('PrcItem'))
+        amount = _to_int(line.get('MontoItem'))
+        if qty is None or price is None or amount is None:
+            return
+        base = qty * price
+        discount = _to_int(line.get('DescuentoMonto'))
+        if discount is None and line.get('DescuentoPct'):
+            discount = _round(base * (_to_float(line['DescuentoPct']) or 0) / 100)
+        surcharge = _to_int(line.get('RecargoMonto'))
+        if surcharge is None and line.get('RecargoPct'):
+            surcharge = _round(base * (_to_float(line['RecargoPct']) or 0) / 100)
+        expected = _round(base) - (discount or 0) + (surcharge or 0)
+        if abs(expected - amount) > AMOUNT_TOLERANCE:
+            document.errors.append(
+                'Detalle %s: MontoItem (%s) no corresponde a QtyItem × PrcItem - descuento + recargo (%s)'
+                % (line.get('NroLinDet'), amount, expected))
+
+    @staticmethod
+    def _check_totals(document, dte_type):
+        totales = document.sections.get('Totales', {})
+        neto = _to_int(totales.get('MntNeto')) or 0
+        exento = _to_int(totales.get('MntExe')) or 0
+        iva = _to_int(totales.get('IVA')) or 0
+        total = _to_int(totales.get('MntTotal'))
+
+        if dte_type.exempt:
+            # TasaIVA se informa igual en los exentos (los generadores la
+            # emiten siempre); lo que no corresponde es un monto afecto o IVA
+            for field in ('MntNeto', 'IVA'):
+                if totales.get(field) and _to_float(totales[field]):
+                    document.errors.append('Totales: %s no corresponde en una %s' % (field, dte_type.name))
+        elif neto and not totales.get('TasaIVA'):
+            document.errors.append('Totales: falta TasaIVA (hay MntNeto)')
+
+        # Suma de las líneas afectas y exentas, con los descuentos/recargos globales
+        lines_neto = lines_exento = 0
+        for line in document.lines:
+            amount = _to_int(line.get('MontoItem')) or 0
+            ind_exe = line.get('IndExe')
+            if dte_type.exempt or ind_exe == '1':
+                lines_exento += amount
+            elif not ind_exe:
+                lines_neto += amount
+        expected_neto, expected_exento = lines_neto, lines_exento
+        for discount in document.discounts:
+            exempt = discount.get('IndExeDR') == '1'
+            base = lines_exento if exempt else lines_neto
+            value = _to_float(discount.get('ValorDR')) or 0
+            amount = _round(base * value / 100) if discount.get('TpoValor') == '%' else _round(value)
+            if discount.get('TpoMov') == 'D':
+                amount = -amount
+            if exempt:
+                expected_exento += amount
+            else:
+                expected_neto += amount
+
+        if abs(expected_neto - neto) > AMOUNT_TOLERANCE:
+            document.errors.append('Totales: MntNeto (%s) no corresponde a la suma de las líneas afectas (%s)'
+                                   % (neto, expected_neto))
+        if abs(expected_exento - exento) > AMOUNT_TOLERANCE:
+            document.errors.append('Totales: MntExe (%s) no corresponde a la suma de las líneas exentas (%s)'
+                                   % (exento, expected_exento))
+
+        tasa = _to_float(totales.get('TasaIVA'))
+        if tasa is not None and not dte_type.exempt:
+            expected_iva = _round(neto * tasa / 100)
+            if abs(expected_iva - iva) > AMOUNT_TOLERANCE:
+                document.errors.append('Totales: IVA (%s) no corresponde al %s%% de MntNeto (%s)'
+                                       % (iva, totales['TasaIVA'], expected_iva))
+
+        if total is not None:
+            expected_total = neto + exento + iva
+            for retention in document.retentions:
+                amount = _to_int(retention.get('MontoImp')) or 0
+                expected_total += -amount if retention.get('TipoImp') in IVA_RETENIDO_CODES else amount
+            if abs(expected_total - total) > AMOUNT_TOLERANCE:
+                document.errors.append(
+                    'Totales: MntTotal (%s) no corresponde a MntNeto + MntExe + IVA ± impuestos (%s)'
+                    % (total, expected_total))
+
+    @staticmethod
+    def _check_references(document, dte_type):
+        fch_emis = document.sections.get('IdDoc', {}).get('FchEmis')
+        for reference in document.references:
+            fch_ref = reference.get('FchRef')
+            if fch_ref and fch_emis and fch_ref > fch_emis:
+                document.errors.append('Referencia %s: FchRef (%s) es posterior a FchEmis (%s)'
+                                       % (reference.get('NroLinRef'), fch_ref, fch_emis))
+            if reference.get('CodRef') and not (reference.get('TpoDocRef') or '').isdigit():
+                document.errors.append('Referencia %s: CodRef solo corresponde a referencias a un DTE (TpoDocRef %s)'
+                                       % (reference.get('NroLinRef'), reference.get('TpoDocRef')))
+
+        if not dte_type.requires_reference:
+            return
+        modifying = [reference for reference in document.references if reference.get('CodRef')]
+        if not modifying:
+            document.errors.append('Una %s debe referenciar el documento que modifica (Referencia con CodRef)'
+                                   % dte_type.name)
+        if any(reference.get('CodRef') == '2' for reference in modifying):
+            total = _to_int(document.sections.get('Totales', {}).get('MntTotal'))
+            if total:
+                document.errors.append('Con CodRef 2 (corrige texto) MntTotal debe ser 0 (%s)' % total)
+
+    @staticmethod
+    def _check_ted(document):
+        dd = document.sections.get('DD')
+        if dd is None:
+            return
+        id_doc = document.sections.get('IdDoc', {})
+        emisor = document.sections.get('Emisor', {})
+        receptor = document.sections.get('Receptor', {})
+        totales = document.sections.get('Totales', {})
+        for dd_field, name, value in (
+            ('RE', 'RUTEmisor', emisor.get('RUTEmisor')),
+            ('TD', 'TipoDTE', id_doc.get('TipoDTE')),
+            ('F', 'Folio', id_doc.get('Folio')),
+            ('FE', 'FchEmis', id_doc.get('FchEmis')),
+            ('RR', 'RUTRecep', receptor.get('RUTRecep')),
+            ('MNT', 'MntTotal', totales.get('MntTotal')),
+        ):
+            if dd.get(dd_field) != value:
+                document.errors.append('TED: DD/%s (%s) no coincide con %s (%s)' % (dd_field, dd.get(dd_field), name, value))
+
+    # ------------------------------------------------------------------
+    # Sobre
+    # ------------------------------------------------------------------
+
+    def _check_caratula(self):
+        rut_emisor = self._caratula.get('RutEmisor')
+        for document in self._documents:
+            document_rut = document.sections.get('Emisor', {}).get('RUTEmisor')
+            if rut_emisor and document_rut and document_rut != rut_emisor:
+                self._errors.append('%s: RUTEmisor (%s) no coincide con RutEmisor de la Carátula (%s)'
+                                    % (document.document_id, document_rut, rut_emisor))
+
+        actual = Counter(document.sections.get('IdDoc', {}).get('TipoDTE') for document in self._documents)
+        declared = Counter()
+        for subtotal in self._subtotals:
+            declared[subtotal.get('TpoDTE')] += _to_int(subtotal.get('NroDTE')) or 0
+        for doc_type in sorted(set(actual) | set(declared), key=str):
+            if actual[doc_type] != declared[doc_type]:
+                self._errors.append('Caratula: SubTotDTE declara %s documentos tipo %s y el sobre contiene %s'
+                                    % (declared[doc_type], doc_type, actual[doc_type]))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Planificación de sobres de envío (EnvioDTE).
+
+Reparte un conjunto de documentos en varios sobres respetando límites de
+tamaño y de cantidad de documentos, sin separar una factura de las NC/ND
+que la referencian.
+"""
+import logging
+_logger = logging.getLogger(__name__)
+
+# Orden de prioridad de tipos: 33, 34, 39 (facturas) → 61 (NC) → 56 (ND)
+DOCUMENT_TYPE_ORDER = {
+    '33': 1,  # Factura Electrónica
+    '34': 2,  # Factura no Afecta o Exenta
+    '39': 3,  # Boleta Electrónica
+    '61': 4,  # Nota de Crédito (debe ir después de facturas)
+    '56': 5,  # Nota de Débito (debe ir después de todo)
+}
+
+# Bytes del sobre fuera de los DTEs (Carátula, firma y certificado)
+ENVELOPE_OVERHEAD_BYTES = 8 * 1024
+
+
+def document_sort_key(doc):
+    """
+    Orden de los documentos dentro de un sobre: las facturas van PRIMERO y
+    luego las NC/ND que las referencian (evita error REF-3-750 del SII).
+    Ordena por: 1) tipo de documento, 2) folio.
+    """
+    return (DOCUMENT_TYPE_ORDER.get(doc.document_type_code, 99), doc.folio)
+
+
+class EnvelopePlanner:
+    """
+    Divide documentos en sobres con un máximo de bytes y de documentos.
+
+    Los documentos se agrupan primero por referencia (una factura junto a las
+    NC/ND que la referencian, y las ND que referencian esas NC), y los grupos
+    se asignan completos a los sobres en el orden de document_sort_key. Así
+    ningún sobre contiene una NC/ND cuyo documento de referencia viaja en otro
+    sobre, salvo que el grupo por sí solo supere los límites.
+    """
+
+    def __init__(self, max_bytes, max_documents):
+        """
+        Args:
+            max_bytes (int): Tamaño máximo de cada sobre (0 = sin límite)
+            max_documents (int): Documentos máximos por sobre (0 = sin límite)
+        """
+        self.max_bytes = max_bytes
+        self.max_documents = max_documents
+
+    def plan(self, documents, sizes):
+        """
+        Args:
+            documents: Documentos (l10n_cl_edi.certification.generated.document
+                u objetos con document_type_code, folio, reference_doc_type y
+                reference_folio)
+            sizes (dict): Documento -> tamaño en bytes de su XML firmado
+
+        Returns:
+            list: Listas de documentos, una por sobre, cada una ordenada por
+                  document_sort_key
+        """
+        shards = []
+        current, current_bytes = [], ENVELOPE_OVERHEAD_BYTES
+        for group in self._reference_groups(documents):
+            group_bytes = sum(sizes.get(doc, 0) for doc in group)
+            if current and not self._fits(len(current) + len(group), current_bytes + group_bytes):
+                shards.append(current)
+                current, current_bytes = [], ENVELOPE_OVERHEAD_BYTES
+
+            if self._fits(len(group), ENVELOPE_OVERHEAD_BYTES + group_bytes):
+                current.extend(group)
+                current_bytes += group_bytes
+                continue
+
+            # El grupo no cabe ni en un sobre vacío: se reparte en orden
+            _logger.warning(
+                'El documento %s y sus referencias (%d documentos) superan el límite '
+                'de un sobre; se enviarán en sobres distintos', group[0].folio, len(group))
+            for doc in group:
+                if current and not self._fits(len(current) + 1, current_bytes + sizes.get(doc, 0)):
+                    shards.append(current)
+                    current, current_bytes = [], ENVELOPE_OVERHEAD_BYTES
+                current.append(doc)
+                current_bytes += sizes.get(doc, 0)
+
+        if current:
+            shards.append(current)
+        return [sorted(shard, key=document_sort_key) for shard in shards]
+
+    def _fits(self, documents_count, size):
+        if self.max_documents and documents_count > self.max_documents:
+            return False
+        if self.max_bytes and size > self.max_bytes:
+            return False
+        return True
+
+    @staticmethod
+    def _reference_groups(documents):
+        """
+        Agrupa cada NC/ND con el documento que referencia (si está en el
+        conjunto), transitivamente.
+
+        Returns:
+            list: Grupos de documentos ordenados por document_sort_key, en
+                  el orden del primer documento de cada grupo
+        """
+        documents = list(documents)
+        by_key = {(doc.document_type_code, doc.folio): doc for doc in documents}
+        parent = {doc: doc for doc in documents}
+
+        def find(doc):
+            while parent[doc] is not doc:
+                parent[doc] = parent[parent[doc]]
+                doc = parent[doc]
+            return doc
+
+        for doc in documents:
+            if doc.reference_doc_type and doc.reference_folio:
+                referenced = by_key.get((doc.reference_doc_type, doc.reference_folio))
+                if referenced is not None:
+                    parent[find(doc)] = find(referenced)
+
+        groups = {}
+        for doc in documents:
+            groups.setdefault(find(doc), []).append(doc)
+        return sorted(
+            (sorted(group, key=document_sort_key) for group in groups.values()),
+            key=lambda group: document_sort_key(group[0]),
+        )
@@ -2,11 +2,22 @@
 from odoo import models, api, _
 from odoo.exceptions import UserError
 import base64
+import io
+import re
 from datetime import datetime
 import pytz
+from lxml import etree
+
+from .envelope_planner import EnvelopePlanner, document_sort_key
+
 import logging
 _logger = logging.getLogger(__name__)
 
+SII_NAMESPACE = 'http://www.sii.cl/SiiDte'
+XSI_NAMESPACE = 'http://www.w3.org/2001/XMLSchema-instance'
+
+XML_DECLARATION_BYTES_RE = re.compile(rb'^\s*<\?xml[^>]+\?>\s*')
+
 class EnvelopeService(models.AbstractModel):
     """
     Servicio para Creación de Sobres de Envío (EnvioDTE).
@@ -24,7 +35,7 @@ class EnvelopeService(models.AbstractModel):
             envelope: l10n_cl_edi.certification.envelope
 
         Returns:
-            str: XML del sobre
+            bytes: XML del sobre (ISO-8859-1)
         """
         if not envelope.generated_document_ids:
             raise UserError(_('El sobre debe contener al menos un documento.'))
@@ -38,27 +49,42 @@ class EnvelopeService(models.AbstractModel):
         envelope_data = self._prepare_envelope_data(envelope, client_info)
 
         # Generar XML
-        envelope_xml = self._generate_envelope_xml(envelope_data)
+        output = io.BytesIO()
+        self._write_envelope_xml(output, envelope_data)
+
+        return output.getvalue()
+
+    @api.model
+    def plan_envelopes(self, project, documents):
+        """
+        Reparte los documentos en sobres según los límites del proyecto
+        (envelope_max_documents y envelope_max_size_kb), ver EnvelopePlanner.
 
-        return envelope_xml
+        El tamaño de cada documento es el de su XML firmado en el filestore,
+        sin leer los archivos.
+
+        Args:
+            project: l10n_cl_edi.certification.project
+            documents: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            list: Documentos de cada sobre (recordsets), en orden de envío
+        """
+        attachments = self.env['ir.attachment'].sudo().search_read([
+            ('res_model', '=', documents._name),
+            ('res_field', '=', 'xml_dte_signed'),
+            ('res_id', 'in', documents.ids),
+        ], ['res_id', 'file_size'])
+        size_by_id = {attachment['res_id']: attachment['file_size'] for attachment in attachments}
+
+        planner = EnvelopePlanner(project.envelope_max_size_kb * 1024, project.envelope_max_documents)
+        shards = planner.plan(documents, {doc: size_by_id.get(doc.id, 0) for doc in documents})
+        return [documents.browse([doc.id for doc in shard]) for shard in shards]
 
     def _prepare_envelope_data(self, envelope, client_info):
         """Prepara los datos para el sobre"""
         # IMPORTANTE: Ordenar documentos para que las facturas vayan PRIMERO
         # y luego las NC/ND que las referencian (evita error REF-3-750 del SII)
-        # Orden de prioridad de tipos: 33, 34, 39 (facturas) → 61 (NC) → 56 (ND)
-        def document_sort_key(doc):
-            # Tipos de documento ordenados de menor a mayor prioridad
-            type_order = {
-                '33': 1,  # Factura Electrónica
-                '34': 2,  # Factura no Afecta o Exenta
-                '39': 3,  # Boleta Electrónica
-                '61': 4,  # Nota de Crédito (debe ir después de facturas)
-                '56': 5,  # Nota de Débito (debe ir después de todo)
-            }
-            # Ordenar por: 1) tipo de documento, 2) folio
-            return (type_order.get(doc.document_type_code, 99), doc.folio)
-
         documents = envelope.generated_document_ids.sorted(key=document_sort_key)
 
         # Validar datos requeridos
@@ -101,70 +127,82 @@ class EnvelopeService(models.AbstractModel):
                 'NroDTE': len(docs),
             })
 
-        # Preparar lista de DTEs
-        dtes = []
-        import re
-
-        for doc in documents:
-            if not doc.xml_dte_signed:
-                raise UserError(_('Todos los documentos deben estar firmados. Documento %s no está firmado.') % doc.complete_name)
-
-            # Decodificar XML firmado
-            dte_xml = base64.b64decode(doc.xml_dte_signed).decode('ISO-8859-1')
-
-            # IMPORTANTE: Los DTEs dentro del SetDTE SÍ deben incluir su firma individual
-            # según el esquema XSD y los ejemplos de Odoo Enterprise
-            # Estructura: <DTE><Documento>...</Documento><Signature>...</Signature></DTE>
-
-            # Remover solo la declaración XML (no la firma)
-            dte_xml_sin_declaracion = re.sub(r'<\?xml[^>]+\?>\s*', '', dte_xml)
-
-            dtes.append({
-                'folio': doc.folio,
-                'xml': dte_xml_sin_declaracion,
-            })
+        # Verificar que todos estén firmados, sin cargar los XML en memoria
+        unsigned = self.env[documents._name].search([
+            ('id', 'in', documents.ids),
+            ('xml_dte_signed', '=', False),
+        ], limit=1)
+        if unsigned:
+            raise UserError(_('Todos los documentos deben estar firmados. Documento %s no está firmado.') % unsigned.complete_name)
 
         return {
             'Caratula': caratula,
-            'DTEs': dtes,
+            'documents': documents,
         }
 
-    def _generate_envelope_xml(self, envelope_data):
-        """Genera el XML del sobre usando template"""
-        from markupsafe import Markup
-
-        # Convertir los XMLs de DTEs a Markup para que QWeb no los escape
-        for dte_item in envelope_data['DTEs']:
-            dte_item['xml'] = Markup(dte_item['xml'])
-
-        template = 'l10n_cl_edi_certification.envelope_certification_template'
-
-        xml_content = self.env['ir.qweb']._render(template, {
-            'envelope_data': envelope_data,
-            '__keep_empty_lines': True,  # Preservar indentación y saltos de línea (como Odoo Enterprise)
-        })
+    def _write_envelope_xml(self, output, envelope_data):
+        """
+        Escribe el XML del sobre de forma incremental en output.
 
-        # Convertir a string (QWeb puede retornar bytes)
-        xml_str = xml_content.decode('ISO-8859-1') if isinstance(xml_content, bytes) else xml_content
+        La carátula se escribe con etree.xmlfile y cada DTE firmado se copia
+        tal cual (bytes ISO-8859-1, sin su declaración XML), decodificando un
+        documento a la vez. La indentación es la del antiguo template QWeb
+        una vez quitadas las líneas en blanco (lo mismo que hace la firma),
+        de modo que el sobre firmado y su digest no cambian.
 
-        # Convertir a string si es Markup
-        if isinstance(xml_str, Markup):
-            xml_str = str(xml_str)
+        Args:
+            output: Archivo binario de salida
+            envelope_data (dict): Ver _prepare_envelope_data
+        """
+        caratula = envelope_data['Caratula']
 
-        # IMPORTANTE: QWeb/lxml pueden reordenar los atributos xmlns alfabéticamente.
-        # Necesitamos asegurar que xmlns venga ANTES de xmlns:xsi (como en Enterprise).
-        # Este reemplazo se hace ANTES de firmar, por lo que no afecta la firma.
-        import re
-        xml_str = re.sub(
-            r'<EnvioDTE\s+xmlns:xsi="([^"]+)"\s+xmlns="([^"]+)"',
-            r'<EnvioDTE xmlns="\2" xmlns:xsi="\1"',
-            xml_str
-        )
+        def sii(tag):
+            return '{%s}%s' % (SII_NAMESPACE, tag)
 
-        # Nota: No es necesario agregar la declaración XML aquí porque el método _sign_full_xml
-        # de Enterprise ya lo hace automáticamente
+        def leaf(xf, tag, value, indent):
+            xf.write(indent)
+            with xf.element(sii(tag)):
+                xf.write(str(value))
 
-        return xml_str
+        # xmlns antes que xmlns:xsi (como en Enterprise)
+        nsmap = {None: SII_NAMESPACE, 'xsi': XSI_NAMESPACE}
+        attrib = {
+            '{%s}schemaLocation' % XSI_NAMESPACE: 'http://www.sii.cl/SiiDte EnvioDTE_v10.xsd',
+            'version': '1.0',
+        }
+        with etree.xmlfile(output, encoding='ISO-8859-1') as xf:
+            with xf.element(sii('EnvioDTE'), attrib, nsmap=nsmap):
+                xf.write('\n    ')
+                with xf.element(sii('SetDTE'), ID='SetDoc'):
+                    xf.write('\n        ')
+                    with xf.element(sii('Caratula'), version='1.0'):
+                        for tag in ('RutEmisor', 'RutEnvia', 'RutReceptor', 'FchResol', 'NroResol', 'TmstFirmaEnv'):
+                            leaf(xf, tag, caratula[tag], '\n            ')
+                        for subtot in caratula['SubTotDTE']:
+                            xf.write('\n            ')
+                            with xf.element(sii('SubTotDTE')):
+                                leaf(xf, 'TpoDTE', subtot['TpoDTE'], '\n                ')
+                                leaf(xf, 'NroDTE', subtot['NroDTE'], '\n                ')
+                                xf.write('\n            ')
+                        xf.write('\n        ')
+
+                    # Los DTEs se escriben directamente en output: vaciar antes
+                    # el buffer de xmlfile para no desordenar la salida
+                    xf.flush()
+
+                    # IMPORTANTE: Los DTEs dentro del SetDTE SÍ deben incluir su firma individual
+                    # según el esquema XSD y los ejemplos de Odoo Enterprise
+                    # Estructura: <DTE><Documento>...</Documento><Signature>...</Signature></DTE>
+                    for doc in envelope_data['documents']:
+                        # Sin prefetch: solo se carga el XML de este documento
+                        doc = doc.with_prefetch()
+                        dte_xml = base64.b64decode(doc.xml_dte_signed)
+                        output.write(b'\n        ')
+                        output.write(XML_DECLARATION_BYTES_RE.sub(b'', dte_xml).rstrip())
+                        doc.invalidate_recordset(['xml_dte_signed'])
+                    xf.write('\n    ')
+                xf.write('\n')
+        output.write(b'\n')
 
     @api.model
     def normalize_envelope(self, envelope):
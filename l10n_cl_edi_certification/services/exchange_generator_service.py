@@ -5,6 +5,11 @@ from datetime import datetime
 import base64
 from lxml import etree
 
+from .diagnostics import diagnose
+
+import logging
+_logger = logging.getLogger(__name__)
+
 class ExchangeGeneratorService(models.AbstractModel):
     """
     Servicio para generar los 3 XMLs de respuesta de intercambio:
@@ -23,82 +28,41 @@ class ExchangeGeneratorService(models.AbstractModel):
         Args:
             exchange: l10n_cl_edi.certification.exchange
         """
-        print('\n' + '=' * 100)
-        print(f'GENERANDO RESPUESTAS DE INTERCAMBIO')
-        print('=' * 100)
-        print(f'DTE Recibido: Tipo {exchange.dte_type}, Folio {exchange.dte_folio}')
-        print(f'Emisor: {exchange.dte_rut_emisor}')
-        print(f'Receptor: {exchange.dte_rut_receptor}')
-        print(f'Monto: ${exchange.dte_monto_total:,}')
-        print('=' * 100 + '\n')
-
-        # Extraer Digest del XML descargado del SII
-        digest_value = self._extract_digest_from_sii_xml(exchange)
-        if not digest_value:
-            raise UserError(_('No se pudo extraer el Digest del XML del SII. Verifique el archivo.'))
-
-        print(f'✓ Digest extraído: {digest_value[:30]}...')
-
-        # 1. Generar RespuestaDTE con RecepcionEnvio (Respuesta de Intercambio)
-        print('[1/3] Generando RespuestaDTE con RecepcionEnvio...')
-        envio_recibos_xml = self._generate_envio_recibos(exchange, digest_value)
-        print(f'  XML generado (primeros 300 chars):\n{envio_recibos_xml[:300]}...')
-
-        # Firmar RespuestaDTE (detecta automáticamente el nodo Resultado)
-        print('  Firmando RespuestaDTE con RecepcionEnvio...')
-        envio_recibos_signed = self._sign_exchange_xml(envio_recibos_xml, exchange.project_id)
-
-        print(f'\n  📄 ARCHIVO 1 - RespuestaDTE con RecepcionEnvio:')
-        print(f'     Tamaño: {len(envio_recibos_signed)} caracteres')
-        print(f'     Tiene <Signature>: {"<Signature" in envio_recibos_signed}')
-        print(f'     Últimos 150 caracteres:\n{envio_recibos_signed[-150:]}')
-
-        exchange.write({
-            'envio_recibos_xml': base64.b64encode(envio_recibos_signed.encode('ISO-8859-1')),
-        })
-        print('  ✓ RespuestaDTE con RecepcionEnvio guardado en BD\n')
-
-        # 2. Generar EnvioRecibos (Recibo de Mercaderías - Ley 19.983)
-        print('[2/3] Generando EnvioRecibos (Recibo de Mercaderías - Ley 19.983)...')
-        recepcion_envio_xml = self._generate_recepcion_envio(exchange, digest_value)
-        print(f'  XML generado (primeros 300 chars):\n{recepcion_envio_xml[:300]}...')
-
-        # Firmar EnvioRecibos (detecta automáticamente el nodo SetRecibos)
-        print('  Firmando EnvioRecibos...')
-        recepcion_envio_signed = self._sign_exchange_xml(recepcion_envio_xml, exchange.project_id)
-
-        print(f'\n  📄 ARCHIVO 2 - EnvioRecibos:')
-        print(f'     Tamaño: {len(recepcion_envio_signed)} caracteres')
-        print(f'     Tiene <Signature>: {"<Signature" in recepcion_envio_signed}')
-        print(f'     Últimos 150 caracteres:\n{recepcion_envio_signed[-150:]}')
-
-        exchange.write({
-            'recepcion_envio_xml': base64.b64encode(recepcion_envio_signed.encode('ISO-8859-1')),
-        })
-        print('  ✓ EnvioRecibos guardado en BD\n')
-
-        # 3. Generar RespuestaDTE con ResultadoDTE (Resultado Comercial)
-        print('[3/3] Generando RespuestaDTE con ResultadoDTE (Resultado Comercial)...')
-        resultado_dte_xml = self._generate_resultado_dte(exchange, digest_value)
-        print(f'  XML generado (primeros 300 chars):\n{resultado_dte_xml[:300]}...')
-
-        # Firmar RespuestaDTE (detecta automáticamente el nodo Resultado)
-        print('  Firmando RespuestaDTE con ResultadoDTE...')
-        resultado_dte_signed = self._sign_exchange_xml(resultado_dte_xml, exchange.project_id)
-
-        print(f'\n  📄 ARCHIVO 3 - RespuestaDTE con ResultadoDTE:')
-        print(f'     Tamaño: {len(resultado_dte_signed)} caracteres')
-        print(f'     Tiene <Signature>: {"<Signature" in resultado_dte_signed}')
-        print(f'     Últimos 150 caracteres:\n{resultado_dte_signed[-150:]}')
-
-        exchange.write({
-            'resultado_dte_xml': base64.b64encode(resultado_dte_signed.encode('ISO-8859-1')),
-        })
-        print('  ✓ ResultadoDTE guardado en BD\n')
-
-        print('=' * 100)
-        print('✓ LAS 3 RESPUESTAS DE INTERCAMBIO FUERON GENERADAS EXITOSAMENTE')
-        print('=' * 100 + '\n')
+        with diagnose('exchange_responses', exchange=exchange.id, dte_type=exchange.dte_type,
+                      folio=exchange.dte_folio) as diag:
+            # Extraer Digest del XML descargado del SII
+            with diag.stage('digest'):
+                digest_value = self._extract_digest_from_sii_xml(exchange)
+            if not digest_value:
+                raise UserError(_('No se pudo extraer el Digest del XML del SII. Verifique el archivo.'))
+
+            # 1. Generar RespuestaDTE con RecepcionEnvio (Respuesta de Intercambio)
+            with diag.stage('recepcion_envio'):
+                envio_recibos_xml = self._generate_envio_recibos(exchange, digest_value)
+            # Firmar RespuestaDTE (detecta automáticamente el nodo Resultado)
+            with diag.stage('recepcion_envio_sign'):
+                envio_recibos_signed = self._sign_exchange_xml(envio_recibos_xml, exchange.project_id)
+
+            # 2. Generar EnvioRecibos (Recibo de Mercaderías - Ley 19.983)
+            with diag.stage('envio_recibos'):
+                recepcion_envio_xml = self._generate_recepcion_envio(exchange, digest_value)
+            # Firmar EnvioRecibos (detecta automáticamente el nodo SetRecibos)
+            with diag.stage('envio_recibos_sign'):
+                recepcion_envio_signed = self._sign_exchange_xml(recepcion_envio_xml, exchange.project_id)
+
+            # 3. Generar RespuestaDTE con ResultadoDTE (Resultado Comercial)
+            with diag.stage('resultado_dte'):
+                resultado_dte_xml = self._generate_resultado_dte(exchange, digest_value)
+            # Firmar RespuestaDTE (detecta automáticamente el nodo Resultado)
+            with diag.stage('resultado_dte_sign'):
+                resultado_dte_signed = self._sign_exchange_xml(resultado_dte_xml, exchange.project_id)
+
+            with diag.stage('write'):
+                exchange.write({
+                    'envio_recibos_xml': base64.b64encode(envio_recibos_signed.encode('ISO-8859-1')),
+                    'recepcion_envio_xml': base64.b64encode(recepcion_envio_signed.encode('ISO-8859-1')),
+                    'resultado_dte_xml': base64.b64encode(resultado_dte_signed.encode('ISO-8859-1')),
+                })
 
     def _extract_digest_from_sii_xml(self, exchange):
         """
@@ -128,7 +92,7 @@ class ExchangeGeneratorService(models.AbstractModel):
 
             return None
         except Exception as e:
-            print(f'Error extrayendo digest: {e}')
+            _logger.warning('Error extrayendo digest del XML del SII: %s', e)
             return None
 
     def _generate_envio_recibos(self, exchange, digest):
@@ -158,7 +122,6 @@ class ExchangeGeneratorService(models.AbstractModel):
                     'MntTotal': str(exchange.dte_monto_total),
                 }]
 
-        print(f'   Generando RecepcionDTE para {len(all_dtes)} DTE(s)')
 
         # Datos del recibo
         recibo_data = {
@@ -252,7 +215,6 @@ class ExchangeGeneratorService(models.AbstractModel):
                     'MntTotal': str(exchange.dte_monto_total),
                 }]
 
-        print(f'   Generando ResultadoDTE para {len(all_dtes)} DTE(s)')
 
         # Datos del resultado
         # Estados posibles:
@@ -321,7 +283,8 @@ class ExchangeGeneratorService(models.AbstractModel):
             xml_str,
             cert_data,
             cert_password,
-            project.company_id
+            project.company_id,
+            client_info=client_info,
         )
 
         return xml_signed
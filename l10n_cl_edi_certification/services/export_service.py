@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api, _
+from odoo.exceptions import UserError
+import os
+import shutil
+import tempfile
+import zipfile
+import logging
+
+from .pdf_generator_service import _build_pdf_story, _new_pdf_template
+from .pdf_merge import PdfPageWriter
+
+_logger = logging.getLogger(__name__)
+
+try:
+    from reportlab.platypus import PageBreak
+except ImportError:
+    _logger.warning('ReportLab library not found. PDF generation will not work.')
+
+
+class ExportService(models.AbstractModel):
+    """
+    Servicio para exportar en lote los documentos de un proyecto o sobre.
+    """
+    _name = 'l10n_cl_edi.export.service'
+    _description = 'Servicio de Exportación de Documentos de Certificación'
+
+    # Documentos cuyo caché del ORM se libera junto
+    EXPORT_CHUNK_SIZE = 50
+
+    # Bytes que se copian de cada vez desde el filestore al ZIP
+    ZIP_COPY_CHUNK_SIZE = 64 * 1024
+
+    # XMLs que incluye la exportación ZIP de un proyecto:
+    # (modelo, campo binario, campo con nombre de archivo, carpeta en el ZIP)
+    ZIP_XML_SOURCES = [
+        ('l10n_cl_edi.certification.generated.document', 'xml_dte_signed', 'xml_dte_signed_filename', 'DTE'),
+        ('l10n_cl_edi.certification.envelope', 'envelope_xml_signed', 'envelope_xml_signed_filename', 'EnvioDTE'),
+        ('l10n_cl_edi.certification.book', 'book_xml_signed', 'book_xml_signed_filename', 'Libros'),
+        ('l10n_cl_edi.certification.book.segment', 'segment_xml_signed', 'segment_xml_signed_filename', 'Libros'),
+        ('l10n_cl_edi.certification.exchange', 'sii_downloaded_xml', 'sii_downloaded_filename', 'Intercambio'),
+        ('l10n_cl_edi.certification.exchange', 'envio_recibos_xml', 'envio_recibos_filename', 'Intercambio'),
+        ('l10n_cl_edi.certification.exchange', 'recepcion_envio_xml', 'recepcion_envio_filename', 'Intercambio'),
+        ('l10n_cl_edi.certification.exchange', 'resultado_dte_xml', 'resultado_dte_filename', 'Intercambio'),
+    ]
+
+    @api.model
+    def export_merged_pdf(self, documents, record, filename):
+        """
+        Genera un único PDF con los PDF impresos de todos los documentos
+        (uno a continuación del otro) y lo adjunta al registro.
+
+        Los documentos se maquetan por bloques de EXPORT_CHUNK_SIZE, cada
+        bloque en su propio PDF temporal, y las páginas de cada bloque se
+        copian al PDF consolidado, que se escribe en un archivo temporal (ver
+        PdfPageWriter). En memoria hay un solo bloque a la vez; el PDF
+        consolidado se lee completo una única vez, al crear el adjunto.
+
+        Args:
+            documents: l10n_cl_edi.certification.generated.document
+            record: Registro al que se adjunta el PDF (proyecto o sobre)
+            filename (str): Nombre del archivo adjunto
+
+        Returns:
+            ir.attachment: PDF consolidado
+        """
+        # bin_size: el filtro no carga las imágenes de todos los documentos
+        documents = documents.browse(
+            documents.with_context(bin_size=True).filtered(lambda d: d.ted_xml and d.barcode_image).ids
+        )
+        if not documents:
+            raise UserError(_(
+                'No hay documentos con TED para exportar.\n'
+                'Use "Generar TED Masivo" antes de exportar el PDF consolidado.'
+            ))
+
+        with tempfile.TemporaryFile(suffix='.pdf') as pdf_file:
+            writer = PdfPageWriter(pdf_file)
+            for start in range(0, len(documents), self.EXPORT_CHUNK_SIZE):
+                chunk = documents[start:start + self.EXPORT_CHUNK_SIZE]
+                with tempfile.TemporaryFile(suffix='.pdf') as chunk_file:
+                    self._render_chunk_pdf(chunk, chunk_file)
+                    writer.append(chunk_file)
+                # Liberar del caché del ORM los binarios ya maquetados
+                chunk.invalidate_recordset(['barcode_image', 'detalle_json'])
+            writer.close()
+
+            pdf_file.seek(0)
+            attachment = self.env['ir.attachment'].create({
+                'name': filename,
+                'raw': pdf_file.read(),
+                'res_model': record._name,
+                'res_id': record.id,
+                'mimetype': 'application/pdf',
+            })
+
+        return attachment
+
+    def _render_chunk_pdf(self, documents, output):
+        """
+        Maqueta los PDF impresos de un bloque de documentos en un solo PDF,
+        cada uno desde una página nueva.
+
+        Args:
+            documents: l10n_cl_edi.certification.generated.document
+            output: Archivo binario de salida
+        """
+        pdf_service = self.env['l10n_cl_edi.pdf.generator.service']
+        story = []
+        for document in documents:
+            if story:
+                story.append(PageBreak())
+            story.extend(_build_pdf_story(pdf_service._prepare_pdf_payload(document)))
+        _new_pdf_template(output).build(story)
+
+    @api.model
+    def export_xml_zip(self, project, filename):
+        """
+        Genera un ZIP con todos los XML firmados del proyecto (DTEs, sobres
+        EnvioDTE, libros e intercambio) y lo adjunta al proyecto.
+
+        Los XML se copian por bloques directamente desde el filestore y el ZIP
+        se escribe en un archivo temporal: nunca se cargan todos en memoria
+        ni pasan por el caché del ORM.
+
+        Args:
+            project: l10n_cl_edi.certification.project
+            filename (str): Nombre del archivo adjunto
+
+        Returns:
+            ir.attachment: ZIP generado
+        """
+        with tempfile.TemporaryFile(suffix='.zip') as zip_buffer:
+            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                count = 0
+                for arcname, attachment in self._iter_zip_xml_attachments(project):
+                    self._write_attachment_to_zip(zip_file, arcname, attachment)
+                    count += 1
+
+            if not count:
+                raise UserError(_('El proyecto %s no tiene XML firmados para exportar.') % project.name)
+
+            _logger.info('Exportados %d XML del proyecto %s', count, project.name)
+            zip_buffer.seek(0)
+            attachment = self.env['ir.attachment'].create({
+                'name': filename,
+                'raw': zip_buffer.read(),
+                'res_model': project._name,
+                'res_id': project.id,
+                'mimetype': 'application/zip',
+            })
+
+        return attachment
+
+    def _iter_zip_xml_attachments(self, project):
+        """
+        Recorre los adjuntos de los XML del proyecto (ver ZIP_XML_SOURCES).
+
+        Yields:
+            tuple: (ruta dentro del ZIP, ir.attachment)
+        """
+        used_names = set()
+        for model_name, field_name, filename_field, folder in self.ZIP_XML_SOURCES:
+            records = self.env[model_name].search([('project_id', '=', project.id)])
+            if not records:
+                continue
+            records.check_access('read')
+
+            # Solo el nombre de archivo; el binario no se lee desde el ORM
+            filenames = {record.id: record[filename_field] or f'{field_name}_{record.id}.xml' for record in records}
+            attachments = self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', model_name),
+                ('res_field', '=', field_name),
+                ('res_id', 'in', records.ids),
+            ], order='res_id')
+
+            for attachment in attachments:
+                arcname = f'{folder}/{filenames[attachment.res_id]}'
+                if arcname in used_names:
+                    base, ext = os.path.splitext(arcname)
+                    arcname = f'{base}_{attachment.res_id}{ext}'
+                used_names.add(arcname)
+                yield arcname, attachment
+
+    def _write_attachment_to_zip(self, zip_file, arcname, attachment):
+        """
+        Copia un adjunto al ZIP por bloques de ZIP_COPY_CHUNK_SIZE bytes.
+
+        Args:
+            zip_file (zipfile.ZipFile): ZIP abierto en escritura
+            arcname (str): Ruta dentro del ZIP
+            attachment: ir.attachment
+        """
+        source = None
+        if attachment.store_fname:
+            path = attachment._full_path(attachment.store_fname)
+            try:
+                source = open(path, 'rb')
+            except OSError as e:
+                _logger.warning('No se pudo leer %s desde el filestore (%s), se usa el ORM', path, e)
+
+        if source is None:
+            # Adjunto guardado en la base de datos (o archivo faltante en el filestore)
+            zip_file.writestr(arcname, attachment.raw or b'')
+            return
+
+        # La entrada del ZIP se abre solo con el archivo ya abierto: un error
+        # de lectura a mitad de copia se propaga en vez de dejar una entrada
+        # parcial y repetir el arcname con attachment.raw
+        with source, zip_file.open(arcname, 'w') as target:
+            shutil.copyfileobj(source, target, self.ZIP_COPY_CHUNK_SIZE)
@@ -1,14 +1,25 @@
 # -*- coding: utf-8 -*-
 from odoo import models, api, _
 from odoo.exceptions import UserError
+from odoo.tools import config
 from datetime import datetime
 from lxml import etree
 import base64
 import io
 import logging
+import re
+
+from .bulk_render import render_ted_barcode, run_many
 
 _logger = logging.getLogger(__name__)
 
+# Procesos para el renderizado masivo (ver _get_render_workers)
+RENDER_WORKERS_PARAM = 'l10n_cl_edi_certification.render_workers'
+
+# DD de un TED guardado, y su timestamp (lo único que cambia al regenerarlo)
+DD_RE = re.compile(r'<DD>.*?</DD>', re.DOTALL)
+TSTED_RE = re.compile(r'<TSTED>.*?</TSTED>')
+
 try:
     from reportlab.lib.pagesizes import letter
     from reportlab.lib.units import mm, cm
@@ -20,10 +31,6 @@ try:
 except ImportError:
     _logger.warning('ReportLab library not found. PDF generation will not work.')
 
-try:
-    import pdf417gen
-except ImportError:
-    _logger.warning('pdf417gen library not found. TED barcode generation will not work.')
 
 
 class PDFGeneratorService(models.AbstractModel):
@@ -58,6 +65,23 @@ class PDFGeneratorService(models.AbstractModel):
         Returns:
             str: XML del TED firmado con TmstFirma
         """
+        caf, dd_xml, timestamp = self._prepare_ted(document)
+
+        # Firmar el DD con la clave privada del CAF
+        frmt = self._sign_ted_with_caf(dd_xml, caf)
+
+        return self._assemble_ted(dd_xml, frmt, timestamp)
+
+    def _prepare_ted(self, document):
+        """
+        Arma el DD del TED de un documento (todo lo previo a la firma con el CAF).
+
+        Args:
+            document: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            tuple: (CafData, XML del DD, timestamp TSTED/TmstFirma)
+        """
         client_info = document.project_id.client_info_id
 
         # Obtener el CAF usado para este documento
@@ -73,51 +97,35 @@ class PDFGeneratorService(models.AbstractModel):
                 'No se encontró el CAF para el folio %s del tipo de documento %s'
             ) % (document.folio, document.document_type_id.name))
 
-        # Verificar que tenga CAF
-        if not folio_assignment.caf_file:
+        # Verificar que tenga CAF (bin_size: sin leer el archivo, ver get_caf_data)
+        if not folio_assignment.with_context(bin_size=True).caf_file:
             raise UserError(_(
                 'La asignación de folios %s-%s no tiene archivo CAF cargado'
             ) % (folio_assignment.folio_start, folio_assignment.folio_end))
 
-        # Decodificar el CAF XML
-        caf_xml_str = base64.b64decode(folio_assignment.caf_file).decode('ISO-8859-1')
-        caf_root = etree.fromstring(caf_xml_str.encode('ISO-8859-1'))
-
-        # Extraer el nodo DA completo del CAF
-        caf_da = caf_root.find('.//DA')
-        if caf_da is None:
-            raise UserError(_('No se encontró el nodo DA en el CAF'))
+        # CAF ya parseado (se decodifica una sola vez por asignación, ver CafCache)
+        try:
+            caf = folio_assignment.get_caf_data()
+        except ValueError as e:
+            raise UserError(_('Error al leer el CAF: %s') % str(e))
 
         # CRÍTICO: Verificar que el folio esté en el rango del CAF
-        caf_rng_d = caf_da.find('.//RNG/D')
-        caf_rng_h = caf_da.find('.//RNG/H')
-        if caf_rng_d is not None and caf_rng_h is not None:
-            caf_start = int(caf_rng_d.text)
-            caf_end = int(caf_rng_h.text)
-            if int(document.folio) < caf_start or int(document.folio) > caf_end:
-                print(f'\n❌ ERROR CRÍTICO - FOLIO FUERA DE RANGO CAF:')
-                print(f'   Documento: {document.document_type_id.name} #{document.folio}')
-                print(f'   Asignación en Odoo: Folios {folio_assignment.folio_start}-{folio_assignment.folio_end}')
-                print(f'   Rango en archivo CAF: [{caf_start}-{caf_end}]')
-                print(f'   ⚠️  El archivo CAF adjunto NO cubre el folio {document.folio}')
-                print(f'   SOLUCIÓN: Sube el CAF correcto en la asignación de folios {folio_assignment.folio_start}-{folio_assignment.folio_end}\n')
-
-                raise UserError(_(
-                    'ERROR: El folio %s está fuera del rango autorizado en el CAF.\n\n'
-                    'Asignación en Odoo: %s-%s\n'
-                    'Rango en archivo CAF: [%s-%s]\n\n'
-                    'El archivo CAF adjunto a la asignación de folios no corresponde.\n'
-                    'Por favor, sube el CAF correcto que cubra el rango %s-%s.'
-                ) % (
-                    document.folio,
-                    folio_assignment.folio_start, folio_assignment.folio_end,
-                    caf_start, caf_end,
-                    folio_assignment.folio_start, folio_assignment.folio_end
-                ))
-
-        # Extraer el nodo FRMA del CAF
-        caf_frma = caf_root.find('.//FRMA')
-        if caf_frma is None:
+        if not caf.covers(document.folio):
+            raise UserError(_(
+                'ERROR: El folio %s está fuera del rango autorizado en el CAF.\n\n'
+                'Asignación en Odoo: %s-%s\n'
+                'Rango en archivo CAF: [%s-%s]\n\n'
+                'El archivo CAF adjunto a la asignación de folios no corresponde.\n'
+                'Por favor, sube el CAF correcto que cubra el rango %s-%s.'
+            ) % (
+                document.folio,
+                folio_assignment.folio_start, folio_assignment.folio_end,
+                caf.rng_start, caf.rng_end,
+                folio_assignment.folio_start, folio_assignment.folio_end
+            ))
+
+        # Bloque <CAF> (DA + FRMA) del DD
+        if caf.caf_block is None:
             raise UserError(_('No se encontró el nodo FRMA en el CAF'))
 
         # Obtener primer item del detalle para IT1
@@ -160,71 +168,152 @@ class PDFGeneratorService(models.AbstractModel):
 <RSR>{(document.receiver_name or 'RECEPTOR')[:40]}</RSR>
 <MNT>{document.mnt_total}</MNT>
 <IT1>{primer_item}</IT1>
-<CAF version="1.0">
-<DA>
-{etree.tostring(caf_da, encoding='unicode', method='html').replace('<DA>', '').replace('</DA>', '').strip()}
-</DA>
-<FRMA algoritmo="{caf_frma.get('algoritmo')}">{caf_frma.text}</FRMA>
-</CAF>
+{caf.caf_block}
 <TSTED>{timestamp}</TSTED>
 </DD>"""
 
-        # Firmar el DD con la clave privada del CAF
-        frmt = self._sign_ted_with_caf(dd_xml, caf_root)
+        return caf, dd_xml, timestamp
 
-        # Construir TED completo con TmstFirma
-        ted_xml = f"""<TED version="1.0">
+    @staticmethod
+    def _assemble_ted(dd_xml, frmt, timestamp):
+        """Construye el TED completo con TmstFirma a partir del DD firmado"""
+        return f"""<TED version="1.0">
 {dd_xml}
 <FRMT algoritmo="SHA1withRSA">{frmt}</FRMT>
 </TED><TmstFirma>{timestamp}</TmstFirma>"""
 
-        return ted_xml
-
-    def _sign_ted_with_caf(self, dd_xml, caf_root):
+    @api.model
+    def generate_ted_many(self, documents):
         """
-        Firma el DD del TED con la clave privada del CAF.
+        Genera TED y código de barras PDF417 para varios documentos.
 
-        Utiliza el método de Odoo certificate.key._sign_with_key para firmar
-        el DD con la clave privada RSA del CAF (RSASK) usando SHA1withRSA.
-
-        Este método replica exactamente el enfoque usado en l10n_cl_edi enterprise.
+        Los DD se arman en este proceso y se firman en lote por CAF
+        (CafSigner.sign_many); la codificación PDF417 y el renderizado PNG,
+        que son CPU puro, pueden repartirse en un pool de procesos (ver
+        _get_render_workers).
 
         Args:
-            dd_xml: XML del DD a firmar (string)
-            caf_root: Elemento raíz del CAF (etree element)
+            documents: l10n_cl_edi.certification.generated.document
 
         Returns:
-            str: Firma en Base64
+            tuple: (dict documento -> (ted_xml, png_bytes), dict documento -> mensaje de error)
         """
-        import re
+        errors = {}
 
-        # Extraer la clave privada del CAF (RSASK)
-        rsask_node = caf_root.find('.//RSASK')
-        if rsask_node is None:
-            raise UserError(_('No se encontró la clave privada (RSASK) en el CAF'))
+        # 1. Armar los DD y agruparlos por CAF
+        prepared = {}
+        for document in documents:
+            try:
+                prepared[document] = self._prepare_ted(document)
+            except Exception as e:
+                errors[document] = str(e)
+
+        by_caf = {}
+        for document, (caf, dd_xml, timestamp) in prepared.items():
+            by_caf.setdefault(id(caf), (caf, []))[1].append(document)
+
+        # 2. Firmar los DD con la llave de cada CAF, cargada una sola vez
+        teds = {}
+        for caf, caf_documents in by_caf.values():
+            try:
+                signatures = caf.signer.sign_many([
+                    self._clean_dd(prepared[document][1]) for document in caf_documents
+                ])
+            except Exception as e:
+                for document in caf_documents:
+                    errors[document] = _('Error al firmar el TED con la clave privada del CAF: %s') % str(e)
+                continue
+            for document, frmt in zip(caf_documents, signatures):
+                dd_xml, timestamp = prepared[document][1:]
+                teds[document] = self._assemble_ted(dd_xml, frmt, timestamp)
+
+        # 3. Códigos de barras en paralelo (procesos)
+        results = {}
+        stamped = list(teds)
+        rendered = run_many(
+            render_ted_barcode, [teds[document] for document in stamped],
+            max_workers=self._get_render_workers(),
+        )
+        for document, (barcode_data, error) in zip(stamped, rendered):
+            if error:
+                errors[document] = _('Error al generar código de barras PDF417: %s') % error
+            else:
+                results[document] = (teds[document], barcode_data)
+
+        return results, errors
 
-        # Limpiar el DD eliminando saltos de línea y espacios
-        dd_clean = re.sub(b'\n\\s*', b'', dd_xml.encode('ISO-8859-1', 'replace'))
+    def _sign_ted_with_caf(self, dd_xml, caf):
+        """
+        Firma el DD del TED con la clave privada del CAF.
 
-        # Extraer RSASK y codificarlo en base64 (doble codificación como en enterprise)
-        rsask_text = rsask_node.text.strip()
-        rsask_encoded = base64.b64encode(rsask_text.encode('utf-8'))
+        Firma SHA1withRSA con la clave privada RSA del CAF (RSASK), igual que
+        l10n_cl_edi enterprise, pero con la llave ya cargada (ver CafSigner).
 
-        # Usar el método de Odoo para firmar (igual que l10n_cl_edi enterprise)
+        Args:
+            dd_xml: XML del DD a firmar (string)
+            caf: CAF parseado (CafData)
+
+        Returns:
+            str: Firma en Base64
+        """
         try:
-            signature_b64 = self.env['certificate.key']._sign_with_key(
-                dd_clean,
-                rsask_encoded,
-                hashing_algorithm='sha1',
-                formatting='base64',
-            ).decode()
-            return signature_b64
+            return caf.signer.sign(self._clean_dd(dd_xml))
         except Exception as e:
             raise UserError(_(
                 'Error al firmar el TED con la clave privada del CAF.\n'
                 'Error: %s'
             ) % str(e))
 
+    @staticmethod
+    def _clean_dd(dd_xml):
+        """DD sin saltos de línea ni indentación, en ISO-8859-1 (bytes a firmar)"""
+        return re.sub(b'\n\\s*', b'', dd_xml.encode('ISO-8859-1', 'replace'))
+
+    @api.model
+    def _get_render_workers(self):
+        """
+        Procesos a usar en el renderizado masivo (bulk_render.run_many).
+
+        Por defecto 0: se renderiza en serie. El pool se activa con el
+        parámetro del sistema l10n_cl_edi_certification.render_workers, y
+        solo con servidor multiproceso (--workers > 0): el pool usa fork, y
+        hacer fork de un servidor con hilos (threaded o gevent) copia locks
+        tomados por otros hilos (registro, logging) al proceso hijo.
+
+        Returns:
+            int: Procesos del pool (0 o 1: en serie)
+        """
+        if not config['workers']:
+            return 0
+        value = self.env['ir.config_parameter'].sudo().get_param(RENDER_WORKERS_PARAM, '0')
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            _logger.warning('Valor inválido para %s: %r, se renderiza en serie', RENDER_WORKERS_PARAM, value)
+            return 0
+
+    @api.model
+    def is_ted_current(self, document):
+        """
+        Indica si el TED guardado del documento sigue vigente, es decir, si
+        se timbraron los mismos datos del documento y el mismo CAF que se
+        timbrarían ahora. En ese caso, regenerarlo solo cambiaría TSTED y
+        TmstFirma, y se pueden reutilizar ted_xml y barcode_image tal cual.
+
+        Args:
+            document: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            bool: True si el TED y su código de barras se pueden reutilizar
+        """
+        if not document.ted_xml or not document.with_context(bin_size=True).barcode_image:
+            return False
+        stored_dd = DD_RE.search(document.ted_xml)
+        if not stored_dd:
+            return False
+        _caf, dd_xml, _timestamp = self._prepare_ted(document)
+        return TSTED_RE.sub('', stored_dd.group(0)) == TSTED_RE.sub('', dd_xml)
+
     @api.model
     def generate_ted_barcode(self, ted_xml):
         """
@@ -239,42 +328,8 @@ class PDFGeneratorService(models.AbstractModel):
         Returns:
             bytes: Imagen PNG del código de barras
         """
-        import re
-
-
         try:
-            # Remover el TmstFirma del TED para el código de barras
-            # (como lo hace el módulo enterprise)
-            ted_for_barcode = re.sub(
-                r'<TmstFirma>.*?</TmstFirma>',
-                '',
-                ted_xml
-            )
-
-            # Generar código de barras PDF417
-            # Parámetros según módulo enterprise:
-            # - security_level=5
-            # - columns=13
-            barcode = pdf417gen.encode(
-                ted_for_barcode,
-                columns=13,
-                security_level=5
-            )
-
-            # Convertir a imagen PIL
-            # Parámetros según módulo enterprise:
-            # - padding=15
-            # - scale=1
-            image = pdf417gen.render_image(barcode, padding=15, scale=1)
-
-            # Guardar en buffer
-            buffer = io.BytesIO()
-            image.save(buffer, format='PNG')
-            buffer.seek(0)
-
-
-            return buffer.getvalue()
-
+            return render_ted_barcode(ted_xml)
         except Exception as e:
             _logger.error(f'Error al generar código de barras PDF417: {e}')
             raise UserError(_('Error al generar código de barras PDF417:\n%s') % str(e))
@@ -297,6 +352,20 @@ class PDFGeneratorService(models.AbstractModel):
         Returns:
             bytes: PDF generado
         """
+        return _render_printed_pdf(self._prepare_pdf_payload(document))
+
+    @api.model
+    def _prepare_pdf_payload(self, document):
+        """
+        Extrae del documento todo lo que necesita el PDF impreso, como datos
+        simples (serializables), para poder renderizarlo fuera del ORM.
+
+        Args:
+            document: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            dict: Payload para _render_printed_pdf
+        """
         # Verificar que tenga TED
         if not document.ted_xml:
             raise UserError(_(
@@ -311,110 +380,7 @@ class PDFGeneratorService(models.AbstractModel):
                 'Debe generar el TED antes de crear el PDF.'
             ))
 
-        # Crear buffer para el PDF
-        buffer = io.BytesIO()
-
-        # Crear documento PDF
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=letter,
-            rightMargin=1.5*cm,
-            leftMargin=1.5*cm,
-            topMargin=1.5*cm,
-            bottomMargin=1.5*cm
-        )
-
-        # Contenedor de elementos
-        story = []
-        styles = getSampleStyleSheet()
-
-        # Estilos personalizados
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=16,
-            textColor=colors.HexColor('#1f4788'),
-            alignment=TA_CENTER,
-            spaceAfter=12
-        )
-
-        header_style = ParagraphStyle(
-            'Header',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=TA_LEFT
-        )
-
-        # 1. ENCABEZADO - TIPO DE DOCUMENTO
-        doc_type_name = document.document_type_id.name.upper()
-        story.append(Paragraph(f'<b>{doc_type_name}</b>', title_style))
-        story.append(Paragraph(f'<b>N° {document.folio}</b>', title_style))
-        story.append(Spacer(1, 0.3*cm))
-
-        # 2. INFORMACIÓN DEL EMISOR
-        client_info = document.project_id.client_info_id
-        emisor_data = [
-            ['<b>EMISOR</b>', ''],
-            ['RUT:', client_info.rut],
-            ['Razón Social:', client_info.social_reason],
-            ['Giro:', client_info.activity_description or '-'],
-            ['Dirección:', f"{client_info.address or '-'}, {client_info.city or '-'}"],
-        ]
-
-        emisor_table = Table(emisor_data, colWidths=[3.5*cm, 12*cm])
-        emisor_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('TOPPADDING', (0, 1), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
-        story.append(emisor_table)
-        story.append(Spacer(1, 0.5*cm))
-
-        # 3. INFORMACIÓN DEL RECEPTOR
-        receptor_data = [
-            ['<b>RECEPTOR</b>', ''],
-            ['RUT:', document.receiver_rut or '-'],
-            ['Razón Social:', document.receiver_name or '-'],
-            ['Giro:', document.receiver_giro or '-'],
-            ['Dirección:', f"{document.receiver_address or '-'}, {document.receiver_comuna or '-'}"],
-        ]
-
-        receptor_table = Table(receptor_data, colWidths=[3.5*cm, 12*cm])
-        receptor_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('TOPPADDING', (0, 1), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
-        story.append(receptor_table)
-        story.append(Spacer(1, 0.5*cm))
-
-        # 4. FECHA EMISIÓN
-        fecha_data = [
-            ['Fecha Emisión:', document.issue_date.strftime('%d-%m-%Y')],
-        ]
-        fecha_table = Table(fecha_data, colWidths=[3.5*cm, 12*cm])
-        fecha_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 9),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ]))
-        story.append(fecha_table)
-        story.append(Spacer(1, 0.5*cm))
-
-        # 5. DETALLE DE ITEMS
+        # Detalle de items
         detalle_items = []
         if document.detalle_json:
             import json
@@ -430,118 +396,325 @@ class PDFGeneratorService(models.AbstractModel):
                 # Continuar con lista vacía, se agregará item por defecto
                 detalle_items = []
 
-        detalle_header = ['Item', 'Descripción', 'Cantidad', 'Precio Unit.', 'Total']
-        detalle_data = [detalle_header]
+        client_info = document.project_id.client_info_id
+        return {
+            'document_type_name': document.document_type_id.name,
+            'folio': document.folio,
+            'issue_date': document.issue_date.strftime('%d-%m-%Y'),
+            'emisor': {
+                'rut': client_info.rut,
+                'social_reason': client_info.social_reason,
+                'activity_description': client_info.activity_description,
+                'address': client_info.address,
+                'city': client_info.city,
+            },
+            'receptor': {
+                'rut': document.receiver_rut,
+                'name': document.receiver_name,
+                'giro': document.receiver_giro,
+                'address': document.receiver_address,
+                'comuna': document.receiver_comuna,
+            },
+            'detalle_items': detalle_items,
+            'mnt_neto': document.mnt_neto,
+            'mnt_exento': document.mnt_exento,
+            'mnt_iva': document.mnt_iva,
+            'iva_percent': document.iva_percent,
+            'mnt_total': document.mnt_total,
+            'barcode_png': base64.b64decode(document.barcode_image),
+        }
 
-        for idx, item in enumerate(detalle_items, 1):
-            # Manejar diferentes formatos de item
-            if isinstance(item, dict):
-                nombre = item.get('nombre') or item.get('description') or 'Item'
-                cantidad = item.get('cantidad') or item.get('quantity') or 1
-                precio = item.get('precio') or item.get('price') or 0
-                total = item.get('total') or item.get('amount') or 0
-            else:
-                nombre = str(item)
-                cantidad = 1
-                precio = 0
-                total = 0
-
-            detalle_data.append([
-                str(idx),
-                nombre,
-                str(cantidad),
-                f"${precio:,.0f}",
-                f"${total:,.0f}",
-            ])
-
-        # Si no hay items, mostrar al menos uno por defecto
-        if len(detalle_data) == 1:
-            detalle_data.append(['1', 'Item genérico', '1', f"${document.mnt_total:,.0f}", f"${document.mnt_total:,.0f}"])
-
-        detalle_table = Table(detalle_data, colWidths=[1.5*cm, 7*cm, 2*cm, 2.5*cm, 2.5*cm])
-        detalle_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('TOPPADDING', (0, 1), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ]))
-        story.append(detalle_table)
-        story.append(Spacer(1, 0.5*cm))
-
-        # 6. TOTALES
-        totales_data = []
-
-        # Monto Neto (si aplica)
-        if document.mnt_neto > 0:
-            totales_data.append(['Monto Neto:', f"${document.mnt_neto:,.0f}"])
-
-        # Monto Exento (si aplica)
-        if document.mnt_exento > 0:
-            totales_data.append(['Monto Exento:', f"${document.mnt_exento:,.0f}"])
-
-        # IVA (si aplica)
-        if document.mnt_iva > 0:
-            totales_data.append([f'IVA ({document.iva_percent}%):', f"${document.mnt_iva:,.0f}"])
-
-        # Total
-        totales_data.append(['<b>TOTAL:</b>', f"<b>${document.mnt_total:,.0f}</b>"])
-
-        totales_table = Table(totales_data, colWidths=[10.5*cm, 5*cm])
-        totales_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-        ]))
-        story.append(totales_table)
-        story.append(Spacer(1, 1*cm))
-
-        # 7. TIMBRE ELECTRÓNICO (TED)
-        story.append(Paragraph('<b>TIMBRE ELECTRÓNICO SII</b>', title_style))
-        story.append(Spacer(1, 0.3*cm))
-
-        # Decodificar imagen del código de barras
-        barcode_data = base64.b64decode(document.barcode_image)
-        barcode_buffer = io.BytesIO(barcode_data)
-
-        # Agregar imagen del código de barras
-        barcode_img = Image(barcode_buffer, width=10*cm, height=3*cm)
-        barcode_img.hAlign = 'CENTER'
-        story.append(barcode_img)
-        story.append(Spacer(1, 0.3*cm))
-
-        # 8. LEYENDAS LEGALES
-        leyenda_style = ParagraphStyle(
-            'Leyenda',
-            parent=styles['Normal'],
-            fontSize=7,
-            alignment=TA_CENTER,
-            textColor=colors.grey
+    @api.model
+    def generate_printed_pdf_many(self, documents):
+        """
+        Genera los PDF impresos de varios documentos.
+
+        Los payloads se arman en este proceso (ORM) y el renderizado con
+        ReportLab, que es CPU puro, puede repartirse entre procesos (ver
+        _get_render_workers).
+
+        Args:
+            documents: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            tuple: (dict documento -> PDF bytes, dict documento -> mensaje de error)
+        """
+        errors = {}
+        payloads = {}
+        for document in documents:
+            try:
+                payloads[document] = self._prepare_pdf_payload(document)
+            except Exception as e:
+                errors[document] = str(e)
+
+        results = {}
+        pending = list(payloads)
+        rendered = run_many(
+            _render_printed_pdf, [payloads[document] for document in pending],
+            max_workers=self._get_render_workers(),
         )
+        for document, (pdf_data, error) in zip(pending, rendered):
+            if error:
+                errors[document] = _('Error al generar el PDF: %s') % error
+            else:
+                results[document] = pdf_data
+
+        return results, errors
+
+
+def _render_printed_pdf(payload):
+    """
+    Renderiza el PDF impreso de un DTE a partir de su payload.
+
+    Función pura (sin ORM) para poder ejecutarse en un pool de procesos.
 
-        story.append(Paragraph(
-            'Timbre Electrónico SII<br/>'
-            f'Resolución Exenta SII - Fecha: {document.issue_date.strftime("%d-%m-%Y")}<br/>'
-            'Verifique documento en: www.sii.cl',
-            leyenda_style
-        ))
+    Args:
+        payload (dict): Ver PDFGeneratorService._prepare_pdf_payload
 
-        # Construir PDF
-        doc.build(story)
+    Returns:
+        bytes: PDF generado
+    """
+    # Crear buffer para el PDF
+    buffer = io.BytesIO()
+
+    # Crear documento PDF
+    doc = _new_pdf_template(buffer)
+
+    # Construir PDF
+    doc.build(_build_pdf_story(payload))
+
+    # Obtener PDF
+    buffer.seek(0)
+    pdf_data = buffer.getvalue()
+    buffer.close()
+
+    return pdf_data
+
+
+def _new_pdf_template(output):
+    """
+    Documento ReportLab (carta, márgenes de 1.5 cm) del PDF impreso.
+
+    Args:
+        output: Archivo o buffer de salida (path o file-like)
+    """
+    return SimpleDocTemplate(
+        output,
+        pagesize=letter,
+        rightMargin=1.5*cm,
+        leftMargin=1.5*cm,
+        topMargin=1.5*cm,
+        bottomMargin=1.5*cm
+    )
 
-        # Obtener PDF
-        buffer.seek(0)
-        pdf_data = buffer.getvalue()
-        buffer.close()
 
-        return pdf_data
+def _build_pdf_story(payload):
+    """
+    Elementos (flowables) del PDF impreso de un DTE.
+
+    Args:
+        payload (dict): Ver PDFGeneratorService._prepare_pdf_payload
+
+    Returns:
+        list: Flowables de ReportLab
+    """
+    # Contenedor de elementos
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Estilos personalizados
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        textColor=colors.HexColor('#1f4788'),
+        alignment=TA_CENTER,
+        spaceAfter=12
+    )
+
+    header_style = ParagraphStyle(
+        'Header',
+        parent=styles['Normal'],
+        fontSize=10,
+        alignment=TA_LEFT
+    )
+
+    # 1. ENCABEZADO - TIPO DE DOCUMENTO
+    doc_type_name = payload['document_type_name'].upper()
+    story.append(Paragraph(f'<b>{doc_type_name}</b>', title_style))
+    story.append(Paragraph(f'<b>N° {payload["folio"]}</b>', title_style))
+    story.append(Spacer(1, 0.3*cm))
+
+    # 2. INFORMACIÓN DEL EMISOR
+    emisor = payload['emisor']
+    emisor_data = [
+        ['<b>EMISOR</b>', ''],
+        ['RUT:', emisor['rut']],
+        ['Razón Social:', emisor['social_reason']],
+        ['Giro:', emisor['activity_description'] or '-'],
+        ['Dirección:', f"{emisor['address'] or '-'}, {emisor['city'] or '-'}"],
+    ]
+
+    emisor_table = Table(emisor_data, colWidths=[3.5*cm, 12*cm])
+    emisor_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    story.append(emisor_table)
+    story.append(Spacer(1, 0.5*cm))
+
+    # 3. INFORMACIÓN DEL RECEPTOR
+    receptor = payload['receptor']
+    receptor_data = [
+        ['<b>RECEPTOR</b>', ''],
+        ['RUT:', receptor['rut'] or '-'],
+        ['Razón Social:', receptor['name'] or '-'],
+        ['Giro:', receptor['giro'] or '-'],
+        ['Dirección:', f"{receptor['address'] or '-'}, {receptor['comuna'] or '-'}"],
+    ]
+
+    receptor_table = Table(receptor_data, colWidths=[3.5*cm, 12*cm])
+    receptor_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    story.append(receptor_table)
+    story.append(Spacer(1, 0.5*cm))
+
+    # 4. FECHA EMISIÓN
+    fecha_data = [
+        ['Fecha Emisión:', payload['issue_date']],
+    ]
+    fecha_table = Table(fecha_data, colWidths=[3.5*cm, 12*cm])
+    fecha_table.setStyle(TableStyle([
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ]))
+    story.append(fecha_table)
+    story.append(Spacer(1, 0.5*cm))
+
+    # 5. DETALLE DE ITEMS
+    detalle_items = payload['detalle_items']
+
+    detalle_header = ['Item', 'Descripción', 'Cantidad', 'Precio Unit.', 'Total']
+    detalle_data = [detalle_header]
+
+    for idx, item in enumerate(detalle_items, 1):
+        # Manejar diferentes formatos de item
+        if isinstance(item, dict):
+            nombre = item.get('nombre') or item.get('description') or 'Item'
+            cantidad = item.get('cantidad') or item.get('quantity') or 1
+            precio = item.get('precio') or item.get('price') or 0
+            total = item.get('total') or item.get('amount') or 0
+        else:
+            nombre = str(item)
+            cantidad = 1
+            precio = 0
+            total = 0
+
+        detalle_data.append([
+            str(idx),
+            nombre,
+            str(cantidad),
+            f"${precio:,.0f}",
+            f"${total:,.0f}",
+        ])
+
+    # Si no hay items, mostrar al menos uno por defecto
+    if len(detalle_data) == 1:
+        detalle_data.append(['1', 'Item genérico', '1', f"${payload['mnt_total']:,.0f}", f"${payload['mnt_total']:,.0f}"])
+
+    detalle_table = Table(detalle_data, colWidths=[1.5*cm, 7*cm, 2*cm, 2.5*cm, 2.5*cm])
+    detalle_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f4788')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('ALIGN', (1, 1), (1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    story.append(detalle_table)
+    story.append(Spacer(1, 0.5*cm))
+
+    # 6. TOTALES
+    totales_data = []
+
+    # Monto Neto (si aplica)
+    if payload['mnt_neto'] > 0:
+        totales_data.append(['Monto Neto:', f"${payload['mnt_neto']:,.0f}"])
+
+    # Monto Exento (si aplica)
+    if payload['mnt_exento'] > 0:
+        totales_data.append(['Monto Exento:', f"${payload['mnt_exento']:,.0f}"])
+
+    # IVA (si aplica)
+    if payload['mnt_iva'] > 0:
+        totales_data.append([f"IVA ({payload['iva_percent']}%):", f"${payload['mnt_iva']:,.0f}"])
+
+    # Total
+    totales_data.append(['<b>TOTAL:</b>', f"<b>${payload['mnt_total']:,.0f}</b>"])
+
+    totales_table = Table(totales_data, colWidths=[10.5*cm, 5*cm])
+    totales_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    story.append(totales_table)
+    story.append(Spacer(1, 1*cm))
+
+    # 7. TIMBRE ELECTRÓNICO (TED)
+    story.append(Paragraph('<b>TIMBRE ELECTRÓNICO SII</b>', title_style))
+    story.append(Spacer(1, 0.3*cm))
+
+    # Imagen del código de barras
+    barcode_buffer = io.BytesIO(payload['barcode_png'])
+
+    # Agregar imagen del código de barras
+    barcode_img = Image(barcode_buffer, width=10*cm, height=3*cm)
+    barcode_img.hAlign = 'CENTER'
+    story.append(barcode_img)
+    story.append(Spacer(1, 0.3*cm))
+
+    # 8. LEYENDAS LEGALES
+    leyenda_style = ParagraphStyle(
+        'Leyenda',
+        parent=styles['Normal'],
+        fontSize=7,
+        alignment=TA_CENTER,
+        textColor=colors.grey
+    )
+
+    story.append(Paragraph(
+        'Timbre Electrónico SII<br/>'
+        f'Resolución Exenta SII - Fecha: {payload["issue_date"]}<br/>'
+        'Verifique documento en: www.sii.cl',
+        leyenda_style
+    ))
+
+    return story
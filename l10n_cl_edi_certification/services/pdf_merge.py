@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Concatenación de PDFs sin cargarlos en memoria.
+
+PdfPageWriter copia las páginas de cada PDF de entrada al PDF de salida
+objeto por objeto (renumerándolos), y solo mantiene en memoria los offsets
+de los objetos ya escritos. Está pensado para los PDF que genera ReportLab
+en este módulo (tabla xref clásica, sin object streams ni cifrado); no es
+un lector de PDF general.
+"""
+import re
+
+OBJECT_HEADER_RE = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+OBJECT_BODY_END_RE = re.compile(rb'(?<![A-Za-z])(?:stream\r?\n|endobj)')
+REFERENCE_RE = re.compile(rb'(\d+)\s+(\d+)\s+R(?![A-Za-z])')
+PARENT_RE = re.compile(rb'/Parent\s+\d+\s+\d+\s+R')
+LENGTH_RE = re.compile(rb'/Length\s+(\d+)(?:\s+(\d+)\s+R)?')
+ROOT_RE = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+PAGES_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+KIDS_RE = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+TYPE_PAGES_RE = re.compile(rb'/Type\s*/Pages(?![A-Za-z])')
+
+# Bytes que se leen de cada vez al buscar el final de un objeto
+READ_BLOCK_SIZE = 4096
+# Bytes del final del archivo donde se busca startxref
+TAIL_SIZE = 1024
+
+
+class _PdfSource:
+    """PDF de entrada: tabla xref y lectura de objetos por número."""
+
+    def __init__(self, file):
+        self.file = file
+        self.offsets = {}
+
+        file.seek(0, 2)
+        size = file.tell()
+        file.seek(max(0, size - TAIL_SIZE))
+        tail = file.read()
+        position = tail.rfind(b'startxref')
+        if position < 0:
+            raise ValueError('PDF sin startxref')
+        xref_offset = int(tail[position + len(b'startxref'):].split()[0])
+
+        file.seek(xref_offset)
+        xref, separator, trailer = file.read().partition(b'trailer')
+        tokens = xref.split()
+        if not separator or not tokens or tokens[0] != b'xref':
+            raise ValueError('PDF sin tabla xref clásica (no soportado)')
+        index = 1
+        while index < len(tokens):
+            start, count = int(tokens[index]), int(tokens[index + 1])
+            index += 2
+            for number in range(start, start + count):
+                offset, _generation, kind = tokens[index:index + 3]
+                index += 3
+                if kind == b'n':
+                    self.offsets[number] = int(offset)
+
+        root = ROOT_RE.search(trailer)
+        if not root:
+            raise ValueError('PDF sin /Root')
+        self.root = int(root.group(1))
+
+    def read_object(self, number):
+        """
+        Args:
+            number (int): Número del objeto
+
+        Returns:
+            tuple: (cuerpo del objeto sin el stream, bytes del stream o None)
+        """
+        offset = self.offsets[number]
+        self.file.seek(offset)
+        buffer = b''
+        while True:
+            block = self.file.read(READ_BLOCK_SIZE)
+            if not block:
+                raise ValueError('Objeto %s incompleto' % number)
+            buffer += block
+            header = OBJECT_HEADER_RE.match(buffer)
+            end = header and OBJECT_BODY_END_RE.search(buffer, header.end())
+            if end:
+                break
+
+        body = buffer[header.end():end.start()].strip()
+        if end.group().startswith(b'endobj'):
+            return body, None
+
+        length = LENGTH_RE.search(body)
+        if not length:
+            raise ValueError('Stream sin /Length en el objeto %s' % number)
+        if length.group(2) is not None:
+            length_value = int(self.read_object(int(length.group(1)))[0])
+        else:
+            length_value = int(length.group(1))
+        self.file.seek(offset + end.end())
+        return body, self.file.read(length_value)
+
+    def page_numbers(self):
+        """Números de los objetos página, en orden."""
+        catalog = self.read_object(self.root)[0]
+        pages = PAGES_RE.search(catalog)
+        if not pages:
+            raise ValueError('Catálogo sin /Pages')
+        pending = [int(pages.group(1))]
+        while pending:
+            number = pending.pop(0)
+            body = self.read_object(number)[0]
+            if TYPE_PAGES_RE.search(body):
+                kids = KIDS_RE.search(body)
+                children = [int(ref[0]) for ref in REFERENCE_RE.findall(kids.group(1))] if kids else []
+                pending[:0] = children
+            else:
+                yield number
+
+
+class PdfPageWriter:
+    """
+    Escribe un PDF con las páginas de otros PDF, en el orden en que se
+    agregan, directamente en el archivo de salida.
+
+    Uso:
+        writer = PdfPageWriter(output)
+        for part in parts:
+            writer.append(part)
+        writer.close()
+    """
+
+    # Objetos reservados del PDF de salida
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, output):
+        self.output = output
+        self.start = output.tell()
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+        output.write(b'%PDF-1.4\n%\x93\x8c\x8b\x9e\n')
+
+    def append(self, source):
+        """
+        Agrega al final todas las páginas de un PDF.
+
+        Args:
+            source: Archivo binario con seek de un PDF generado por ReportLab
+        """
+        reader = _PdfSource(source)
+        # Número en la entrada -> número en la salida (los recursos compartidos
+        # por varias páginas del mismo PDF se copian una sola vez)
+        mapping = {}
+        for number in reader.page_numbers():
+            self.page_ids.append(self._copy(reader, number, mapping))
+
+    def _copy(self, reader, page_number, mapping):
+        """Copia una página y todo lo que referencia (salvo su /Parent)."""
+        if page_number not in mapping:
+            mapping[page_number] = self._allocate()
+        pending = [page_number]
+
+        def remap(match):
+            number = int(match.group(1))
+            if number not in mapping:
+                mapping[number] = self._allocate()
+                pending.append(number)
+            return b'%d 0 R' % mapping[number]
+
+        while pending:
+            number = pending.pop()
+            body, stream = reader.read_object(number)
+            if number == page_number:
+                body = PARENT_RE.sub(b'', body)
+            body = REFERENCE_RE.sub(remap, body)
+            if number == page_number:
+                body = body.replace(b'<<', b'<<\n/Parent %d 0 R' % self.PAGES_ID, 1)
+            self._write_object(mapping[number], body, stream)
+        return mapping[page_number]
+
+    def _allocate(self):
+        number = self.next_id
+        self.next_id += 1
+        return number
+
+    def _write_object(self, number, body, stream=None):
+        self.offsets[number] = self.output.tell() - self.start
+        self.output.write(b'%d 0 obj\n%s\n' % (number, body))
+        if stream is not None:
+            self.output.write(b'stream\n')
+            self.output.write(stream)
+            self.output.write(b'\nendstream\n')
+        self.output.write(b'endobj\n')
+
+    def close(self):
+        """Escribe el árbol de páginas, el catálogo y la tabla xref."""
+        if not self.page_ids:
+            raise ValueError('El PDF no tiene páginas')
+        kids = b' '.join(b'%d 0 R' % number for number in self.page_ids)
+        self._write_object(self.PAGES_ID, b'<< /Type /Pages /Count %d /Kids [ %s ] >>' % (len(self.page_ids), kids))
+        self._write_object(self.CATALOG_ID, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES_ID)
+
+        xref_offset = self.output.tell() - self.start
+        self.output.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id)
+        for number in range(1, self.next_id):
+            self.output.write(b'%010d 00000 n \n' % self.offsets[number])
+        self.output.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                          % (self.next_id, self.CATALOG_ID, xref_offset))
@@ -2,10 +2,34 @@
 from odoo import models, api, _
 from odoo.exceptions import UserError
 import base64
+import html
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from lxml import etree
+
+from .certificate_cache import CertificateCache
+from .diagnostics import diagnose
+from .dte_structure_validator import DteStructureValidator
+from .xmldsig import XmlDsigBuilder, XmlDsigVerifier, c14n_digest
 
 import logging
 _logger = logging.getLogger(__name__)
 
+SII_NS = {'sii': 'http://www.sii.cl/SiiDte'}
+
+XML_DECLARATION_RE = re.compile(r'<\?xml[^>]+\?>\s*')
+BLANK_LINES_RE = re.compile(r'\n\s*$', re.MULTILINE)
+
+# Nodos que determinan el tipo de firma (ver _sign_xml)
+SIGNING_TARGETS = {
+    '{http://www.sii.cl/SiiDte}SetDTE': 'SetDTE',
+    '{http://www.sii.cl/SiiDte}EnvioLibro': 'EnvioLibro',
+    '{http://www.sii.cl/SiiDte}Resultado': 'Resultado',
+    '{http://www.sii.cl/SiiDte}SetRecibos': 'SetRecibos',
+    '{http://www.sii.cl/SiiDte}Documento': 'Documento',
+}
+
 class SignatureService(models.AbstractModel):
     """
     Servicio para Firma Digital de Documentos.
@@ -16,8 +40,11 @@ class SignatureService(models.AbstractModel):
     _description = 'Servicio de Firma Digital'
     _inherit = 'l10n_cl.edi.util'
 
+    # Hilos para el cálculo RSA en sign_many
+    SIGN_MAX_WORKERS = 4
+
     @api.model
-    def sign_xml(self, xml_content, cert_data, cert_password, company_id, reference_uri=None):
+    def sign_xml(self, xml_content, cert_data, cert_password, company_id, reference_uri=None, client_info=None):
         """
         Firma un XML con certificado digital DEL CLIENTE.
 
@@ -25,13 +52,14 @@ class SignatureService(models.AbstractModel):
             xml_content (str): Contenido XML a firmar
             cert_data (bytes): Datos del certificado (.pfx/.p12) en bytes DEL CLIENTE
             cert_password (str): Contraseña del certificado DEL CLIENTE
-            company_id (res.company): Company asociada (requerida para certificado temporal)
+            company_id (res.company): Company asociada
             reference_uri (str): URI de referencia para la firma (opcional)
+            client_info: l10n_cl_edi.certification.client dueño del certificado (opcional, para caché)
 
         Returns:
             str: XML firmado
         """
-        return self._sign_xml(xml_content, cert_data, cert_password, company_id)
+        return self._sign_xml(xml_content, cert_data, cert_password, company_id, client_info=client_info)
 
     @api.model
     def sign_dte(self, document):
@@ -59,7 +87,9 @@ class SignatureService(models.AbstractModel):
         xml_content = base64.b64decode(document.xml_dte_file).decode('ISO-8859-1')
 
         # Firmar el XML (pasamos company_id para el certificado temporal)
-        signed_xml = self._sign_xml(xml_content, cert_data, cert_password, document.project_id.company_id)
+        signed_xml = self._sign_xml(
+            xml_content, cert_data, cert_password, document.project_id.company_id, client_info=client_info
+        )
 
         return signed_xml
 
@@ -89,157 +119,290 @@ class SignatureService(models.AbstractModel):
         xml_content = base64.b64decode(envelope.envelope_xml).decode('ISO-8859-1')
 
         # Firmar (pasamos company_id para el certificado temporal)
-        signed_xml = self._sign_xml(xml_content, cert_data, cert_password, envelope.project_id.company_id)
+        signed_xml = self._sign_xml(
+            xml_content, cert_data, cert_password, envelope.project_id.company_id, client_info=client_info
+        )
 
         return signed_xml
 
-    def _sign_xml(self, xml_content, cert_data, password, company_id):
+    @api.model
+    def sign_envelopes(self, envelopes):
+        """
+        Firma varios sobres (EnvioDTE) a la vez, p.ej. los sobres de un
+        mismo envío dividido por EnvelopePlanner.
+
+        El certificado se obtiene una vez por cliente y cada sobre se firma en
+        un hilo (parseo, digest, RSA y serialización no usan el ORM).
+
+        Args:
+            envelopes: l10n_cl_edi.certification.envelope
+
+        Returns:
+            dict: Sobre -> XML firmado (str)
+        """
+        certificates = {}
+        pending = []
+        for envelope in envelopes:
+            if not envelope.envelope_xml:
+                raise UserError(_('El sobre no tiene XML para firmar.'))
+            client_info = envelope.project_id.client_info_id
+            if not client_info:
+                raise UserError(_('No hay información del cliente configurada.'))
+            if client_info not in certificates:
+                certificates[client_info] = client_info.get_signing_certificate()
+            xml_content = base64.b64decode(envelope.envelope_xml).decode('ISO-8859-1')
+            pending.append((xml_content, certificates[client_info]))
+
+        workers = min(self.SIGN_MAX_WORKERS, len(pending))
+        if workers <= 1:
+            signed = [self._sign_envelope_xml(*item) for item in pending]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                signed = list(executor.map(lambda item: self._sign_envelope_xml(*item), pending))
+        return dict(zip(envelopes, signed))
+
+    def _sign_envelope_xml(self, xml_content, digital_signature):
+        """
+        Firma el SetDTE de un EnvioDTE sin acceder al ORM (ver sign_envelopes).
+
+        Args:
+            xml_content (str): EnvioDTE sin firmar
+            digital_signature: ClientCertificate
+
+        Returns:
+            str: XML firmado
+        """
+        try:
+            with diagnose('sign_envelope', size=len(xml_content)) as diag:
+                with diag.stage('parse'):
+                    root = self._parse_for_signing(xml_content)
+                    id_index, targets = self._index_signing_tree(root)
+                if 'SetDTE' not in targets:
+                    raise UserError(_('El XML no es un EnvioDTE (no contiene SetDTE).'))
+                with diag.stage('sign'):
+                    self._sign_xmlsec_direct(root, id_index, digital_signature, targets['SetDTE'].get('ID', 'SetDoc'))
+                with diag.stage('serialize'):
+                    return self._serialize_signed(root)
+        except Exception as e:
+            _logger.exception('Error al firmar el sobre')
+            raise UserError(_('Error al firmar el XML: %s') % str(e))
+
+    def _get_signing_certificate(self, cert_data, password, client_info=None):
+        """
+        Obtiene el certificado decodificado desde la caché del proceso.
+
+        Args:
+            cert_data (bytes): Certificado en formato .pfx/.p12
+            password (str): Contraseña del certificado
+            client_info: l10n_cl_edi.certification.client (opcional)
+
+        Returns:
+            ClientCertificate
+        """
+        return CertificateCache.get(client_info.id if client_info else False, cert_data, password)
+
+    def _sign_xml(self, xml_content, cert_data, password, company_id, client_info=None):
         """
         Firma un XML con el certificado digital DEL CLIENTE usando el método de Odoo Enterprise.
 
+        El XML se parsea una sola vez: el tipo de documento y los nodos a firmar
+        se obtienen del mismo árbol (índice por ID), las firmas se insertan en
+        el árbol y éste se serializa una única vez al final.
+
         Args:
             xml_content (str): Contenido XML a firmar
             cert_data (bytes): Certificado en formato .pfx/.p12 (bytes directos) DEL CLIENTE
             password (str): Contraseña del certificado DEL CLIENTE
-            company_id (res.company or int): Company asociada al proyecto (requerida para certificado temporal)
+            company_id (res.company or int): Company asociada al proyecto
+            client_info: l10n_cl_edi.certification.client dueño del certificado (opcional, para caché)
 
         Returns:
             str: XML firmado
         """
         try:
-            # Asegurar que company_id es un recordset
-            if isinstance(company_id, (int, str)):
-                company_id = self.env['res.company'].browse(int(company_id))
-            elif not company_id:
+            if not company_id:
                 raise UserError(_('Se requiere especificar una compañía para firmar el documento.'))
 
-            # Crear un objeto certificate.certificate temporal para usar sus métodos de firma
-            # El certificado se decodifica automáticamente al crear el objeto
-            CertificateModel = self.env['certificate.certificate']
+            with diagnose('sign_xml', size=len(xml_content)) as diag:
+                # Certificado DEL CLIENTE ya decodificado (el PKCS#12 se abre una vez por proceso)
+                with diag.stage('certificate'):
+                    cert_temp = self._get_signing_certificate(cert_data, password, client_info)
+
+                # Parsear una sola vez e indexar los nodos por ID y por tipo
+                with diag.stage('parse'):
+                    root = self._parse_for_signing(xml_content)
+                    id_index, targets = self._index_signing_tree(root)
+
+                # Detectar el tipo de documento XML
+                if 'SetDTE' in targets:
+                    # Es un EnvioDTE - firmar el SetDTE
+                    doc_id = targets['SetDTE'].get('ID', 'SetDoc')
+                    xml_type = 'env'
+                elif 'EnvioLibro' in targets:
+                    # Es un LibroCompraVenta - usar método específico de firma
+                    doc_id = targets['EnvioLibro'].get('ID', 'SetDoc')
+                    xml_type = 'libro'
+                elif 'Resultado' in targets:
+                    # Es un RespuestaDTE - firmar el Resultado
+                    doc_id = targets['Resultado'].get('ID', 'Resultado')
+                    xml_type = 'env'
+                elif 'SetRecibos' in targets:
+                    # Es un EnvioRecibos - requiere firma especial (cada Recibo + SetRecibos)
+                    doc_id = targets['SetRecibos'].get('ID', 'SetRecibos')
+                    xml_type = 'recibos'
+                else:
+                    # Es un DTE individual - firmar el Documento
+                    doc_element = targets.get('Documento')
+                    doc_id = doc_element.get('ID') if doc_element is not None else 'DTE-TEMP'
+                    xml_type = 'doc'
+                diag.set(root=etree.QName(root).localname, xml_type=xml_type, uri=doc_id)
+
+                # Firmar según el tipo de documento
+                with diag.stage('sign'):
+                    if xml_type == 'libro':
+                        # LibroCompraVenta requiere un método de firma específico
+                        self._sign_libro(root, targets['EnvioLibro'], cert_temp, doc_id)
+                    elif xml_type == 'recibos':
+                        # EnvioRecibos requiere firmar cada Recibo + SetRecibos
+                        self._sign_envio_recibos(root, targets['SetRecibos'], cert_temp, doc_id)
+                    else:
+                        # Para todos los demás (DTEs, EnvioDTE, RespuestaDTE)
+                        self._sign_xmlsec_direct(root, id_index, cert_temp, doc_id)
+
+                with diag.stage('serialize'):
+                    signed_xml = self._serialize_signed(root)
 
-            # Crear certificado temporal con los datos del CLIENTE
-            cert_temp = CertificateModel.new({
-                'content': base64.b64encode(cert_data),  # Campo binario del certificado .pfx/.p12 DEL CLIENTE
-                'pkcs12_password': password,  # Contraseña DEL CLIENTE
-                'company_id': company_id,  # Company del proyecto (debe ser recordset, no ID)
-            })
+            return signed_xml
 
-            # Extraer el ID del documento del XML para usarlo como referencia
-            from lxml import etree
-            import re
+        except Exception as e:
+            _logger.exception('Error al firmar el XML')
+            raise UserError(_('Error al firmar el XML: %s') % str(e))
 
-            # Remover declaración XML si existe (lxml no la acepta en unicode strings)
-            xml_without_declaration = re.sub(r'<\?xml[^>]+\?>\s*', '', xml_content)
+    def _parse_for_signing(self, xml_content):
+        """
+        Parsea el XML a firmar (única pasada de parseo del proceso de firma).
 
-            # Crear parser ISO-8859-1 para que lxml entienda el encoding correcto
-            parser = etree.XMLParser(encoding='ISO-8859-1')
-            xml_doc = etree.fromstring(xml_without_declaration.encode('ISO-8859-1'), parser)
-
-            # Detectar el tipo de documento XML
-            print('\n' + '=' * 80)
-            print('🔍 DETECTANDO TIPO DE DOCUMENTO XML PARA FIRMA')
-            print('=' * 80)
-
-            # 1. Buscar SetDTE (para EnvioDTE - sobre con múltiples DTEs)
-            setdte_element = xml_doc.find('.//{http://www.sii.cl/SiiDte}SetDTE')
-            print(f'SetDTE encontrado: {setdte_element is not None}')
-
-            # 2. Buscar EnvioLibro (para LibroCompraVenta)
-            envio_libro_element = xml_doc.find('.//{http://www.sii.cl/SiiDte}EnvioLibro')
-            print(f'EnvioLibro encontrado: {envio_libro_element is not None}')
-
-            # 3. Buscar Resultado (para RespuestaDTE - intercambio)
-            resultado_element = xml_doc.find('.//{http://www.sii.cl/SiiDte}Resultado')
-            print(f'Resultado encontrado: {resultado_element is not None}')
-
-            # 4. Buscar SetRecibos (para EnvioRecibos - intercambio)
-            setrecibos_element = xml_doc.find('.//{http://www.sii.cl/SiiDte}SetRecibos')
-            print(f'SetRecibos encontrado: {setrecibos_element is not None}')
-
-            if setdte_element is not None:
-                # Es un EnvioDTE - firmar el SetDTE
-                doc_id = setdte_element.get('ID', 'SetDoc')
-                xml_type = 'env'  # Tipo para EnvioDTE
-                print(f'✓ Tipo detectado: EnvioDTE')
-                print(f'  ID del nodo: {doc_id}')
-                print(f'  Tipo de firma: {xml_type}')
-            elif envio_libro_element is not None:
-                # Es un LibroCompraVenta - usar método específico de firma
-                doc_id = envio_libro_element.get('ID', 'SetDoc')
-                xml_type = 'libro'  # Tipo especial para LibroCompraVenta
-                print(f'✓ Tipo detectado: LibroCompraVenta')
-                print(f'  ID del nodo: {doc_id}')
-                print(f'  Tipo de firma: {xml_type}')
-            elif resultado_element is not None:
-                # Es un RespuestaDTE - firmar el Resultado
-                doc_id = resultado_element.get('ID', 'Resultado')
-                xml_type = 'env'  # Usar tipo 'env' (similar a EnvioDTE)
-                print(f'✓ Tipo detectado: RespuestaDTE')
-                print(f'  ID del nodo: {doc_id}')
-                print(f'  Tipo de firma: {xml_type}')
-            elif setrecibos_element is not None:
-                # Es un EnvioRecibos - requiere firma especial (cada Recibo + SetRecibos)
-                doc_id = setrecibos_element.get('ID', 'SetRecibos')
-                xml_type = 'recibos'  # Tipo especial para EnvioRecibos
-                print(f'✓ Tipo detectado: EnvioRecibos')
-                print(f'  ID del nodo: {doc_id}')
-                print(f'  Tipo de firma: {xml_type} (firma múltiple)')
-            else:
-                # Es un DTE individual - firmar el Documento
-                doc_element = xml_doc.find('.//{http://www.sii.cl/SiiDte}Documento')
-                doc_id = doc_element.get('ID') if doc_element is not None else 'DTE-TEMP'
-                xml_type = 'doc'  # Tipo para DTE individual
-                print(f'✓ Tipo detectado: DTE individual')
-                print(f'  ID del nodo: {doc_id}')
-                print(f'  Tipo de firma: {xml_type}')
-
-            # Firmar según el tipo de documento
-            print('\n📝 LLAMANDO AL MÉTODO DE FIRMA...')
-            print(f'Método a usar: {"_sign_libro" if xml_type == "libro" else "sign_xmlsec"}')
-            print(f'Parámetros:')
-            print(f'  - doc_id: {doc_id}')
-            print(f'  - xml_type: {xml_type}')
-
-            if xml_type == 'libro':
-                # LibroCompraVenta requiere un método de firma específico
-                print('Ejecutando _sign_libro()...')
-                signed_xml = self._sign_libro(xml_without_declaration, cert_temp, doc_id)
-            elif xml_type == 'recibos':
-                # EnvioRecibos requiere firmar cada Recibo + SetRecibos
-                print('Ejecutando _sign_envio_recibos()...')
-                signed_xml = self._sign_envio_recibos(xml_without_declaration, cert_temp, doc_id)
-            else:
-                # Para todos los demás (DTEs, EnvioDTE, RespuestaDTE)
-                # Usar firma directa con xmlsec
-                print('Ejecutando _sign_xmlsec_direct()...')
-                signed_xml = self._sign_xmlsec_direct(
-                    xml_without_declaration,
-                    cert_temp,
-                    doc_id
-                )
-
-            print('\n✅ FIRMA COMPLETADA')
-            print(f'Tamaño del XML firmado: {len(signed_xml)} caracteres')
-            print(f'Contiene <Signature>: {"<Signature" in signed_xml}')
-            print(f'Últimos 200 caracteres del XML firmado:')
-            print(signed_xml[-200:])
-            print('=' * 80 + '\n')
+        Args:
+            xml_content (str): XML sin firmar (con o sin declaración XML)
 
-            return signed_xml
+        Returns:
+            etree._Element: Raíz del documento
+        """
+        # Remover declaración XML (lxml no la acepta en unicode strings) y
+        # las líneas en blanco, igual que el método de firma de Odoo Enterprise
+        xml_content = XML_DECLARATION_RE.sub('', xml_content)
+        xml_content = BLANK_LINES_RE.sub('', xml_content)
+        return etree.fromstring(xml_content)
 
-        except Exception as e:
-            print(f'\n❌ ERROR EN FIRMA:')
-            print(f'Tipo de error: {type(e).__name__}')
-            print(f'Mensaje: {str(e)}')
-            import traceback
-            print('Traceback completo:')
-            traceback.print_exc()
-            print('=' * 80 + '\n')
-            raise UserError(_('Error al firmar el XML: %s') % str(e))
+    def _index_signing_tree(self, root):
+        """
+        Recorre el árbol una sola vez para indexar los nodos con atributo ID
+        y ubicar el primer nodo de cada tipo firmable.
+
+        Args:
+            root (etree._Element): Raíz del documento
+
+        Returns:
+            tuple: (dict ID -> nodo, dict nombre local -> nodo)
+        """
+        id_index = {}
+        targets = {}
+        for node in root.iter(etree.Element):
+            node_id = node.get('ID')
+            if node_id is not None:
+                id_index.setdefault(node_id, node)
+            target = SIGNING_TARGETS.get(node.tag)
+            if target:
+                targets.setdefault(target, node)
+        return id_index, targets
+
+    def _serialize_signed(self, root):
+        """Serializa (una sola vez) el documento firmado con su declaración XML"""
+        return '<?xml version="1.0" encoding="ISO-8859-1" ?>\n' + etree.tostring(root, encoding='unicode')
+
+    def _build_signed_info(self, uri, digest_value):
+        """
+        Construye el SignedInfo canonicalizado.
+
+        Args:
+            uri (str): URI de referencia (ej: '#SetDoc')
+            digest_value (str): Digest SHA-1 en base64
+
+        Returns:
+            str: SignedInfo canonicalizado
+        """
+        return XmlDsigBuilder.signed_info(uri, digest_value)
+
+    def _render_signature(self, signed_info_c14n, signature_value, key_info):
+        """
+        Construye el elemento Signature completo.
+
+        Args:
+            signed_info_c14n (str): SignedInfo canonicalizado
+            signature_value (str): Valor de la firma en base64
+            key_info (KeyInfoBlock): Datos de la llave pública precalculados
+
+        Returns:
+            str: Elemento Signature
+        """
+        return XmlDsigBuilder.signature(signed_info_c14n, signature_value, key_info)
+
+    def _prepare_signature(self, target_node, uri):
+        """
+        Calcula el digest del nodo y arma el SignedInfo (todo lo previo al RSA).
+
+        Args:
+            target_node (etree._Element): Nodo referenciado por la firma
+            uri (str): ID del nodo
+
+        Returns:
+            str: SignedInfo canonicalizado
+        """
+        node_digest = base64.b64encode(c14n_digest(target_node)).decode()
+        return self._build_signed_info('#{}'.format(uri), node_digest)
+
+    @staticmethod
+    def _compute_signature_value(certificate, signed_info_c14n):
+        """Firma RSA-SHA1 del SignedInfo (sin saltos de línea), en base64"""
+        return certificate._sign(
+            re.sub(r'\n\s*', '', signed_info_c14n),
+            hashing_algorithm='sha1',
+            formatting='base64'
+        ).decode()
+
+    def _build_signature_element(self, signed_info_c14n, signature_value, key_info):
+        """Construye el elemento Signature listo para insertar en el árbol"""
+        signature = etree.fromstring(self._render_signature(signed_info_c14n, signature_value, key_info))
+        # Conservar las etiquetas de cierre explícitas del C14N (<X></X>)
+        for node in signature.iter():
+            if node.text is None and not len(node):
+                node.text = ''
+        return signature
+
+    def _sign_node(self, target_node, uri, digital_signature):
+        """
+        Firma un nodo.
+
+        Args:
+            target_node (etree._Element): Nodo a firmar
+            uri (str): ID del nodo
+            digital_signature: ClientCertificate
+
+        Returns:
+            etree._Element: Elemento Signature
+        """
+        signed_info_c14n = self._prepare_signature(target_node, uri)
+        signature_value = self._compute_signature_value(digital_signature, signed_info_c14n)
+        return self._build_signature_element(signed_info_c14n, signature_value, digital_signature.key_info)
+
+    def _append_signature(self, parent, signature):
+        """Inserta la firma como último hijo de parent, antes de su cierre"""
+        signature.tail = '\n'
+        parent.append(signature)
 
-    def _sign_libro(self, message, digital_signature, uri):
+    def _sign_libro(self, root, envio_libro, digital_signature, uri):
         """
-        Firma un LibroCompraVenta usando el método de Odoo Enterprise.
+        Firma un LibroCompraVenta.
 
         LibroCompraVenta tiene una estructura específica:
         <LibroCompraVenta>
@@ -250,92 +413,13 @@ class SignatureService(models.AbstractModel):
         </LibroCompraVenta>
 
         Args:
-            message (str): XML del libro sin firmar (sin declaración XML)
-            digital_signature: Objeto certificate.certificate
+            root (etree._Element): Raíz LibroCompraVenta (se modifica)
+            envio_libro (etree._Element): Nodo EnvioLibro
+            digital_signature: ClientCertificate
             uri (str): URI de referencia (ej: 'SetDoc')
-
-        Returns:
-            str: XML firmado
         """
-        try:
-            from lxml import etree
-            from markupsafe import Markup
-            import re
-            import hashlib
-            import textwrap
-
-            # 1. Preparar el mensaje para la firma (sin espacios en blanco extras)
-            digest_value = Markup(re.sub(r'\n\s*$', '', message, flags=re.MULTILINE))
-
-            # 2. Obtener el primer hijo (EnvioLibro) para el digest
-            digest_value_tree = etree.tostring(etree.fromstring(digest_value)[0])
-
-            # 3. Crear SignedInfo usando template con xsi (para sobres/envíos)
-            signed_info_template = 'l10n_cl_edi.signed_info_template_with_xsi'
-            signed_info = self.env['ir.qweb']._render(signed_info_template, {
-                'uri': '#{}'.format(uri),
-                'digest_value': base64.b64encode(
-                    hashlib.sha1(etree.tostring(etree.fromstring(digest_value_tree), method='c14n')).digest()
-                ).decode(),
-            })
-
-            # 4. Canonicalizar el SignedInfo
-            signed_info_c14n = Markup(etree.tostring(
-                etree.fromstring(signed_info),
-                method='c14n',
-                exclusive=False,
-                with_comments=False,
-                inclusive_ns_prefixes=None
-            ).decode())
-
-            # 5. Obtener las claves públicas del certificado
-            e, n = digital_signature._get_public_key_numbers_bytes(formatting='base64')
-
-            # 6. Firmar el SignedInfo
-            signature_value = digital_signature._sign(
-                re.sub(r'\n\s*', '', signed_info_c14n),
-                hashing_algorithm='sha1',
-                formatting='base64'
-            ).decode()
-
-            # 7. Crear el elemento Signature completo
-            signature = self.env['ir.qweb']._render('l10n_cl_edi.signature_template', {
-                'signed_info': signed_info_c14n,
-                'signature_value': signature_value,
-                'modulus': n.decode(),
-                'exponent': e.decode(),
-                'certificate': '\n' + textwrap.fill(
-                    digital_signature._get_der_certificate_bytes(formatting='base64').decode(),
-                    64
-                ),
-            })
-
-            # 7.1 Limpiar espacios en blanco al inicio y final de la firma
-            # QWeb puede agregar saltos de línea/espacios extras
-            if isinstance(signature, bytes):
-                signature = signature.decode('utf-8')
-            signature = Markup(signature.strip())
-
-            # 8. Insertar la firma antes del cierre de LibroCompraVenta
-            # Para LibroCompraVenta, la firma va después de </EnvioLibro> y antes de </LibroCompraVenta>
-            # El XML original ya tiene un salto de línea después de </EnvioLibro>,
-            # solo agregamos uno después de la firma
-            tag_to_replace = Markup('</LibroCompraVenta>')
-            full_doc = digest_value.replace(tag_to_replace, signature + '\n' + tag_to_replace)
-
-            # 9. Retornar con declaración XML y salto de línea
-            return Markup('<?xml version="1.0" encoding="ISO-8859-1" ?>\n') + full_doc
-
-        except Exception as e:
-            print(f'\n❌ ERROR en _sign_libro():')
-            print(f'Tipo: {type(e).__name__}')
-            print(f'Mensaje: {str(e)}')
-            import traceback
-            traceback.print_exc()
-            print(f'{"=" * 80}\n')
-            raise
+        self._append_signature(root, self._sign_node(envio_libro, uri, digital_signature))
 
-    @api.model
     def validate_signature(self, xml_content):
         """
         Valida la firma digital de un XML.
@@ -347,29 +431,41 @@ class SignatureService(models.AbstractModel):
             tuple: (bool, str) - (es_válido, mensaje)
         """
         try:
-            from lxml import etree
-
             # Parsear XML (ISO-8859-1 encoding requerido por SII)
             parser = etree.XMLParser(encoding='ISO-8859-1')
             xml_doc = etree.fromstring(xml_content.encode('ISO-8859-1'), parser)
+        except Exception as e:
+            return False, _('Error al validar firma: %s') % str(e)
+        return self._validate_signature_tree(xml_doc)
 
-            # Buscar elemento de firma
-            signature_elements = xml_doc.xpath('//ds:Signature', namespaces={
-                'ds': 'http://www.w3.org/2000/09/xmldsig#'
-            })
-
-            if not signature_elements:
-                return False, _('No se encontró firma digital en el documento')
-
-            # Aquí deberías validar la firma usando xmlsec
-            # Por ahora retornamos True como placeholder
+    def _validate_signature_tree(self, xml_doc):
+        """
+        Valida las firmas digitales de un XML ya parseado: recalcula el digest
+        de cada Reference y verifica el SignedInfo con el certificado embebido,
+        incluidas las firmas anidadas (DTEs de un EnvioDTE, Recibos de un
+        EnvioRecibos). No accede al ORM, de modo que se puede llamar desde un
+        hilo (ver ValidationService.validate_many).
 
-            return True, _('Firma válida')
+        Args:
+            xml_doc (etree._Element): Raíz del XML firmado
 
+        Returns:
+            tuple: (bool, str) - (es_válido, mensaje)
+        """
+        try:
+            signature_count, errors = XmlDsigVerifier.verify(xml_doc)
         except Exception as e:
+            _logger.exception('Error al validar la firma')
             return False, _('Error al validar firma: %s') % str(e)
 
-    def _sign_envio_recibos(self, xml_content, digital_signature, setrecibos_id):
+        if not signature_count:
+            return False, _('No se encontró firma digital en el documento')
+        if errors:
+            return False, _('Firma digital inválida:\n%s') % '\n'.join(errors)
+        return True, _('Firma válida')
+
+
+    def _sign_envio_recibos(self, root, set_recibos, digital_signature, setrecibos_id):
         """
         Firma un EnvioRecibos según Ley 19.983.
 
@@ -379,283 +475,202 @@ class SignatureService(models.AbstractModel):
         3. Finalmente firmar todo el <SetRecibos>
 
         Args:
-            xml_content (str): XML sin firmar (sin declaración XML)
-            digital_signature: Objeto certificate.certificate
+            root (etree._Element): Raíz EnvioRecibos (se modifica)
+            set_recibos (etree._Element): Nodo SetRecibos
+            digital_signature: ClientCertificate
             setrecibos_id (str): ID del SetRecibos (ej: 'SetRecibos')
-
-        Returns:
-            str: XML firmado con múltiples firmas
         """
         try:
-            from lxml import etree
-            from markupsafe import Markup
-            import re
-            import hashlib
-            import textwrap
+            recibos = set_recibos.findall('.//sii:Recibo', SII_NS) or set_recibos.findall('.//Recibo')
 
-            print(f'\n  🔐 Firmando EnvioRecibos (firma múltiple)...')
-            print(f'     SetRecibos ID: #{setrecibos_id}')
-
-            # 1. Parsear XML
-            digest_value = Markup(re.sub(r'\n\s*$', '', xml_content, flags=re.MULTILINE))
-            root = etree.fromstring(digest_value)
-
-            # 2. Encontrar SetRecibos y todos los Recibos
-            ns = {'sii': 'http://www.sii.cl/SiiDte'}
-            set_recibos = root.find('.//sii:SetRecibos', ns) or root.find('.//SetRecibos')
-            if set_recibos is None:
-                raise UserError(_('No se encontró SetRecibos en el XML'))
-
-            recibos = set_recibos.findall('.//sii:Recibo', ns) or set_recibos.findall('.//Recibo')
-            print(f'     ✓ Encontrados {len(recibos)} Recibo(s)')
-
-            # 3. Firmar cada Recibo individualmente
+            # 1. Firmar cada Recibo individualmente
             for idx, recibo in enumerate(recibos):
-                # Buscar DocumentoRecibo con ID
-                doc_recibo = recibo.find('.//sii:DocumentoRecibo', ns) or recibo.find('.//DocumentoRecibo')
+                doc_recibo = recibo.find('.//sii:DocumentoRecibo', SII_NS)
+                if doc_recibo is None:
+                    doc_recibo = recibo.find('.//DocumentoRecibo')
                 if doc_recibo is None:
-                    print(f'     ⚠ Recibo {idx+1} no tiene DocumentoRecibo, saltando...')
+                    _logger.warning('Recibo %s no tiene DocumentoRecibo, no se firma', idx + 1)
                     continue
 
                 doc_id = doc_recibo.get('ID', f'R{idx+1:02d}')
-                print(f'     Firmando Recibo {idx+1} (ID={doc_id})...')
-
-                # Calcular digest del DocumentoRecibo
-                node_digest = base64.b64encode(
-                    hashlib.sha1(etree.tostring(doc_recibo, method='c14n')).digest()
-                ).decode()
-
-                # Crear SignedInfo
-                signed_info = self.env['ir.qweb']._render('l10n_cl_edi.signed_info_template_with_xsi', {
-                    'uri': '#{}'.format(doc_id),
-                    'digest_value': node_digest,
-                })
-
-                # Canonicalizar SignedInfo
-                signed_info_c14n = Markup(etree.tostring(
-                    etree.fromstring(signed_info),
-                    method='c14n',
-                    exclusive=False,
-                    with_comments=False,
-                    inclusive_ns_prefixes=None
-                ).decode())
-
-                # Obtener claves públicas
-                e, n = digital_signature._get_public_key_numbers_bytes(formatting='base64')
-
-                # Firmar
-                signature_value = digital_signature._sign(
-                    re.sub(r'\n\s*', '', signed_info_c14n),
-                    hashing_algorithm='sha1',
-                    formatting='base64'
-                ).decode()
-
-                # Crear elemento Signature
-                signature = self.env['ir.qweb']._render('l10n_cl_edi.signature_template', {
-                    'signed_info': signed_info_c14n,
-                    'signature_value': signature_value,
-                    'modulus': n.decode(),
-                    'exponent': e.decode(),
-                    'certificate': '\n' + textwrap.fill(
-                        digital_signature._get_der_certificate_bytes(formatting='base64').decode(),
-                        64
-                    ),
-                })
-
-                if isinstance(signature, bytes):
-                    signature = signature.decode('utf-8')
-                signature_element = etree.fromstring(Markup(signature.strip()))
 
                 # Insertar firma en el Recibo (después de DocumentoRecibo)
-                recibo.append(signature_element)
-                print(f'     ✓ Recibo {idx+1} firmado')
-
-            # 4. Ahora firmar todo el SetRecibos
-            print(f'     Firmando SetRecibos completo...')
-
-            # Calcular digest del SetRecibos
-            setrecibos_digest = base64.b64encode(
-                hashlib.sha1(etree.tostring(set_recibos, method='c14n')).digest()
-            ).decode()
-
-            # Crear SignedInfo para SetRecibos
-            signed_info_set = self.env['ir.qweb']._render('l10n_cl_edi.signed_info_template_with_xsi', {
-                'uri': '#{}'.format(setrecibos_id),
-                'digest_value': setrecibos_digest,
-            })
-
-            # Canonicalizar
-            signed_info_set_c14n = Markup(etree.tostring(
-                etree.fromstring(signed_info_set),
-                method='c14n',
-                exclusive=False,
-                with_comments=False,
-                inclusive_ns_prefixes=None
-            ).decode())
-
-            # Obtener claves públicas
-            e, n = digital_signature._get_public_key_numbers_bytes(formatting='base64')
-
-            # Firmar SetRecibos
-            signature_value_set = digital_signature._sign(
-                re.sub(r'\n\s*', '', signed_info_set_c14n),
-                hashing_algorithm='sha1',
-                formatting='base64'
-            ).decode()
-
-            # Crear elemento Signature para SetRecibos
-            signature_set = self.env['ir.qweb']._render('l10n_cl_edi.signature_template', {
-                'signed_info': signed_info_set_c14n,
-                'signature_value': signature_value_set,
-                'modulus': n.decode(),
-                'exponent': e.decode(),
-                'certificate': '\n' + textwrap.fill(
-                    digital_signature._get_der_certificate_bytes(formatting='base64').decode(),
-                    64
-                ),
-            })
-
-            if isinstance(signature_set, bytes):
-                signature_set = signature_set.decode('utf-8')
-            signature_set = Markup(signature_set.strip())
-
-            # 5. Insertar firma del SetRecibos en el XML raíz
-            root_tag = root.tag.split('}')[-1] if '}' in root.tag else root.tag
-            tag_to_replace = Markup('</{}>'.format(root_tag))
-
-            # Convertir root actualizado a string
-            xml_with_recibo_sigs = etree.tostring(root, encoding='unicode')
-
-            # Insertar firma del SetRecibos antes del cierre de EnvioRecibos
-            full_doc = Markup(xml_with_recibo_sigs).replace(tag_to_replace, signature_set + '\n' + tag_to_replace)
-
-            print(f'     ✓ SetRecibos firmado')
-            print(f'     ✓ Total de firmas: {len(recibos) + 1}')
-
-            # Retornar con declaración XML
-            return Markup('<?xml version="1.0" encoding="ISO-8859-1" ?>\n') + full_doc
+                recibo.append(self._sign_node(doc_recibo, doc_id, digital_signature))
+
+            # 2. Firmar todo el SetRecibos (incluye las firmas de los Recibos)
+            self._append_signature(root, self._sign_node(set_recibos, setrecibos_id, digital_signature))
 
         except Exception as e:
-            print(f'\n     ❌ ERROR en _sign_envio_recibos: {e}')
-            import traceback
-            traceback.print_exc()
             raise UserError(_('Error al firmar EnvioRecibos: %s') % str(e))
 
-    def _sign_xmlsec_direct(self, xml_content, digital_signature, uri):
+    def _sign_xmlsec_direct(self, root, id_index, digital_signature, uri):
         """
-        Firma un XML usando el mismo método que _sign_libro().
+        Firma el nodo con ID=uri e inserta la firma antes del cierre de la raíz.
+
+        Este método funciona para DTEs, EnvioDTE y RespuestaDTE.
 
-        Este método funciona para DTEs, EnvioDTE, RespuestaDTE y EnvioRecibos.
+        Args:
+            root (etree._Element): Raíz del documento (se modifica)
+            id_index (dict): Índice ID -> nodo (ver _index_signing_tree)
+            digital_signature: ClientCertificate
+            uri (str): URI de referencia (ej: 'Resultado', 'SetDoc')
+        """
+        signed_info_c14n = self._prepare_xmlsec_direct(id_index, uri)
+        try:
+            signature_value = self._compute_signature_value(digital_signature, signed_info_c14n)
+        except Exception as e:
+            raise UserError(_('Error al firmar el documento: %s') % str(e))
+        self._complete_xmlsec_direct(root, signed_info_c14n, signature_value, digital_signature.key_info)
+
+    def _prepare_xmlsec_direct(self, id_index, uri):
+        """
+        Primera etapa de _sign_xmlsec_direct: todo lo previo al cálculo RSA.
 
         Args:
-            xml_content (str): XML sin firmar (sin declaración XML)
-            digital_signature: Objeto certificate.certificate
-            uri (str): URI de referencia (ej: 'Resultado', 'SetRecibos', 'SetDoc')
+            id_index (dict): Índice ID -> nodo
+            uri (str): ID del nodo a firmar
 
         Returns:
-            str: XML firmado
+            str: SignedInfo canonicalizado
         """
+        target_node = id_index.get(uri)
+        if target_node is None:
+            raise UserError(_('No se encontró el nodo con ID="%s" para firmar') % uri)
         try:
-            from lxml import etree
-            from markupsafe import Markup
-            import re
-            import hashlib
-            import textwrap
-
-            print(f'\n  🔐 Firmando documento...')
-            print(f'     URI: #{uri}')
-
-            # 1. Preparar el mensaje
-            digest_value = Markup(re.sub(r'\n\s*$', '', xml_content, flags=re.MULTILINE))
-
-            # 2. Parsear el XML
-            root = etree.fromstring(digest_value)
-
-            # 3. Buscar el nodo a firmar por ID
-            target_node = None
-            for elem in root.iter():
-                if elem.get('ID') == uri:
-                    target_node = elem
-                    print(f'     ✓ Nodo encontrado: {elem.tag}')
-                    break
-
-            if target_node is None:
-                raise UserError(_('No se encontró el nodo con ID="%s" para firmar') % uri)
-
-            # 4. Calcular digest del nodo
-            node_digest = base64.b64encode(
-                hashlib.sha1(etree.tostring(target_node, method='c14n')).digest()
-            ).decode()
-
-            print(f'     ✓ Digest calculado: {node_digest[:20]}...')
-
-            # 5. Crear SignedInfo usando template
-            signed_info = self.env['ir.qweb']._render('l10n_cl_edi.signed_info_template_with_xsi', {
-                'uri': '#{}'.format(uri),
-                'digest_value': node_digest,
-            })
-
-            print(f'     ✓ SignedInfo creado')
-
-            # 6. Canonicalizar SignedInfo
-            signed_info_c14n = Markup(etree.tostring(
-                etree.fromstring(signed_info),
-                method='c14n',
-                exclusive=False,
-                with_comments=False,
-                inclusive_ns_prefixes=None
-            ).decode())
-
-            print(f'     ✓ SignedInfo canonicalizado')
-
-            # 7. Obtener las claves públicas del certificado
-            e, n = digital_signature._get_public_key_numbers_bytes(formatting='base64')
-
-            print(f'     ✓ Claves públicas obtenidas')
-
-            # 8. Firmar el SignedInfo usando _sign() del certificado
-            signature_value = digital_signature._sign(
-                re.sub(r'\n\s*', '', signed_info_c14n),
-                hashing_algorithm='sha1',
-                formatting='base64'
-            ).decode()
-
-            print(f'     ✓ Firma digital generada')
-
-            # 9. Crear el elemento Signature completo
-            signature = self.env['ir.qweb']._render('l10n_cl_edi.signature_template', {
-                'signed_info': signed_info_c14n,
-                'signature_value': signature_value,
-                'modulus': n.decode(),
-                'exponent': e.decode(),
-                'certificate': '\n' + textwrap.fill(
-                    digital_signature._get_der_certificate_bytes(formatting='base64').decode(),
-                    64
-                ),
-            })
-
-            # 9.1 Limpiar espacios en blanco al inicio y final de la firma
-            if isinstance(signature, bytes):
-                signature = signature.decode('utf-8')
-            signature = Markup(signature.strip())
-
-            print(f'     ✓ Elemento Signature creado')
-
-            # 10. Insertar la firma en el XML
-            # Determinar el tag de cierre según el tipo de documento
-            root_tag = root.tag.split('}')[-1] if '}' in root.tag else root.tag
-            tag_to_replace = Markup('</{}>'.format(root_tag))
-
-            # Insertar firma antes del cierre del elemento raíz
-            full_doc = digest_value.replace(tag_to_replace, signature + '\n' + tag_to_replace)
-
-            print(f'     ✓ Firma insertada en el XML')
-
-            # 11. Retornar con declaración XML
-            return Markup('<?xml version="1.0" encoding="ISO-8859-1" ?>\n') + full_doc
-
+            return self._prepare_signature(target_node, uri)
         except Exception as e:
-            print(f'\n     ❌ ERROR en _sign_xmlsec_direct: {e}')
-            import traceback
-            traceback.print_exc()
             raise UserError(_('Error al firmar el documento: %s') % str(e))
+
+    def _complete_xmlsec_direct(self, root, signed_info_c14n, signature_value, key_info):
+        """
+        Segunda etapa de _sign_xmlsec_direct: arma la firma y la inserta
+        antes del cierre del elemento raíz.
+
+        Args:
+            root (etree._Element): Raíz del documento (se modifica)
+            signed_info_c14n (str): Resultado de _prepare_xmlsec_direct
+            signature_value (str): Firma RSA del SignedInfo en base64
+            key_info (KeyInfoBlock): Datos de la llave pública precalculados
+        """
+        self._append_signature(root, self._build_signature_element(signed_info_c14n, signature_value, key_info))
+
+    @api.model
+    def sign_many(self, documents):
+        """
+        Firma en lote DTEs (l10n_cl_edi.certification.generated.document).
+
+        Por cada proyecto el certificado del cliente se carga una sola vez, los
+        XML se preparan de una pasada y las firmas RSA se calculan en paralelo
+        (cryptography libera el GIL). El resultado se guarda con una escritura
+        de estado común y un único mensaje en el chatter del proyecto.
+
+        Args:
+            documents: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            l10n_cl_edi.certification.generated.document: Documentos firmados
+        """
+        documents_by_project = {}
+        for doc in documents:
+            if not doc.xml_dte_file:
+                raise UserError(_('No hay XML para firmar.'))
+            documents_by_project.setdefault(doc.project_id, documents.browse())
+            documents_by_project[doc.project_id] |= doc
+
+        for project, project_docs in documents_by_project.items():
+            client_info = project.client_info_id
+            if not client_info:
+                raise UserError(_('El proyecto no tiene información del cliente configurada.'))
+
+            with diagnose('sign_many', project=project.id, documents=len(project_docs)) as diag:
+                with diag.stage('certificate'):
+                    try:
+                        certificate = client_info.get_signing_certificate()
+                    except Exception as e:
+                        raise UserError(_('Error al obtener certificado del cliente:\n%s') % str(e))
+
+                with diag.stage('preflight'):
+                    contents = [self._read_dte_for_signing(doc) for doc in project_docs]
+                    self._check_dte_structure(project_docs, contents)
+
+                with diag.stage('prepare'):
+                    pending = [self._prepare_dte_signature(xml_content) for xml_content in contents]
+
+                with diag.stage('rsa'):
+                    with ThreadPoolExecutor(max_workers=min(self.SIGN_MAX_WORKERS, len(pending))) as executor:
+                        signature_values = list(executor.map(
+                            lambda item: self._compute_signature_value(certificate, item[1]),
+                            pending
+                        ))
+
+                with diag.stage('complete'):
+                    for doc, (root, signed_info_c14n), signature_value in zip(project_docs, pending, signature_values):
+                        self._complete_xmlsec_direct(root, signed_info_c14n, signature_value, certificate.key_info)
+                        signed_xml = self._serialize_signed(root)
+                        # Guardar XML firmado (ISO-8859-1 encoding requerido por SII)
+                        doc.xml_dte_signed = base64.b64encode(signed_xml.encode('ISO-8859-1', 'replace'))
+                    project_docs.write({'state': 'signed'})
+
+            project.with_context(
+                cert_subject=client_info.social_reason or 'Cliente',
+                documents_names=project_docs.mapped('complete_name'),
+            ).message_post_with_source(
+                source_ref=self.env.ref('l10n_cl_edi_certification.message_project_documents_signed'),
+                subtype_xmlid='mail.mt_note'
+            )
+
+        return documents
+
+    def _read_dte_for_signing(self, document):
+        """
+        Decodifica el XML sin firmar de un DTE.
+
+        Args:
+            document: l10n_cl_edi.certification.generated.document
+
+        Returns:
+            str: XML del DTE
+        """
+        # Decodificar el XML (ISO-8859-1 encoding requerido por SII)
+        xml_content = base64.b64decode(document.xml_dte_file).decode('ISO-8859-1')
+
+        # Des-escapar entidades HTML si están presentes
+        if '&lt;' in xml_content or '&#34;' in xml_content:
+            xml_content = html.unescape(xml_content)
+        return xml_content
+
+    def _check_dte_structure(self, documents, contents):
+        """
+        Validación estructural previa a la firma (ver DteStructureValidator).
+        Informa de una vez los errores de todos los documentos.
+
+        Args:
+            documents: l10n_cl_edi.certification.generated.document
+            contents (list): XML de cada documento (ver _read_dte_for_signing)
+        """
+        validator = DteStructureValidator()
+        errors = []
+        for doc, xml_content in zip(documents, contents):
+            doc_errors = validator.validate(xml_content)
+            if doc_errors:
+                errors.append('%s:\n%s' % (doc.display_name, '\n'.join('  • %s' % error for error in doc_errors)))
+        if errors:
+            raise UserError(_('Los documentos no pasan la validación estructural previa a la firma:\n\n%s')
+                            % '\n\n'.join(errors))
+
+    def _prepare_dte_signature(self, xml_content):
+        """
+        Prepara la firma de un DTE para sign_many (sin el cálculo RSA).
+
+        Args:
+            xml_content (str): XML del DTE (ver _read_dte_for_signing)
+
+        Returns:
+            tuple: (raíz del documento, SignedInfo canonicalizado)
+        """
+        root = self._parse_for_signing(xml_content)
+        id_index, targets = self._index_signing_tree(root)
+        doc_element = targets.get('Documento')
+        doc_id = doc_element.get('ID') if doc_element is not None else 'DTE-TEMP'
+
+        return root, self._prepare_xmlsec_direct(id_index, doc_id)
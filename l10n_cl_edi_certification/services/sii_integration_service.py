@@ -3,10 +3,50 @@ from odoo import models, api, _
 from odoo.exceptions import UserError
 import base64
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from lxml import etree
+import requests
+
+from odoo.addons.l10n_cl_edi.models.l10n_cl_edi_util import SERVER_URL
 
 _logger = logging.getLogger(__name__)
 
+# Endpoint de upload del SII (sobres y libros), relativo al servidor de SERVER_URL
+DTE_UPLOAD_PATH = '/cgi_dte/UPL/DTEUpload'
+UPLOAD_TIMEOUT = 60
+# Intentos de cada upload ante errores de conexión o timeout
+UPLOAD_RETRIES = 3
+
+
+def _post_upload(upload):
+    """
+    Sube un archivo al SII: un POST multipart, sin ORM ni entorno, para poder
+    ejecutarse en un hilo (ver SiiIntegrationService.send_envelopes).
+    Reintenta hasta UPLOAD_RETRIES veces si falla la conexión.
+
+    Args:
+        upload (dict): url, headers, data y files (ver _prepare_upload_request)
+
+    Returns:
+        bytes: Respuesta XML del SII
+    """
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        try:
+            response = requests.post(
+                upload['url'],
+                headers=upload['headers'],
+                data=upload['data'],
+                files=upload['files'],
+                timeout=UPLOAD_TIMEOUT,
+            )
+            break
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == UPLOAD_RETRIES:
+                raise
+            _logger.warning('Error de conexión con el SII (intento %d de %d): %s', attempt, UPLOAD_RETRIES, e)
+    response.raise_for_status()
+    return response.content
+
 
 class SiiIntegrationService(models.AbstractModel):
     """
@@ -17,6 +57,9 @@ class SiiIntegrationService(models.AbstractModel):
     _description = 'Servicio de Integración con SII'
     _inherit = 'l10n_cl.edi.util'  # Heredar utilidades de Enterprise
 
+    # Sobres que se suben al SII en paralelo en send_envelopes
+    SEND_MAX_WORKERS = 3
+
     def _log_xml_pretty(self, xml_data, label):
         """Helper para loggear XML de forma legible"""
         pass
@@ -109,6 +152,118 @@ class SiiIntegrationService(models.AbstractModel):
         Returns:
             tuple: (track_id, response_xml)
         """
+        results, errors = self.send_envelopes(envelope)
+        if envelope in errors:
+            raise UserError(errors[envelope])
+        return results[envelope]
+
+    @api.model
+    def send_envelopes(self, envelopes):
+        """
+        Envía varios sobres al SII en paralelo (p.ej. los sobres de un envío
+        dividido por EnvelopePlanner).
+
+        Todo lo que usa el ORM o el certificado (token, URL, headers,
+        parámetros) se resuelve en este hilo como datos simples; los hilos
+        solo hacen el POST HTTP de cada sobre (ver _post_upload).
+
+        Args:
+            envelopes: l10n_cl_edi.certification.envelope
+
+        Returns:
+            tuple: (dict sobre -> (track_id, response_xml), dict sobre -> mensaje de error)
+        """
+        results = {}
+        errors = {}
+        uploads = {}
+        tokens = {}
+        for envelope in envelopes:
+            try:
+                mode, certificate, params = self._prepare_envelope_upload(envelope)
+                # Un token por cliente y ambiente, obtenido antes de los hilos
+                token_key = (mode, envelope.project_id.client_info_id.id)
+                if token_key not in tokens:
+                    tokens[token_key] = self._get_token(mode, certificate)
+                uploads[envelope] = self._prepare_upload_request(mode, tokens[token_key], params)
+            except Exception as e:
+                errors[envelope] = str(e)
+
+        if uploads:
+            workers = min(self.SEND_MAX_WORKERS, len(uploads))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    envelope: executor.submit(_post_upload, upload)
+                    for envelope, upload in uploads.items()
+                }
+            for envelope, future in futures.items():
+                try:
+                    response = future.result()
+                    if not response:
+                        raise UserError(_('No se obtuvo respuesta del SII'))
+                    self._log_xml_pretty(response, 'RESPUESTA SII - ENVÍO DE SOBRE')
+                    results[envelope] = (self._extract_track_id(response), response)
+                except Exception as e:
+                    _logger.warning('Error al enviar el sobre %s al SII: %s', envelope.name, e)
+                    errors[envelope] = _('Error al enviar al SII: %s') % str(e)
+
+        return results, errors
+
+    def _upload(self, mode, certificate, params):
+        """
+        Sube un archivo al SII desde el hilo principal (p.ej. un libro), por
+        el mismo camino que send_envelopes.
+
+        Args:
+            mode (str): 'SIITEST' o 'SII'
+            certificate: Certificado temporal del cliente (ver _get_certificate)
+            params (dict): Parámetros del upload, con 'archivo'
+
+        Returns:
+            bytes: Respuesta XML del SII
+        """
+        token = self._get_token(mode, certificate)
+        return _post_upload(self._prepare_upload_request(mode, token, params))
+
+    def _prepare_upload_request(self, mode, token, params):
+        """
+        Arma la petición de upload al SII como datos simples, con los mismos
+        headers que exige el SII para DTEUpload (ver l10n_cl.edi.util).
+        Es el único lugar donde se arma la URL y los headers del upload.
+
+        Args:
+            mode (str): 'SIITEST' o 'SII'
+            token (str): Token de autenticación del SII
+            params (dict): Parámetros del upload (ver _prepare_envelope_upload)
+
+        Returns:
+            dict: url, headers, data y files para _post_upload
+        """
+        if not token:
+            raise UserError(_('No se obtuvo token de autenticación del SII'))
+        return {
+            'url': SERVER_URL[mode].replace('/DTEWS/', '') + DTE_UPLOAD_PATH,
+            'headers': {
+                'Accept': '*/*',
+                'Accept-Language': 'es-cl',
+                'User-Agent': 'Mozilla/4.0 (compatible; PROG 1.0; Windows NT 5.0; YComp 5.0.2.4)',
+                'Referer': 'http://www.odoo.com',
+                'Cache-Control': 'no-cache',
+                'Cookie': f'TOKEN={token}',
+            },
+            'data': {key: value for key, value in params.items() if key != 'archivo'},
+            'files': {'archivo': params['archivo']},
+        }
+
+    def _prepare_envelope_upload(self, envelope):
+        """
+        Prepara con el ORM todo lo necesario para subir el sobre.
+
+        Args:
+            envelope: l10n_cl_edi.certification.envelope
+
+        Returns:
+            tuple: (mode, certificado temporal, parámetros del upload)
+        """
         project = envelope.project_id
         client_info = project.client_info_id
 
@@ -122,28 +277,8 @@ class SiiIntegrationService(models.AbstractModel):
             # Crear certificado temporal del cliente
             certificate = self._get_certificate(client_info, project.company_id)
 
-            # Preparar XML (ISO-8859-1 encoding requerido por SII)
-            xml_content = base64.b64decode(envelope.envelope_xml_signed).decode('ISO-8859-1')
-
-            # LOG: Mostrar el XML completo del sobre firmado
-            self._log_xml_pretty(xml_content, f'XML ENVIODTE FIRMADO COMPLETO - {envelope.name}')
-
-            # ============================================================================
-            # 🛑 MODO DEBUG: VERIFICAR XML ANTES DE ENVIAR
-            # ============================================================================
-            # COMENTADO - XML verificado, listo para enviar al SII
-            # raise UserError(_(
-            #     '🛑 MODO DEBUG ACTIVADO\n\n'
-            #     'El sobre NO se envió al SII.\n'
-            #     'Revisa los logs para verificar que el XML esté correcto.\n\n'
-            #     'Información del sobre:\n'
-            #     '- Nombre: %s\n'
-            #     '- Documentos: %d\n'
-            #     '- Tamaño XML: %d caracteres\n\n'
-            #     'Para enviar al SII, comenta el "raise UserError" en:\n'
-            #     'services/sii_integration_service.py línea ~177'
-            # ) % (envelope.name, envelope.documents_count, len(xml_content)))
-            # ============================================================================
+            # XML firmado tal cual (ISO-8859-1 encoding requerido por SII)
+            xml_content = base64.b64decode(envelope.envelope_xml_signed)
 
             # Normalizar RUT del cliente (remover puntos, mantener guión y DV)
             formatted_rut = self._l10n_cl_format_vat(client_info.rut)  # Ej: "76393041-K"
@@ -155,38 +290,14 @@ class SiiIntegrationService(models.AbstractModel):
                 'dvSender': formatted_rut[-1],  # Solo el DV: "K"
                 'rutCompany': formatted_rut[:-2],  # Mismo RUT (es el emisor)
                 'dvCompany': formatted_rut[-1],
-                'archivo': (file_name, xml_content.encode('ISO-8859-1', 'replace'), 'text/xml'),
+                'archivo': (file_name, xml_content, 'text/xml'),
             }
-
-            # Sitio web del cliente (usar sitio genérico)
-            company_website = 'http://www.odoo.com'
-
-            # Enviar usando método heredado: _send_xml_to_sii(mode, company_website, params, digital_signature, post)
-            response = self._send_xml_to_sii(
-                mode,
-                company_website,
-                params,
-                certificate,
-                '/cgi_dte/UPL/DTEUpload'  # Endpoint para envío de DTEs
-            )
-
-            if not response:
-                raise UserError(_('No se obtuvo respuesta del SII'))
-
-            # LOG: Mostrar respuesta del SII
-            self._log_xml_pretty(response, 'RESPUESTA SII - ENVÍO DE SOBRE')
-
-            # Extraer Track ID de la respuesta
-            track_id = self._extract_track_id(response)
-
-            return track_id, response
-
         except Exception as e:
-            print(f'\n❌ ERROR AL ENVIAR SOBRE AL SII: {str(e)}')
-            import traceback
-            print(traceback.format_exc())
+            _logger.exception('Error al preparar el envío del sobre %s', envelope.name)
             raise UserError(_('Error al enviar al SII: %s') % str(e))
 
+        return mode, certificate, params
+
     def _extract_track_id(self, response_xml):
         """Extrae el Track ID de la respuesta del SII"""
         try:
@@ -271,12 +382,47 @@ class SiiIntegrationService(models.AbstractModel):
         Returns:
             tuple: (track_id, response_xml)
         """
-        project = book.project_id
-        client_info = project.client_info_id
-
         if not book.book_xml_signed:
             raise UserError(_('El libro debe estar firmado antes de enviar.'))
 
+        book_type_str = 'Ventas' if book.book_type == 'sale' else 'Compras'
+        file_name = f'Libro{book_type_str}_{book.period.replace("-", "")}.xml'
+        return self._send_book_xml(book, base64.b64decode(book.book_xml_signed), file_name, book.name)
+
+    def send_book_segment(self, segment):
+        """
+        Envía un segmento (TipoEnvio PARCIAL/FINAL) de un LibroCompraVenta al SII.
+
+        Args:
+            segment: l10n_cl_edi.certification.book.segment
+
+        Returns:
+            tuple: (track_id, response_xml)
+        """
+        if not segment.segment_xml_signed:
+            raise UserError(_('El segmento %s debe estar firmado antes de enviar.') % segment.display_name)
+
+        book = segment.book_id
+        book_type_str = 'Ventas' if book.book_type == 'sale' else 'Compras'
+        file_name = f'Libro{book_type_str}_{book.period.replace("-", "")}_S{segment.segment_number}.xml'
+        return self._send_book_xml(book, base64.b64decode(segment.segment_xml_signed), file_name, segment.display_name)
+
+    def _send_book_xml(self, book, xml_bytes, file_name, label):
+        """
+        Sube al SII el XML firmado de un libro o de uno de sus segmentos.
+
+        Args:
+            book: l10n_cl_edi.certification.book
+            xml_bytes (bytes): XML firmado (ISO-8859-1)
+            file_name (str): Nombre del archivo subido
+            label (str): Nombre del libro o segmento (para el log)
+
+        Returns:
+            tuple: (track_id, response_xml)
+        """
+        project = book.project_id
+        client_info = project.client_info_id
+
         # Mapear environment a mode
         mode = 'SIITEST' if client_info.environment == 'certification' else 'SII'
 
@@ -285,10 +431,10 @@ class SiiIntegrationService(models.AbstractModel):
             certificate = self._get_certificate(client_info, project.company_id)
 
             # Preparar XML (ISO-8859-1 encoding requerido por SII)
-            xml_content = base64.b64decode(book.book_xml_signed).decode('ISO-8859-1')
+            xml_content = xml_bytes.decode('ISO-8859-1')
 
             # LOG: Mostrar el XML completo del libro firmado
-            self._log_xml_pretty(xml_content, f'XML LIBRO {book.book_type.upper()} FIRMADO COMPLETO - {book.name}')
+            self._log_xml_pretty(xml_content, f'XML LIBRO {book.book_type.upper()} FIRMADO COMPLETO - {label}')
 
             # IMPORTANTE: Para libros, los parámetros deben coincidir con el XML:
             # - rutSender/dvSender = RutEnvia del XML (RUT del cliente/certificado)
@@ -302,9 +448,6 @@ class SiiIntegrationService(models.AbstractModel):
             client_rut = self._l10n_cl_format_vat(client_info.rut)  # RutEnvia: "8530047-4"
 
             # Preparar parámetros para el upload
-            book_type_str = 'Ventas' if book.book_type == 'sale' else 'Compras'
-            file_name = f'Libro{book_type_str}_{book.period.replace("-", "")}.xml'
-
             params = {
                 # rutSender: Quien envía (RutEnvia en XML = cliente/certificado)
                 'rutSender': client_rut[:-2],  # "8530047"
@@ -317,17 +460,8 @@ class SiiIntegrationService(models.AbstractModel):
                 'archivo': (file_name, xml_content.encode('ISO-8859-1', 'replace'), 'text/xml'),
             }
 
-            # Sitio web del cliente (usar sitio genérico)
-            company_website = 'http://www.odoo.com'
-
-            # Enviar usando método heredado: _send_xml_to_sii(mode, company_website, params, digital_signature, post)
-            response = self._send_xml_to_sii(
-                mode,
-                company_website,
-                params,
-                certificate,
-                '/cgi_dte/UPL/DTEUpload'  # Mismo endpoint que DTEs
-            )
+            # Mismo endpoint y headers que los sobres (ver _prepare_upload_request)
+            response = self._upload(mode, certificate, params)
 
             if not response:
                 raise UserError(_('No se obtuvo respuesta del SII'))
@@ -341,9 +475,7 @@ class SiiIntegrationService(models.AbstractModel):
             return track_id, response
 
         except Exception as e:
-            print(f'\n❌ ERROR AL ENVIAR LIBRO AL SII - Libro: {book.name} - Error: {str(e)}')
-            import traceback
-            print(traceback.format_exc())
+            _logger.exception('Error al enviar libro al SII - Libro: %s', label)
             raise UserError(_('Error al enviar libro al SII: %s') % str(e))
 
     def _parse_status_response(self, response_xml):
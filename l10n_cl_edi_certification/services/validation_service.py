@@ -1,11 +1,24 @@
 # -*- coding: utf-8 -*-
-from odoo import models, api, _
+from odoo import models, api, tools, _
 from odoo.exceptions import UserError
 import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from lxml import etree
+
+from .xsd_registry import XsdRegistry
 
 import logging
 _logger = logging.getLogger(__name__)
 
+# Ubicaciones de los XSD subidos como ir.attachment (orden de prioridad):
+# (prefijo del nombre del adjunto, descripción)
+SCHEMA_ATTACHMENT_LOCATIONS = [
+    (None, 'Sin prefijo (archivos del sistema)'),
+    ('l10n_cl_edi', 'Odoo Enterprise l10n_cl_edi'),
+    ('l10n_cl_edi_certification', 'Este módulo'),
+]
+
 class ValidationService(models.AbstractModel):
     """
     Servicio para Validación de DTEs.
@@ -14,6 +27,11 @@ class ValidationService(models.AbstractModel):
     _name = 'l10n_cl_edi.validation.service'
     _description = 'Servicio de Validación de DTEs'
 
+    # Hilos para validar XSD y firma en validate_many (lxml libera el GIL)
+    VALIDATE_MAX_WORKERS = 4
+    # Documentos decodificados y parseados a la vez en validate_many
+    VALIDATE_CHUNK_SIZE = 200
+
     @api.model
     def validate_document(self, document):
         """
@@ -25,35 +43,72 @@ class ValidationService(models.AbstractModel):
         Returns:
             tuple: (bool, list) - (es_válido, mensajes)
         """
-        messages = []
+        return self.validate_many(document)[document]
 
-        # Validar que exista XML firmado
-        if not document.xml_dte_signed:
-            messages.append(_('El documento no está firmado'))
-            return False, messages
+    @api.model
+    def validate_many(self, documents):
+        """
+        Valida varios documentos generados.
 
-        # Obtener XML como bytes (para validación XSD) y como string (para otras validaciones)
-        xml_bytes = base64.b64decode(document.xml_dte_signed)
-        xml_content = xml_bytes.decode('ISO-8859-1')
+        El esquema XSD se resuelve una sola vez para todo el lote. Cada XML se
+        decodifica y se parsea una sola vez, y el mismo árbol se usa para la
+        validación XSD y la de firma; ambas corren en hilos porque no usan el
+        ORM. Las reglas de negocio (que leen campos) corren en este hilo.
 
-        # 1. Validar esquema XSD (pasar bytes porque tiene declaración de encoding)
-        is_valid_schema, schema_messages = self._validate_schema(xml_bytes, 'DTE')
-        messages.extend(schema_messages)
+        Args:
+            documents: l10n_cl_edi.certification.generated.document
 
-        # 2. Validar firma digital
+        Returns:
+            dict: Documento -> (bool, list) - (es_válido, mensajes)
+        """
+        results = {}
+        schema_check = self._get_schema_check('DTE')
         signature_service = self.env['l10n_cl_edi.signature.service']
-        is_valid_signature, signature_message = signature_service.validate_signature(xml_content)
-        if not is_valid_signature:
-            messages.append(signature_message)
 
-        # 3. Validar reglas de negocio
-        business_valid, business_messages = self._validate_business_rules(document)
-        messages.extend(business_messages)
+        def check_xml(xml_bytes):
+            try:
+                xml_doc = etree.fromstring(xml_bytes)
+            except Exception as e:
+                return (False, [_('Error en validación de esquema: %s') % str(e)]), \
+                    (False, _('Error al validar firma: %s') % str(e))
+            return schema_check(xml_doc), signature_service._validate_signature_tree(xml_doc)
+
+        for start in range(0, len(documents), self.VALIDATE_CHUNK_SIZE):
+            chunk = documents[start:start + self.VALIDATE_CHUNK_SIZE]
+
+            pending = []
+            for document in chunk:
+                # Validar que exista XML firmado
+                if not document.xml_dte_signed:
+                    results[document] = (False, [_('El documento no está firmado')])
+                    continue
+                pending.append((document, base64.b64decode(document.xml_dte_signed)))
+
+            # 1. Esquema XSD y 2. firma digital (pasar bytes porque tiene declaración de encoding)
+            workers = min(self.VALIDATE_MAX_WORKERS, len(pending))
+            if workers <= 1:
+                checks = [check_xml(xml_bytes) for _document, xml_bytes in pending]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    checks = list(executor.map(lambda item: check_xml(item[1]), pending))
 
-        # Documento válido si pasa todas las validaciones
-        is_valid = is_valid_schema and is_valid_signature and business_valid
+            for (document, _xml_bytes), (schema_result, signature_result) in zip(pending, checks):
+                is_valid_schema, schema_messages = schema_result
+                is_valid_signature, signature_message = signature_result
+                messages = list(schema_messages)
+                if not is_valid_signature:
+                    messages.append(signature_message)
 
-        return is_valid, messages
+                # 3. Validar reglas de negocio
+                business_valid, business_messages = self._validate_business_rules(document)
+                messages.extend(business_messages)
+
+                # Documento válido si pasa todas las validaciones
+                results[document] = (is_valid_schema and is_valid_signature and business_valid, messages)
+
+            chunk.invalidate_recordset(['xml_dte_signed'])
+
+        return results
 
     @api.model
     def validate_envelope(self, envelope):
@@ -67,9 +122,21 @@ class ValidationService(models.AbstractModel):
         xml_bytes = base64.b64decode(envelope.envelope_xml_signed)
 
         # Validar esquema XSD de EnvioDTE (pasar bytes porque tiene declaración de encoding)
-        is_valid, schema_messages = self._validate_schema(xml_bytes, 'EnvioDTE')
+        try:
+            xml_doc = etree.fromstring(xml_bytes)
+        except Exception as e:
+            return False, [_('Error en validación de esquema: %s') % str(e)]
+        is_valid, schema_messages = self._get_schema_check('EnvioDTE')(xml_doc)
         messages.extend(schema_messages)
 
+        # Validar firmas (la del SetDTE y la de cada DTE; los DTEs ya
+        # verificados y sin cambios no se vuelven a verificar)
+        signature_service = self.env['l10n_cl_edi.signature.service']
+        is_valid_signature, signature_message = signature_service._validate_signature_tree(xml_doc)
+        if not is_valid_signature:
+            messages.append(signature_message)
+            is_valid = False
+
         # Validar que tenga documentos
         if not envelope.generated_document_ids:
             messages.append(_('El sobre no tiene documentos'))
@@ -79,48 +146,50 @@ class ValidationService(models.AbstractModel):
 
     def _validate_schema(self, xml_bytes, schema_type):
         try:
-            from odoo.tools.xml_utils import validate_xml_from_attachment
-            from lxml import etree
-            import logging
-
-            _logger = logging.getLogger(__name__)
-            messages = []
-
-            # Nombre del archivo XSD
-            xsd_filename = f'{schema_type}_v10.xsd'
-
-            # Intentar múltiples ubicaciones (orden de prioridad)
-            search_locations = [
-                (None, 'Sin prefijo (archivos del sistema)'),
-                ('l10n_cl_edi', 'Odoo Enterprise l10n_cl_edi'),
-                ('l10n_cl_edi_certification', 'Este módulo'),
-            ]
-
-            # Intentar validar con cada ubicación
-            for prefix, description in search_locations:
-                try:
-                    xml_bytes.decode('ISO-8859-1')
-
-                    validate_xml_from_attachment(
-                        self.env,
-                        xml_bytes,
+            xml_doc = etree.fromstring(xml_bytes)
+        except Exception as e:
+            _logger.exception("Error inesperado en validación de esquema:")
+            return False, [_('Error en validación de esquema: %s') % str(e)]
+        return self._get_schema_check(schema_type)(xml_doc)
+
+    def _get_schema_check(self, schema_type):
+        """
+        Resuelve el esquema XSD a usar (módulo o adjunto) y retorna la función
+        que valida un documento contra él. La resolución usa el ORM; la función
+        retornada no, y se puede llamar desde varios hilos.
+
+        Args:
+            schema_type (str): Nombre del esquema (ej: 'DTE', 'EnvioDTE')
+
+        Returns:
+            callable: Documento (lxml) -> (bool, list) - (es_válido, mensajes)
+        """
+        # Nombre del archivo XSD
+        xsd_filename = f'{schema_type}_v10.xsd'
+
+        try:
+            # Esquema incluido en el módulo (carpeta schemas), compilado una vez por proceso
+            schema = XsdRegistry.get(schema_type)
+            description = "Esquemas del módulo"
+
+            # Esquema subido como adjunto (ubicación resuelta una vez por tipo de esquema)
+            if schema is None:
+                location = self._get_schema_location(xsd_filename)
+                if location:
+                    prefix, description, version = location
+                    schema = XsdRegistry.get_from_sources(
+                        f'{prefix}.{xsd_filename}' if prefix else xsd_filename,
                         xsd_filename,
-                        prefix=prefix
+                        version,
+                        self._schema_source_loader(prefix),
                     )
-                    # Si llegamos aquí, la validación pasó
-                    messages.append(f"✅ Validación XSD exitosa usando: {description}")
-                    return True, messages
+        except Exception as e:
+            _logger.exception("Error inesperado en validación de esquema:")
+            error = _('Error en validación de esquema: %s') % str(e)
+            return lambda xml_doc: (False, [error])
 
-                except FileNotFoundError:
-                    continue
-                except etree.DocumentInvalid as e:
-                    # El XSD existe pero el XML no es válido
-                    for error in e.error_log:
-                        error_msg = f"Línea {error.line}: {error.message}"
-                        messages.append(error_msg)
-                    return False, messages
-
-            messages.append(_(
+        if schema is None:
+            warning = _(
                 'Advertencia: Validación XSD omitida (esquema no encontrado).\n'
                 'Ubicaciones buscadas:\n'
                 '  1. {xsd} (sin prefijo - archivos del sistema)\n'
@@ -129,14 +198,64 @@ class ValidationService(models.AbstractModel):
                 'Para habilitar validación:\n'
                 '  • Use el wizard: Certificación SII → Configuración → Cargar Esquemas XSD\n'
                 '  • O instale el módulo l10n_cl_edi de Odoo Enterprise'
-            ).format(xsd=xsd_filename))
-            return True, messages  # No fallar si no hay esquema
+            ).format(xsd=xsd_filename)
+            return lambda xml_doc: (True, [warning])  # No fallar si no hay esquema
 
-        except Exception as e:
-            import logging
-            _logger = logging.getLogger(__name__)
-            _logger.exception("Error inesperado en validación de esquema:")
-            return False, [_('Error en validación de esquema: %s') % str(e)]
+        success = f"✅ Validación XSD exitosa usando: {description}"
+
+        def check(xml_doc):
+            try:
+                errors = schema.validate(xml_doc)
+            except Exception as e:
+                _logger.exception("Error inesperado en validación de esquema:")
+                return False, [_('Error en validación de esquema: %s') % str(e)]
+            if errors:
+                return False, errors
+            return True, [success]
+
+        return check
+
+    @tools.ormcache('xsd_filename')
+    def _get_schema_location(self, xsd_filename):
+        """
+        Busca en qué ubicación (prefijo de ir.attachment) está instalado un
+        esquema XSD. Se calcula una vez por esquema; el caché se limpia al
+        subir o eliminar esquemas (ver XsdUploadWizard).
+
+        Args:
+            xsd_filename (str): Nombre del archivo XSD (ej: 'DTE_v10.xsd')
+
+        Returns:
+            tuple: (prefijo, descripción, versión) o None si no está instalado.
+                   La versión son los checksums de los XSD con ese prefijo, de
+                   modo que cambiar una dependencia también recompila.
+        """
+        Attachment = self.env['ir.attachment'].sudo()
+        for prefix, description in SCHEMA_ATTACHMENT_LOCATIONS:
+            name = f'{prefix}.{xsd_filename}' if prefix else xsd_filename
+            if not Attachment.search_count([('name', '=', name)], limit=1):
+                continue
+            name_pattern = f'{prefix}.%.xsd' if prefix else '%.xsd'
+            version = tuple(sorted(
+                (attachment['name'], attachment['checksum'])
+                for attachment in Attachment.search_read([('name', '=like', name_pattern)], ['name', 'checksum'])
+            ))
+            return prefix, description, version
+        return None
+
+    def _schema_source_loader(self, prefix):
+        """
+        Retorna una función que carga el contenido de un XSD (y de los que
+        importa) desde ir.attachment, con el mismo prefijo de nombre.
+        """
+        Attachment = self.env['ir.attachment'].sudo()
+
+        def load_source(filename):
+            name = f'{prefix}.{filename}' if prefix else filename
+            attachment = Attachment.search([('name', '=', name)], limit=1)
+            return attachment.raw if attachment else None
+
+        return load_source
 
     def _validate_business_rules(self, document):
         """
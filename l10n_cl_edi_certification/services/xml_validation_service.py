@@ -2,7 +2,9 @@
 from odoo import models, api, _
 from odoo.exceptions import UserError
 from lxml import etree
-import os
+
+from .dte_structure_validator import DteStructureValidator, XML_DECLARATION_RE
+from .xsd_registry import XsdRegistry, SCHEMAS_DIR
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -32,47 +34,18 @@ class XmlValidationService(models.AbstractModel):
                 - errors (list): Lista de errores encontrados
         """
         try:
-            # Ruta al esquema XSD
-            module_path = os.path.dirname(os.path.dirname(__file__))
-            xsd_path = os.path.join(module_path, 'schemas', 'LibroCV_v10.xsd')
-
-            if not os.path.exists(xsd_path):
-                _logger.warning(f'Esquema XSD no encontrado en: {xsd_path}')
+            # Esquema compilado (una vez por proceso) desde el registro de XSD
+            schema = XsdRegistry.get('LibroCV')
+            if schema is None:
+                _logger.warning('Esquema XSD LibroCV_v10.xsd no encontrado en: %s', SCHEMAS_DIR)
                 return True, []
 
-
-            # Cargar el esquema XSD
-            # IMPORTANTE: Cambiar el directorio de trabajo para que lxml pueda resolver
-            # las referencias relativas a otros XSD (xmldsignature_v10.xsd, LceCoCertif_v10.xsd, etc.)
-            schemas_dir = os.path.join(module_path, 'schemas')
-            current_dir = os.getcwd()
-
-            try:
-                os.chdir(schemas_dir)
-
-                with open(xsd_path, 'rb') as f:
-                    xsd_doc = etree.parse(f)
-                    xmlschema = etree.XMLSchema(xsd_doc)
-
-            finally:
-                # Restaurar directorio original
-                os.chdir(current_dir)
-
             # Parsear el XML a validar
             xml_doc = etree.fromstring(xml_string.encode('ISO-8859-1'))
 
             # Validar
-            is_valid = xmlschema.validate(xml_doc)
-
-            if is_valid:
-                return True, []
-            else:
-                # Recopilar errores
-                errors = []
-                for error in xmlschema.error_log:
-                    error_msg = f'Línea {error.line}: {error.message}'
-                    errors.append(error_msg)
-                return False, errors
+            errors = schema.validate(xml_doc)
+            return not errors, errors
 
         except etree.XMLSyntaxError as e:
             error_msg = f'Error de sintaxis XML: {str(e)}'
@@ -87,7 +60,10 @@ class XmlValidationService(models.AbstractModel):
     @api.model
     def validate_dte_xml(self, xml_string):
         """
-        Valida un XML de DTE contra el esquema XSD oficial.
+        Valida la estructura de un XML de DTE (ver DteStructureValidator):
+        elementos obligatorios y su orden, largo de los campos, aritmética de
+        montos y coherencia de referencias y TED. Si el esquema XSD está
+        disponible, también se valida contra él.
 
         Args:
             xml_string (str): XML del DTE a validar
@@ -95,14 +71,13 @@ class XmlValidationService(models.AbstractModel):
         Returns:
             tuple: (is_valid, errors)
         """
-        # TODO: Implementar validación de DTE cuando tengamos DTE_v10.xsd
-        # Por ahora solo validamos LibroCompraVenta
-        return True, []
+        return self._validate_structure(xml_string, 'DTE')
 
     @api.model
     def validate_envio_dte_xml(self, xml_string):
         """
-        Valida un XML de EnvioDTE contra el esquema XSD oficial.
+        Valida la estructura de un XML de EnvioDTE y de cada uno de sus DTEs
+        (ver validate_dte_xml), incluidos los subtotales de la Carátula.
 
         Args:
             xml_string (str): XML del EnvioDTE a validar
@@ -110,5 +85,21 @@ class XmlValidationService(models.AbstractModel):
         Returns:
             tuple: (is_valid, errors)
         """
-        # TODO: Implementar validación de EnvioDTE cuando tengamos EnvioDTE_v10.xsd
-        return True, []
+        return self._validate_structure(xml_string, 'EnvioDTE')
+
+    def _validate_structure(self, xml_string, root_tag):
+        errors = DteStructureValidator().validate(xml_string, root_tag=root_tag)
+        if errors:
+            return False, errors
+
+        # Esquema compilado (una vez por proceso), si está en la carpeta schemas
+        schema = XsdRegistry.get(root_tag)
+        if schema is None:
+            return True, []
+        try:
+            errors = schema.validate(etree.fromstring(XML_DECLARATION_RE.sub('', xml_string).encode('utf-8')))
+        except Exception as e:
+            _logger.error('Error al validar XML: %s', e)
+            # En caso de error técnico, permitir continuar
+            return True, []
+        return not errors, errors
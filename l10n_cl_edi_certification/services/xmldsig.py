@@ -0,0 +1,506 @@
+# -*- coding: utf-8 -*-
+import base64
+import binascii
+import functools
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from itertools import islice
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from lxml import etree
+
+DS_NS = 'http://www.w3.org/2000/09/xmldsig#'
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+
+C14N_ALGORITHM = 'http://www.w3.org/TR/2001/REC-xml-c14n-20010315'
+RSA_SHA1_ALGORITHM = 'http://www.w3.org/2000/09/xmldsig#rsa-sha1'
+SHA1_ALGORITHM = 'http://www.w3.org/2000/09/xmldsig#sha1'
+
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+# Nodos desde este tamaño (en nodos del subárbol) se canonicalizan por
+# bloques en vez de en memoria (ver c14n_digest)
+C14N_STREAM_MIN_ELEMENTS = 100000
+
+# Caracteres a escapar en C14N (texto y valores de atributos)
+C14N_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#xD;'})
+C14N_ATTR_ESCAPES = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '"': '&quot;', '\t': '&#x9;', '\n': '&#xA;', '\r': '&#xD;',
+})
+
+
+def _ds(tag):
+    return '{%s}%s' % (DS_NS, tag)
+
+
+def c14n(node):
+    """
+    C14N inclusivo (sin comentarios) de un nodo, tal como lo ve un verificador.
+
+    lxml canonicaliza mal un subárbol que hereda el xmlns por defecto de un
+    ancestro (declara xmlns="" desde el segundo nivel), por lo que un nodo
+    que no es raíz se serializa primero como documento propio, con todas las
+    declaraciones de namespace en alcance, igual que hace l10n_cl_edi.
+
+    Args:
+        node (etree._Element): Nodo a canonicalizar
+
+    Returns:
+        bytes: Forma canónica del nodo
+    """
+    if node.getparent() is not None:
+        node = etree.fromstring(etree.tostring(node))
+    return etree.tostring(node, method='c14n')
+
+
+def c14n_digest(node):
+    """
+    SHA-1 del C14N inclusivo de un nodo. Equivale a
+    hashlib.sha1(c14n(node)).digest().
+
+    Los nodos normales (p. ej. el Documento de un DTE) se canonicalizan con
+    c14n(), que es lo más rápido. Solo los subárboles muy grandes (p. ej. el
+    SetDTE de un sobre con miles de DTEs) se escriben por bloques en el hash,
+    sin armar la forma canónica ni copiar el nodo en memoria: el nodo raíz con
+    el C14N de lxml y los subárboles con _C14NWriter, que es más lento pero
+    no duplica en memoria un nodo del tamaño del sobre.
+
+    Args:
+        node (etree._Element): Nodo a canonicalizar
+
+    Returns:
+        bytes: Digest SHA-1
+    """
+    if _count_elements(node, C14N_STREAM_MIN_ELEMENTS) < C14N_STREAM_MIN_ELEMENTS:
+        return hashlib.sha1(c14n(node)).digest()
+    sha1 = hashlib.sha1()
+    if node.getparent() is None:
+        etree.ElementTree(node).write_c14n(_HashSink(sha1))
+    else:
+        _C14NWriter(sha1.update).write(node)
+    return sha1.digest()
+
+
+def _count_elements(node, limit):
+    """Cantidad de nodos del subárbol, contando como máximo hasta limit."""
+    return sum(1 for _node in islice(node.iter(), limit))
+
+
+class _HashSink:
+    """Archivo de solo escritura que pasa todo lo que recibe a un hash."""
+
+    def __init__(self, hasher):
+        self.write = hasher.update
+
+
+class _C14NWriter:
+    """
+    Serializador C14N 1.0 inclusivo de un subárbol.
+
+    Produce la misma salida que c14n(node): el nodo raíz del subárbol declara
+    todos los namespaces en alcance y los descendientes solo los que cambian,
+    sin el error de lxml con el xmlns por defecto heredado.
+    """
+
+    # Fragmentos acumulados antes de codificarlos y pasarlos al hash
+    FLUSH_PARTS = 4096
+
+    def __init__(self, write):
+        self._write = write
+        self._parts = []
+        self._tags = {}
+
+    def write(self, node):
+        """
+        Args:
+            node (etree._Element): Nodo a canonicalizar
+        """
+        self._element(node, {})
+        self._flush()
+
+    def _flush(self):
+        if self._parts:
+            self._write(''.join(self._parts).encode('utf-8'))
+            self._parts.clear()
+
+    def _tag(self, node):
+        key = (node.tag, node.prefix)
+        tag = self._tags.get(key)
+        if tag is None:
+            localname = etree.QName(node).localname
+            tag = self._tags[key] = '%s:%s' % (node.prefix, localname) if node.prefix else localname
+        return tag
+
+    @staticmethod
+    def _attributes(node, nsmap):
+        # Ordenados por (namespace, nombre local); sin namespace primero
+        def attribute_key(item):
+            name = item[0]
+            if name[0] == '{':
+                return tuple(name[1:].split('}', 1))
+            return ('', name)
+
+        prefixes = {uri: prefix for prefix, uri in nsmap.items() if prefix is not None}
+        prefixes[XML_NS] = 'xml'
+        attributes = []
+        for name, value in sorted(node.items(), key=attribute_key):
+            if name[0] == '{':
+                uri, local = name[1:].split('}', 1)
+                name = '%s:%s' % (prefixes[uri], local)
+            attributes.append(' %s="%s"' % (name, value.translate(C14N_ATTR_ESCAPES)))
+        return ''.join(attributes)
+
+    @staticmethod
+    def _declarations(nsmap, parent_nsmap):
+        # Namespaces nuevos o distintos a los del padre: el por defecto
+        # primero, luego ordenados por prefijo
+        declarations = []
+        if nsmap.get(None, '') != parent_nsmap.get(None, ''):
+            declarations.append(' xmlns="%s"' % nsmap.get(None, '').translate(C14N_ATTR_ESCAPES))
+        for prefix in sorted(p for p in nsmap if p is not None):
+            if parent_nsmap.get(prefix) != nsmap[prefix]:
+                declarations.append(' xmlns:%s="%s"' % (prefix, nsmap[prefix].translate(C14N_ATTR_ESCAPES)))
+        return ''.join(declarations)
+
+    def _element(self, node, parent_nsmap):
+        parts = self._parts
+        nsmap = node.nsmap
+        tag = self._tag(node)
+
+        start = '<' + tag
+        if nsmap != parent_nsmap:
+            start += self._declarations(nsmap, parent_nsmap)
+        if len(node.attrib):
+            start += self._attributes(node, nsmap)
+        parts.append(start + '>')
+
+        if node.text:
+            parts.append(node.text.translate(C14N_TEXT_ESCAPES))
+        for child in node:
+            if isinstance(child.tag, str):
+                self._element(child, nsmap)
+            elif child.tag is etree.PI:
+                parts.append('<?%s%s?>' % (child.target, ' ' + child.text if child.text else ''))
+            elif child.tag is etree.Comment:
+                # Igual que etree.tostring(method='c14n'), que incluye comentarios
+                parts.append('<!--%s-->' % (child.text or ''))
+            if child.tail:
+                parts.append(child.tail.translate(C14N_TEXT_ESCAPES))
+        parts.append('</%s>' % tag)
+
+        if len(parts) >= self.FLUSH_PARTS:
+            self._flush()
+
+
+class XmlDsigBuilder:
+    """
+    Construye los elementos SignedInfo y Signature directamente con lxml.
+
+    Reproduce byte a byte la salida de las plantillas QWeb de l10n_cl_edi
+    (signed_info_template_with_xsi y signature_template): un elemento por
+    línea, sin indentación, con el SignedInfo canonicalizado embebido tal cual
+    (ver tests/test_xmldsig.py).
+    """
+
+    @classmethod
+    def _append(cls, parent, tag, text=None, **attrib):
+        if parent.text is None:
+            parent.text = '\n'
+        node = etree.SubElement(parent, _ds(tag), attrib)
+        node.text = text
+        node.tail = '\n'
+        return node
+
+    @classmethod
+    def signed_info(cls, uri, digest_value):
+        """
+        Construye y canonicaliza el SignedInfo (RSA-SHA1, C14N, con xmlns:xsi).
+
+        Args:
+            uri (str): URI de referencia (ej: '#SetDoc')
+            digest_value (str): Digest SHA-1 del nodo referenciado, en base64
+
+        Returns:
+            str: SignedInfo canonicalizado (C14N inclusivo, sin comentarios)
+        """
+        signed_info = etree.Element(_ds('SignedInfo'), nsmap={None: DS_NS, 'xsi': XSI_NS})
+        cls._append(signed_info, 'CanonicalizationMethod', Algorithm=C14N_ALGORITHM)
+        cls._append(signed_info, 'SignatureMethod', Algorithm=RSA_SHA1_ALGORITHM)
+        reference = cls._append(signed_info, 'Reference', URI=uri)
+        transforms = cls._append(reference, 'Transforms')
+        cls._append(transforms, 'Transform', Algorithm=C14N_ALGORITHM)
+        cls._append(reference, 'DigestMethod', Algorithm=SHA1_ALGORITHM)
+        cls._append(reference, 'DigestValue', digest_value)
+        return etree.tostring(signed_info, method='c14n').decode()
+
+    @classmethod
+    def _write(cls, xf, tag, content):
+        with xf.element(_ds(tag)):
+            if isinstance(content, list):
+                xf.write('\n')
+                for child_tag, child_content in content:
+                    cls._write(xf, child_tag, child_content)
+                    xf.write('\n')
+            else:
+                xf.write(content)
+
+    @classmethod
+    def signature(cls, signed_info_c14n, signature_value, key_info):
+        """
+        Construye el elemento Signature completo.
+
+        Args:
+            signed_info_c14n (str): SignedInfo canonicalizado (ver signed_info)
+            signature_value (str): Valor de la firma en base64
+            key_info (KeyInfoBlock): Datos de la llave pública precalculados
+
+        Returns:
+            str: Elemento Signature
+        """
+        # El SignedInfo se escribe como elemento independiente para conservar
+        # sus declaraciones xmlns y las etiquetas de cierre explícitas del C14N
+        signed_info = etree.fromstring(signed_info_c14n)
+        for node in signed_info.iter():
+            if node.text is None and not len(node):
+                node.text = ''
+
+        output = io.BytesIO()
+        with etree.xmlfile(output, encoding='utf-8') as xf:
+            with xf.element(_ds('Signature'), nsmap={None: DS_NS}):
+                xf.write('\n')
+                xf.write(signed_info)
+                xf.write('\n')
+                cls._write(xf, 'SignatureValue', signature_value)
+                xf.write('\n')
+                cls._write(xf, 'KeyInfo', [
+                    ('KeyValue', [
+                        ('RSAKeyValue', [
+                            ('Modulus', key_info.modulus),
+                            ('Exponent', key_info.exponent),
+                        ]),
+                    ]),
+                    ('X509Data', [
+                        ('X509Certificate', key_info.certificate),
+                    ]),
+                ])
+                xf.write('\n')
+        return output.getvalue().decode('utf-8')
+
+
+def _load_public_key(certificate_b64):
+    """
+    Llave pública de un X509Certificate (en base64, con o sin saltos de línea).
+    Se decodifica una vez por certificado.
+    """
+    return _load_public_key_der(re.sub(r'\s+', '', certificate_b64))
+
+
+@functools.lru_cache(maxsize=32)
+def _load_public_key_der(certificate_b64):
+    return x509.load_der_x509_certificate(base64.b64decode(certificate_b64)).public_key()
+
+
+def _b64_int(value):
+    return int.from_bytes(base64.b64decode(re.sub(r'\s+', '', value)), 'big')
+
+
+class SignatureError(Exception):
+    """Firma XMLDSig que no se pudo verificar."""
+
+
+class XmlDsigVerifier:
+    """
+    Verifica las firmas XMLDSig de un documento del SII (RSA-SHA1, C14N
+    inclusivo, Reference a un nodo por su atributo ID).
+
+    Verifica todas las firmas del documento, incluidas las anidadas (cada
+    DTE dentro de un EnvioDTE, cada Recibo dentro de un EnvioRecibos). Para
+    cada una recalcula el digest del nodo referenciado en su contexto y
+    verifica el SignatureValue del SignedInfo con la llave del certificado
+    embebido.
+
+    Las firmas válidas se recuerdan, local al proceso, por el SHA-1 de los
+    bytes firmados (nodo referenciado y su Signature, serializados con los
+    namespaces en alcance): al volver a validar un sobre sin cambios, los
+    DTEs ya verificados no se vuelven a canonicalizar ni a verificar con RSA.
+    """
+
+    MAX_CACHE_ENTRIES = 20000
+
+    _verified = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def verify(cls, root):
+        """
+        Verifica todas las firmas de un documento.
+
+        Args:
+            root (etree._Element): Raíz del documento firmado
+
+        Returns:
+            tuple: (cantidad de firmas, lista de errores); la lista está vacía
+                   si todas las firmas son válidas
+        """
+        errors = []
+        signatures = list(root.iter(_ds('Signature')))
+        for number, signature in enumerate(signatures, 1):
+            try:
+                cls._verify_signature(signature)
+            except SignatureError as e:
+                uri = signature.xpath('string(ds:SignedInfo/ds:Reference/@URI)', namespaces={'ds': DS_NS})
+                errors.append('Firma %s (%s): %s' % (number, uri or 'sin Reference', e))
+        return len(signatures), errors
+
+    @classmethod
+    def _verify_signature(cls, signature):
+        signed_info = signature.find(_ds('SignedInfo'))
+        if signed_info is None:
+            raise SignatureError('no contiene SignedInfo')
+        cls._check_algorithm(signed_info, 'CanonicalizationMethod', C14N_ALGORITHM)
+        cls._check_algorithm(signed_info, 'SignatureMethod', RSA_SHA1_ALGORITHM)
+
+        references = signed_info.findall(_ds('Reference'))
+        if not references:
+            raise SignatureError('el SignedInfo no contiene Reference')
+        targets = [cls._resolve_reference(signature, reference) for reference in references]
+
+        key = cls._cache_key(signature, targets)
+        with cls._lock:
+            if key in cls._verified:
+                cls._verified.move_to_end(key)
+                return
+
+        for reference, target in zip(references, targets):
+            cls._check_digest(reference, target, signature)
+        cls._check_signature_value(signature, signed_info)
+
+        with cls._lock:
+            cls._verified[key] = True
+            while len(cls._verified) > cls.MAX_CACHE_ENTRIES:
+                cls._verified.popitem(last=False)
+
+    @staticmethod
+    def _check_algorithm(parent, tag, expected):
+        node = parent.find(_ds(tag))
+        algorithm = node.get('Algorithm') if node is not None else None
+        if algorithm != expected:
+            raise SignatureError('%s no soportado: %s' % (tag, algorithm))
+
+    @staticmethod
+    def _resolve_reference(signature, reference):
+        """Nodo referenciado ('#ID'), buscado primero junto a la firma."""
+        uri = reference.get('URI') or ''
+        if not uri.startswith('#'):
+            raise SignatureError('Reference URI no soportada: "%s"' % uri)
+        node_id = uri[1:]
+        scope = signature.getparent()
+        while scope is not None:
+            nodes = scope.xpath('.//*[@ID=$id]', id=node_id)
+            if nodes:
+                return nodes[0]
+            scope = scope.getparent()
+        raise SignatureError('no se encontró el nodo con ID="%s"' % node_id)
+
+    @staticmethod
+    def _cache_key(signature, targets):
+        # El C14N inclusivo depende de todos los namespaces en alcance, que
+        # tostring() solo incluye si el subárbol los usa
+        sha1 = hashlib.sha1()
+        for node in (*targets, signature):
+            sha1.update(etree.tostring(node, with_tail=False))
+            sha1.update(repr(sorted(node.nsmap.items(), key=str)).encode())
+            sha1.update(b'\0')
+        return sha1.digest()
+
+    @classmethod
+    def _check_digest(cls, reference, target, signature):
+        for transform in reference.iterfind('%s/%s' % (_ds('Transforms'), _ds('Transform'))):
+            if transform.get('Algorithm') != C14N_ALGORITHM:
+                raise SignatureError('Transform no soportado: %s' % transform.get('Algorithm'))
+        cls._check_algorithm(reference, 'DigestMethod', SHA1_ALGORITHM)
+        try:
+            expected = base64.b64decode(reference.findtext(_ds('DigestValue')) or '')
+        except binascii.Error:
+            raise SignatureError('DigestValue inválido')
+        if c14n_digest(target) == expected:
+            return
+        standalone = cls._standalone_target(signature, target)
+        if standalone is None or c14n_digest(standalone) != expected:
+            raise SignatureError('el digest no coincide (el contenido firmado fue modificado)')
+
+    @staticmethod
+    def _standalone_target(signature, target):
+        """
+        Nodo referenciado dentro de una copia independiente del elemento que
+        contiene la firma (p. ej. el DTE), o None si la firma está en la raíz.
+
+        Los DTEs y Recibos se firman como documentos propios y luego se copian
+        tal cual dentro del sobre, cuya raíz declara además xmlns:xsi; el C14N
+        inclusivo en contexto incluiría esa declaración. La copia conserva solo
+        los namespaces que el elemento declara o que su contenido usa.
+        """
+        scope = signature.getparent()
+        parent = scope.getparent()
+        if parent is None:
+            return None
+        declared = [prefix for prefix, uri in scope.nsmap.items()
+                    if prefix is not None and parent.nsmap.get(prefix) != uri]
+        copy = deepcopy(scope)
+        etree.cleanup_namespaces(copy, keep_ns_prefixes=declared)
+        node_id = target.get('ID')
+        if copy.get('ID') == node_id:
+            return copy
+        nodes = copy.xpath('.//*[@ID=$id]', id=node_id)
+        return nodes[0] if nodes else None
+
+    @staticmethod
+    def _public_key(signature):
+        key_info = signature.find(_ds('KeyInfo'))
+        if key_info is None:
+            raise SignatureError('no contiene KeyInfo')
+        certificate = key_info.findtext('%s/%s' % (_ds('X509Data'), _ds('X509Certificate')))
+        modulus = key_info.findtext('%s/%s/%s' % (_ds('KeyValue'), _ds('RSAKeyValue'), _ds('Modulus')))
+        exponent = key_info.findtext('%s/%s/%s' % (_ds('KeyValue'), _ds('RSAKeyValue'), _ds('Exponent')))
+        try:
+            if certificate and certificate.strip():
+                public_key = _load_public_key(certificate)
+                # El RSAKeyValue, si viene, debe ser la llave del certificado
+                if modulus and exponent and (
+                        not isinstance(public_key, rsa.RSAPublicKey)
+                        or public_key.public_numbers() != rsa.RSAPublicNumbers(_b64_int(exponent), _b64_int(modulus))):
+                    raise SignatureError('el RSAKeyValue no corresponde al certificado')
+                return public_key
+            if modulus and exponent:
+                return rsa.RSAPublicNumbers(_b64_int(exponent), _b64_int(modulus)).public_key()
+        except (ValueError, binascii.Error) as e:
+            raise SignatureError('certificado inválido: %s' % e)
+        raise SignatureError('no contiene certificado ni RSAKeyValue')
+
+    @classmethod
+    def _check_signature_value(cls, signature, signed_info):
+        public_key = cls._public_key(signature)
+        try:
+            signature_value = base64.b64decode(re.sub(r'\s+', '', signature.findtext(_ds('SignatureValue')) or ''))
+        except binascii.Error:
+            raise SignatureError('SignatureValue inválido')
+        if not signature_value:
+            raise SignatureError('no contiene SignatureValue')
+
+        signed_info_c14n = c14n(signed_info).decode()
+        # l10n_cl_edi (y este módulo) firman el SignedInfo sin saltos de línea
+        candidates = dict.fromkeys([signed_info_c14n, re.sub(r'\n\s*', '', signed_info_c14n)])
+        for candidate in candidates:
+            try:
+                public_key.verify(signature_value, candidate.encode(), padding.PKCS1v15(), hashes.SHA1())
+                return
+            except InvalidSignature:
+                continue
+        raise SignatureError('el SignatureValue no corresponde al SignedInfo y al certificado')
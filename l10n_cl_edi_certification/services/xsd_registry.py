@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de esquemas XSD del SII compilados, compartido por todo el proceso.
+
+Cada esquema (con todos sus xs:import / xs:include) se parsea y compila una
+sola vez y se reutiliza en cada validación. Las entradas se invalidan si
+cambia la fecha de modificación del XSD o de cualquiera de sus dependencias.
+Las referencias relativas se resuelven con un Resolver de lxml contra la
+carpeta schemas/, sin os.chdir (que afecta a todos los hilos del proceso).
+
+También se registran esquemas cargados desde otras fuentes (p. ej. los XSD
+subidos como ir.attachment), identificados por una versión (checksum).
+"""
+import os
+import threading
+from urllib.parse import urlparse
+
+from lxml import etree
+
+import logging
+_logger = logging.getLogger(__name__)
+
+SCHEMAS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schemas')
+
+# Nombre del esquema -> archivo XSD principal
+SCHEMA_FILES = {
+    'LibroCV': 'LibroCV_v10.xsd',
+    'DTE': 'DTE_v10.xsd',
+    'EnvioDTE': 'EnvioDTE_v10.xsd',
+    'RespuestaDTE': 'RespuestaDTE_v10.xsd',
+    'EnvioRecibos': 'EnvioRecibos_v10.xsd',
+}
+
+
+class _SchemaResolver(etree.Resolver):
+    """
+    Resuelve los xs:import / xs:include de un XSD contra un directorio y
+    registra los archivos cargados (para invalidar por fecha de modificación).
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.loaded = []
+
+    def resolve(self, url, pubid, context):
+        path = os.path.join(self.directory, os.path.basename(urlparse(url).path))
+        if not os.path.isfile(path):
+            return None
+        self.loaded.append(path)
+        return self.resolve_filename(path, context)
+
+
+class _SourceResolver(etree.Resolver):
+    """
+    Resuelve los xs:import / xs:include de un XSD con una función que
+    retorna el contenido de cada archivo por nombre (o None si no existe).
+    """
+
+    def __init__(self, load_source):
+        super().__init__()
+        self.load_source = load_source
+
+    def resolve(self, url, pubid, context):
+        source = self.load_source(os.path.basename(urlparse(url).path))
+        if source is None:
+            return None
+        return self.resolve_string(source, context)
+
+
+def _compile_file(path):
+    """
+    Compila un XSD desde un archivo.
+
+    Returns:
+        tuple: (etree.XMLSchema, archivos cargados)
+    """
+    resolver = _SchemaResolver(os.path.dirname(path))
+    parser = etree.XMLParser()
+    parser.resolvers.add(resolver)
+    schema = etree.XMLSchema(etree.parse(path, parser))
+    return schema, [path] + resolver.loaded
+
+
+def _compile_sources(filename, load_source):
+    """
+    Compila un XSD cuyo contenido (y el de sus dependencias) entrega
+    load_source. Cada archivo se pide una sola vez: una segunda compilación
+    no vuelve a llamar a load_source.
+
+    Returns:
+        callable: Compila el esquema y retorna (etree.XMLSchema, [])
+    """
+    sources = {}
+
+    def load(name):
+        if name not in sources:
+            sources[name] = load_source(name)
+        return sources[name]
+
+    def compile_schema():
+        parser = etree.XMLParser()
+        parser.resolvers.add(_SourceResolver(load))
+        return etree.XMLSchema(etree.fromstring(load(filename), parser)), []
+
+    return compile_schema
+
+
+class CompiledSchema:
+    """
+    Esquema XSD compilado.
+
+    validate() se puede llamar desde varios hilos a la vez: lxml crea un
+    contexto de validación por llamada y el resultado es correcto, pero el
+    error_log del esquema es compartido. Por eso los errores de un documento
+    inválido se obtienen con una segunda instancia reservada para ello (se
+    compila la primera vez que hace falta y se usa bajo un lock).
+    """
+
+    def __init__(self, name, compile_schema, version=None):
+        """
+        Args:
+            name (str): Nombre del esquema
+            compile_schema (callable): Retorna (etree.XMLSchema, archivos
+                cargados); los archivos se vigilan por fecha de modificación
+            version: Versión de las fuentes (p. ej. checksum del adjunto)
+        """
+        self.name = name
+        self.version = version
+        self._compile = compile_schema
+        self.schema, files = compile_schema()
+        self.mtimes = {file_path: os.stat(file_path).st_mtime_ns for file_path in files}
+        self._reporter = None
+        self._reporter_lock = threading.Lock()
+
+    def is_current(self):
+        """True si ningún archivo del esquema cambió desde que se compiló."""
+        try:
+            return all(os.stat(path).st_mtime_ns == mtime for path, mtime in self.mtimes.items())
+        except OSError:
+            return False
+
+    def validate(self, xml_doc):
+        """
+        Args:
+            xml_doc: Documento o elemento raíz (lxml) a validar
+
+        Returns:
+            list: Errores ('Línea N: mensaje'); vacía si el documento es válido
+        """
+        if self.schema.validate(xml_doc):
+            return []
+        with self._reporter_lock:
+            if self._reporter is None:
+                self._reporter = self._compile()[0]
+            self._reporter.validate(xml_doc)
+            return [f'Línea {error.line}: {error.message}' for error in self._reporter.error_log]
+
+
+class XsdRegistry:
+    """
+    Esquemas XSD compilados, local al proceso, indexados por nombre
+    (ver SCHEMA_FILES).
+    """
+
+    _entries = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name):
+        """
+        Retorna el esquema compilado, compilándolo solo si no está en el
+        registro o si alguno de sus archivos cambió.
+
+        Args:
+            name (str): Nombre del esquema (clave de SCHEMA_FILES)
+
+        Returns:
+            CompiledSchema: o None si el XSD no está disponible
+        """
+        entry = cls._entries.get(name)
+        if entry is not None and entry.is_current():
+            return entry
+
+        with cls._lock:
+            entry = cls._entries.get(name)
+            if entry is not None and entry.is_current():
+                return entry
+
+            path = os.path.join(SCHEMAS_DIR, SCHEMA_FILES[name])
+            if not os.path.isfile(path):
+                cls._entries.pop(name, None)
+                return None
+
+            entry = CompiledSchema(name, lambda: _compile_file(path))
+            cls._entries[name] = entry
+            _logger.info('Esquema XSD %s compilado (%d archivos)', name, len(entry.mtimes))
+            return entry
+
+    @classmethod
+    def get_from_sources(cls, name, filename, version, load_source):
+        """
+        Retorna un esquema cargado desde fuentes en memoria (p. ej. un XSD
+        subido como ir.attachment), compilándolo solo si no está en el
+        registro con la misma versión.
+
+        Args:
+            name (str): Nombre del esquema en el registro (ej: nombre del adjunto)
+            filename (str): Nombre del archivo XSD principal (para load_source)
+            version: Versión de las fuentes (p. ej. checksum del adjunto)
+            load_source (callable): Nombre de archivo -> contenido (bytes) o
+                None; solo se llama al compilar
+
+        Returns:
+            CompiledSchema
+        """
+        key = ('sources', name)
+        entry = cls._entries.get(key)
+        if entry is not None and entry.version == version:
+            return entry
+
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None and entry.version == version:
+                return entry
+
+            entry = CompiledSchema(name, _compile_sources(filename, load_source), version=version)
+            cls._entries[key] = entry
+            _logger.info('Esquema XSD %s compilado desde adjuntos', name)
+            return entry
+
+    @classmethod
+    def validate(cls, name, xml_doc):
+        """
+        Valida un documento contra un esquema del registro.
+
+        Args:
+            name (str): Nombre del esquema (clave de SCHEMA_FILES)
+            xml_doc: Documento o elemento raíz (lxml) a validar
+
+        Returns:
+            list: Errores encontrados (vacía si es válido), o None si el
+                  esquema no está disponible
+        """
+        entry = cls.get(name)
+        if entry is None:
+            return None
+        return entry.validate(xml_doc)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
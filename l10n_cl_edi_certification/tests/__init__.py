@@ -1,3 +1,6 @@
-from . import test_certification_project
-from . import test_dte_generator
-from . import test_validation_service
+from . import test_book_xml_writer
+from . import test_dte_structure_validator
+from . import test_envelope_planner
+from . import test_pdf_merge
+from . import test_xmldsig
+from . import test_xsd_registry
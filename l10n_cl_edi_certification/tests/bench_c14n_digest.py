@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de c14n_digest (services/xmldsig.py). No es un test de Odoo: se
+ejecuta a mano, sin servidor, con
+
+    python3 tests/bench_c14n_digest.py
+
+Compara, para cada estrategia, el tiempo de CPU y el pico de memoria (RSS)
+de calcular los digests de:
+
+- 2000 nodos Documento de DTEs independientes (caso de firma de DTEs)
+- el SetDTE de un sobre con N DTEs (caso de firma del sobre)
+- el nodo raíz de un sobre con N DTEs
+
+Estrategias:
+
+- bytes: hashlib.sha1(c14n(node)), arma la forma canónica completa
+- writer: _C14NWriter sobre el nodo, sin copias
+- c14n_digest: lo que usa la firma
+"""
+import hashlib
+import importlib.util
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from lxml import etree
+
+XMLDSIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'xmldsig.py')
+
+
+def _load_xmldsig():
+    spec = importlib.util.spec_from_file_location('xmldsig', XMLDSIG_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+xmldsig = _load_xmldsig()
+
+
+def _dte(number):
+    details = ''.join(
+        '<Detalle><NroLinDet>%d</NroLinDet><NmbItem>Item %d</NmbItem><MontoItem>%d</MontoItem></Detalle>'
+        % (line, line, line * 100) for line in range(1, 6)
+    )
+    return (
+        '<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0"><Documento ID="F%dT33">'
+        '<Encabezado><IdDoc><TipoDTE>33</TipoDTE><Folio>%d</Folio></IdDoc>'
+        '<Emisor><RUTEmisor>76123456-7</RUTEmisor><RznSoc>Empresa &amp; Cía</RznSoc></Emisor></Encabezado>'
+        '%s<TED version="1.0"><DD><RE>76123456-7</RE><F>%d</F></DD><FRMT algoritmo="SHA1withRSA">abc</FRMT></TED>'
+        '<TmstFirma>2026-01-01T00:00:00</TmstFirma></Documento></DTE>' % (number, number, details, number)
+    )
+
+
+def _documents(count=2000):
+    return [etree.fromstring(_dte(number))[0] for number in range(count)]
+
+
+def _set_dte(count):
+    envelope = etree.fromstring(
+        '<EnvioDTE xmlns="http://www.sii.cl/SiiDte" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+        '<SetDTE ID="SetDoc">%s</SetDTE></EnvioDTE>' % ''.join(_dte(number) for number in range(count))
+    )
+    return envelope[0]
+
+
+def digest_bytes(node):
+    return hashlib.sha1(xmldsig.c14n(node)).digest()
+
+
+def digest_writer(node):
+    sha1 = hashlib.sha1()
+    xmldsig._C14NWriter(sha1.update).write(node)
+    return sha1.digest()
+
+
+STRATEGIES = {
+    'bytes': digest_bytes,
+    'writer': digest_writer,
+    'c14n_digest': xmldsig.c14n_digest,
+}
+
+
+def _run(strategy, case, size):
+    """Corre una estrategia en este proceso e imprime 'cpu_s rss_kb digest'."""
+    if case == 'documents':
+        nodes = _documents()
+    elif case == 'set_dte':
+        nodes = [_set_dte(size)]
+    else:
+        nodes = [_set_dte(size).getparent()]
+    function = STRATEGIES[strategy]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.process_time()
+    digests = [function(node) for node in nodes]
+    elapsed = time.process_time() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('%.3f %d %s' % (elapsed, rss_after - rss_before, hashlib.sha1(b''.join(digests)).hexdigest()))
+
+
+def main():
+    # Cada medición en un proceso nuevo, para que el pico de RSS sea propio
+    cases = [('documents', 0), ('set_dte', 800), ('set_dte', 8000), ('envelope', 8000)]
+    labels = {'documents': '2000 Documento', 'set_dte': 'SetDTE %d DTEs', 'envelope': 'EnvioDTE %d DTEs'}
+    for case, size in cases:
+        label = labels[case] % size if '%' in labels[case] else labels[case]
+        reference = None
+        for strategy in STRATEGIES:
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), strategy, case, str(size)], text=True,
+            )
+            elapsed, rss, digest = output.split()
+            reference = reference or digest
+            print('%-18s %-12s cpu %7.3f s   +rss %8.1f MB   %s' % (
+                label, strategy, float(elapsed), int(rss) / 1024.0,
+                'ok' if digest == reference else 'DIGEST DISTINTO',
+            ))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4:
+        _run(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de los estilos del PDF impreso (services/pdf_generator_service.py).
+No es un test de Odoo: se ejecuta a mano, sin servidor, con
+
+    python3 tests/bench_pdf_styles.py
+
+Mide si vale la pena compartir entre renders los ParagraphStyle/TableStyle
+que _build_pdf_story construye en cada PDF. Compara la mediana de:
+
+- estilos: solo construir los estilos (getSampleStyleSheet y los
+  ParagraphStyle/TableStyle de _build_pdf_story)
+- por render: construir los estilos y renderizar el PDF (lo que hace el módulo)
+- compartidos: renderizar el PDF con estilos construidos una sola vez
+
+pdf_generator_service importa el ORM, así que los estilos y la estructura del
+PDF (encabezado, emisor, receptor, detalle, totales, leyenda) están copiados
+de _build_pdf_story, sin la imagen del TED: sin ella el render es más barato
+y el peso relativo de los estilos queda sobreestimado, no subestimado.
+"""
+import io
+import statistics
+import time
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+RENDERS = 300
+HEADER_COLOR = '#1f4788'
+
+
+def build_styles():
+    """Los estilos que _build_pdf_story construye en cada render."""
+    styles = getSampleStyleSheet()
+    party_table = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(HEADER_COLOR)),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 11),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 1), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]
+    return {
+        'title': ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=16,
+                                textColor=colors.HexColor(HEADER_COLOR), alignment=TA_CENTER, spaceAfter=12),
+        'header': ParagraphStyle('Header', parent=styles['Normal'], fontSize=10, alignment=TA_LEFT),
+        'leyenda': ParagraphStyle('Leyenda', parent=styles['Normal'], fontSize=7, alignment=TA_CENTER,
+                                  textColor=colors.grey),
+        'emisor': TableStyle(party_table),
+        'receptor': TableStyle(party_table),
+        'fecha': TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ]),
+        'detalle': TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(HEADER_COLOR)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 1), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ]),
+        'totales': TableStyle([
+            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ]),
+    }
+
+
+def _table(data, col_widths, style):
+    table = Table(data, colWidths=col_widths)
+    table.setStyle(style)
+    return table
+
+
+def render(folio, styles):
+    """PDF de una factura con la estructura de _build_pdf_story."""
+    party = [
+        ['<b>EMISOR</b>', ''],
+        ['RUT:', '76123456-7'],
+        ['Razón Social:', 'Empresa de Prueba SpA'],
+        ['Giro:', 'Servicios informáticos'],
+        ['Dirección:', 'Av. Siempre Viva 123, Santiago'],
+    ]
+    detalle = [['Item', 'Descripción', 'Cantidad', 'Precio Unit.', 'Total']] + [
+        [str(line), 'Item de prueba %d' % line, '2', '$15,000', '$30,000'] for line in range(1, 6)
+    ]
+    story = [
+        Paragraph('<b>FACTURA ELECTRÓNICA</b>', styles['title']),
+        Paragraph('<b>N° %d</b>' % folio, styles['title']),
+        Spacer(1, 0.3*cm),
+        _table(party, [3.5*cm, 12*cm], styles['emisor']),
+        Spacer(1, 0.5*cm),
+        _table(party, [3.5*cm, 12*cm], styles['receptor']),
+        Spacer(1, 0.5*cm),
+        _table([['Fecha Emisión:', '2026-01-15']], [3.5*cm, 12*cm], styles['fecha']),
+        Spacer(1, 0.5*cm),
+        _table(detalle, [1.5*cm, 7*cm, 2*cm, 2.5*cm, 2.5*cm], styles['detalle']),
+        Spacer(1, 0.5*cm),
+        _table([['Monto Neto:', '$150,000'], ['IVA (19%):', '$28,500'], ['<b>TOTAL:</b>', '<b>$178,500</b>']],
+               [10.5*cm, 5*cm], styles['totales']),
+        Spacer(1, 1*cm),
+        Paragraph('<b>TIMBRE ELECTRÓNICO SII</b>', styles['title']),
+        Paragraph('Timbre Electrónico SII<br/>Verifique documento en: www.sii.cl', styles['leyenda']),
+    ]
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=letter, rightMargin=1.5*cm, leftMargin=1.5*cm,
+                      topMargin=1.5*cm, bottomMargin=1.5*cm).build(story)
+    return buffer.getvalue()
+
+
+def _median_ms(*functions):
+    """
+    Mediana en ms de cada función, ejecutadas de forma intercalada para que
+    las variaciones de la máquina afecten a todas por igual.
+    """
+    timings = [[] for _function in functions]
+    for folio in range(RENDERS):
+        for function, function_timings in zip(functions, timings):
+            start = time.perf_counter()
+            function(folio)
+            function_timings.append(time.perf_counter() - start)
+    return [statistics.median(function_timings) * 1000 for function_timings in timings]
+
+
+def main():
+    shared = build_styles()
+    # Calentamiento: fuentes e imports de ReportLab
+    render(0, shared)
+
+    styles_ms, per_render_ms, shared_ms = _median_ms(
+        lambda folio: build_styles(),
+        lambda folio: render(folio, build_styles()),
+        lambda folio: render(folio, shared),
+    )
+    print('estilos       %6.2f ms   (%.1f%% del render)' % (styles_ms, 100 * styles_ms / per_render_ms))
+    print('por render    %6.2f ms' % per_render_ms)
+    print('compartidos   %6.2f ms' % shared_ms)
+
+
+if __name__ == '__main__':
+    main()
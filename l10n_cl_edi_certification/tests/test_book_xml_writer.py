@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+import io
+
+from odoo.tests import BaseCase
+
+from odoo.addons.l10n_cl_edi_certification.services.book_xml_writer import BOOK_ENCODING, BookXmlWriter
+
+TMST_FIRMA = '2026-02-01T10:00:00'
+
+
+def _caratula(tipo_operacion, tipo_libro, tipo_envio, **extra):
+    caratula = {
+        'RutEmisorLibro': '76123456-7',
+        'RutEnvia': '11111111-1',
+        'PeriodoTributario': '2026-01',
+        'FchResol': '2014-08-22',
+        'NroResol': 0,
+        'TipoOperacion': tipo_operacion,
+        'TipoLibro': tipo_libro,
+        'TipoEnvio': tipo_envio,
+    }
+    caratula.update(extra)
+    return caratula
+
+
+SALE_DETALLES = [
+    {'TpoDoc': 33, 'NroDoc': 1, 'TasaImp': 19, 'FchDoc': '2026-01-15', 'RUTDoc': '96790240-3',
+     'RznSoc': 'Cliente & Cía', 'MntNeto': 10000, 'MntIVA': 1900, 'MntTotal': 11900},
+    {'TpoDoc': 34, 'NroDoc': 1, 'FchDoc': '2026-01-15', 'RUTDoc': '96790240-3',
+     'RznSoc': 'Cliente & Cía', 'MntExe': 5000, 'MntTotal': 5000},
+]
+
+SALE_RESUMEN = [
+    {'TpoDoc': 33, 'TotDoc': 1, 'MntNeto': 10000, 'MntIVA': 1900, 'TotMntTotal': 11900},
+    {'TpoDoc': 34, 'TotDoc': 1, 'MntExe': 5000, 'TotMntTotal': 5000},
+]
+
+LIBRO_OPEN = (
+    '<LibroCompraVenta xmlns="http://www.sii.cl/SiiDte" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+    'xsi:schemaLocation="http://www.sii.cl/SiiDte LibroCV_v10.xsd" version="1.0">\n'
+    '    <EnvioLibro ID="SetDoc">\n'
+)
+
+LIBRO_CLOSE = '''
+        <TmstFirma>2026-02-01T10:00:00</TmstFirma>
+    </EnvioLibro>
+</LibroCompraVenta>'''
+
+SALE_CARATULA = '''        <Caratula>
+            <RutEmisorLibro>76123456-7</RutEmisorLibro>
+            <RutEnvia>11111111-1</RutEnvia>
+            <PeriodoTributario>2026-01</PeriodoTributario>
+            <FchResol>2014-08-22</FchResol>
+            <NroResol>0</NroResol>
+            <TipoOperacion>VENTA</TipoOperacion>
+            <TipoLibro>MENSUAL</TipoLibro>
+            <TipoEnvio>%s</TipoEnvio>%s
+        </Caratula>'''
+
+SALE_TOTALES = '''
+            <%(tag)s>
+                <TpoDoc>33</TpoDoc>
+                <TotDoc>1</TotDoc>
+                <TotMntExe>0</TotMntExe>
+                <TotMntNeto>10000</TotMntNeto>
+                <TotMntIVA>1900</TotMntIVA>
+                <TotMntTotal>11900</TotMntTotal>
+            </%(tag)s>
+            <%(tag)s>
+                <TpoDoc>34</TpoDoc>
+                <TotDoc>1</TotDoc>
+                <TotMntExe>5000</TotMntExe>
+                <TotMntNeto>0</TotMntNeto>
+                <TotMntIVA>0</TotMntIVA>
+                <TotMntTotal>5000</TotMntTotal>
+            </%(tag)s>'''
+
+SALE_DETALLE_33 = '''
+        <Detalle>
+            <TpoDoc>33</TpoDoc>
+            <NroDoc>1</NroDoc>
+            <TasaImp>19</TasaImp>
+            <FchDoc>2026-01-15</FchDoc>
+            <RUTDoc>96790240-3</RUTDoc>
+            <RznSoc>Cliente &amp; Cía</RznSoc>
+            <MntNeto>10000</MntNeto>
+            <MntIVA>1900</MntIVA>
+            <MntTotal>11900</MntTotal>
+        </Detalle>'''
+
+SALE_DETALLE_34 = '''
+        <Detalle>
+            <TpoDoc>34</TpoDoc>
+            <NroDoc>1</NroDoc>
+            <FchDoc>2026-01-15</FchDoc>
+            <RUTDoc>96790240-3</RUTDoc>
+            <RznSoc>Cliente &amp; Cía</RznSoc>
+            <MntExe>5000</MntExe>
+            <MntTotal>5000</MntTotal>
+        </Detalle>'''
+
+# Salida de la plantilla book_sales_template (ya eliminada), sin líneas vacías
+GOLDEN_SALE_BOOK = (
+    LIBRO_OPEN
+    + SALE_CARATULA % ('TOTAL', '')
+    + '\n        <ResumenPeriodo>' + SALE_TOTALES % {'tag': 'TotalesPeriodo'} + '\n        </ResumenPeriodo>'
+    + SALE_DETALLE_33 + SALE_DETALLE_34
+    + LIBRO_CLOSE
+)
+
+# Salida de la plantilla book_purchase_template (ya eliminada), sin líneas vacías
+GOLDEN_PURCHASE_BOOK = LIBRO_OPEN + '''        <Caratula>
+            <RutEmisorLibro>76123456-7</RutEmisorLibro>
+            <RutEnvia>11111111-1</RutEnvia>
+            <PeriodoTributario>2026-01</PeriodoTributario>
+            <FchResol>2014-08-22</FchResol>
+            <NroResol>0</NroResol>
+            <TipoOperacion>COMPRA</TipoOperacion>
+            <TipoLibro>ESPECIAL</TipoLibro>
+            <TipoEnvio>TOTAL</TipoEnvio>
+            <FolioNotificacion>102</FolioNotificacion>
+        </Caratula>
+        <ResumenPeriodo>
+            <TotalesPeriodo>
+                <TpoDoc>30</TpoDoc>
+                <TotDoc>2</TotDoc>
+                <TotMntExe>0</TotMntExe>
+                <TotMntNeto>20000</TotMntNeto>
+                <TotMntIVA>1900</TotMntIVA>
+                <TotIVANoRec>
+                    <CodIVANoRec>4</CodIVANoRec>
+                    <TotOpIVANoRec>1</TotOpIVANoRec>
+                    <TotMntIVANoRec>1900</TotMntIVANoRec>
+                </TotIVANoRec>
+                    <TotOtrosImp>
+                        <CodImp>15</CodImp>
+                        <TotMntImp>500</TotMntImp>
+                    </TotOtrosImp>
+                <TotOpIVARetTotal>1</TotOpIVARetTotal>
+                <TotIVARetTotal>500</TotIVARetTotal>
+                <TotMntTotal>23800</TotMntTotal>
+            </TotalesPeriodo>
+        </ResumenPeriodo>
+        <Detalle>
+            <TpoDoc>30</TpoDoc>
+            <NroDoc>234</NroDoc>
+            <TasaImp>19</TasaImp>
+            <FchDoc>2026-01-10</FchDoc>
+            <RUTDoc>17096073-4</RUTDoc>
+            <RznSoc>Proveedor Uno</RznSoc>
+            <MntNeto>10000</MntNeto>
+            <MntIVA>1900</MntIVA>
+            <IVANoRec>
+                <CodIVANoRec>4</CodIVANoRec>
+                <MntIVANoRec>1900</MntIVANoRec>
+            </IVANoRec>
+            <MntTotal>11900</MntTotal>
+        </Detalle>
+        <Detalle>
+            <TpoDoc>30</TpoDoc>
+            <NroDoc>235</NroDoc>
+            <FchDoc>2026-01-11</FchDoc>
+            <RUTDoc>17096073-4</RUTDoc>
+            <RznSoc>Proveedor Uno</RznSoc>
+            <MntNeto>10000</MntNeto>
+            <MntIVA>0</MntIVA>
+                <OtrosImp>
+                    <CodImp>15</CodImp>
+                    <TasaImp>19</TasaImp>
+                    <MntImp>500</MntImp>
+                </OtrosImp>
+            <IVARetTotal>500</IVARetTotal>
+            <MntTotal>11900</MntTotal>
+        </Detalle>''' + LIBRO_CLOSE
+
+# Segmento PARCIAL: NroSegmento y ResumenSegmento, sin ResumenPeriodo
+GOLDEN_SALE_SEGMENT_PARCIAL = (
+    LIBRO_OPEN
+    + SALE_CARATULA % ('PARCIAL', '\n            <NroSegmento>1</NroSegmento>')
+    + '\n        <ResumenSegmento>' + SALE_TOTALES % {'tag': 'TotalesSegmento'} + '\n        </ResumenSegmento>'
+    + SALE_DETALLE_33 + SALE_DETALLE_34
+    + LIBRO_CLOSE
+)
+
+# Segmento FINAL: ResumenSegmento del segmento y ResumenPeriodo del libro completo
+GOLDEN_SALE_SEGMENT_FINAL = (
+    LIBRO_OPEN
+    + SALE_CARATULA % ('FINAL', '\n            <NroSegmento>2</NroSegmento>')
+    + '\n        <ResumenSegmento>' + SALE_TOTALES % {'tag': 'TotalesSegmento'} + '\n        </ResumenSegmento>'
+    + '\n        <ResumenPeriodo>' + SALE_TOTALES % {'tag': 'TotalesPeriodo'} + '\n        </ResumenPeriodo>'
+    + SALE_DETALLE_33 + SALE_DETALLE_34
+    + LIBRO_CLOSE
+)
+
+
+def _write(book_type, book_data):
+    output = io.BytesIO()
+    BookXmlWriter(output, book_type).write(dict(book_data, TmstFirma=TMST_FIRMA))
+    return output.getvalue()
+
+
+class TestBookXmlWriter(BaseCase):
+    """BookXmlWriter debe reproducir byte a byte la salida de las plantillas del libro."""
+
+    def assertBookXml(self, xml, golden):
+        self.assertEqual(xml, golden.encode(BOOK_ENCODING))
+
+    def test_sale_book(self):
+        xml = _write('sale', {
+            'Caratula': _caratula('VENTA', 'MENSUAL', 'TOTAL'),
+            'ResumenPeriodo': SALE_RESUMEN,
+            # Los Detalles se consumen una sola vez (vienen de un generador)
+            'Detalles': iter(SALE_DETALLES),
+        })
+        self.assertBookXml(xml, GOLDEN_SALE_BOOK)
+
+    def test_purchase_book(self):
+        xml = _write('purchase', {
+            'Caratula': _caratula('COMPRA', 'ESPECIAL', 'TOTAL', FolioNotificacion=102),
+            'ResumenPeriodo': [{
+                'TpoDoc': 30, 'TotDoc': 2, 'MntNeto': 20000, 'MntIVA': 1900,
+                'IVANoRec': {'CodIVANoRec': 4, 'TotOpIVANoRec': 1, 'TotMntIVANoRec': 1900},
+                'OtrosImpuestos': [{'CodImp': 15, 'TotMntImp': 500}],
+                'TotOpIVARetTotal': 1, 'IVARetTotal': 500,
+                'TotMntTotal': 23800,
+            }],
+            'Detalles': iter([
+                {'TpoDoc': 30, 'NroDoc': 234, 'TasaImp': 19, 'FchDoc': '2026-01-10', 'RUTDoc': '17096073-4',
+                 'RznSoc': 'Proveedor Uno', 'MntNeto': 10000, 'MntIVA': 1900,
+                 'IVANoRec': {'CodIVANoRec': 4, 'MntIVANoRec': 1900}, 'MntTotal': 11900},
+                {'TpoDoc': 30, 'NroDoc': 235, 'FchDoc': '2026-01-11', 'RUTDoc': '17096073-4',
+                 'RznSoc': 'Proveedor Uno', 'MntNeto': 10000,
+                 'OtrosImp': [{'CodImp': 15, 'TasaImp': 19, 'MntImp': 500}],
+                 'IVARetTotal': 500, 'MntTotal': 11900},
+            ]),
+        })
+        self.assertBookXml(xml, GOLDEN_PURCHASE_BOOK)
+
+    def test_sale_segments(self):
+        parcial = _write('sale', {
+            'Caratula': _caratula('VENTA', 'MENSUAL', 'PARCIAL', NroSegmento=1),
+            'ResumenSegmento': SALE_RESUMEN,
+            'Detalles': iter(SALE_DETALLES),
+        })
+        self.assertBookXml(parcial, GOLDEN_SALE_SEGMENT_PARCIAL)
+
+        final = _write('sale', {
+            'Caratula': _caratula('VENTA', 'MENSUAL', 'FINAL', NroSegmento=2),
+            'ResumenSegmento': SALE_RESUMEN,
+            'ResumenPeriodo': SALE_RESUMEN,
+            'Detalles': iter(SALE_DETALLES),
+        })
+        self.assertBookXml(final, GOLDEN_SALE_SEGMENT_FINAL)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import BaseCase
+
+from odoo.addons.l10n_cl_edi_certification.services.dte_structure_validator import DteStructureValidator
+
+RUT_EMISOR = '76123456-7'
+RUT_RECEPTOR = '96790240-3'
+FCH_EMIS = '2026-01-15'
+
+
+def _totales(dte_type, neto, exento):
+    """Totales tal como los arma dte_data (TasaIVA siempre presente, también en los exentos)"""
+    iva = round(neto * 0.19)
+    lines = []
+    if neto:
+        lines.append('<MntNeto>%s</MntNeto>' % neto)
+    if exento:
+        lines.append('<MntExe>%s</MntExe>' % exento)
+    lines.append('<TasaIVA>19.00</TasaIVA>')
+    if iva:
+        lines.append('<IVA>%s</IVA>' % iva)
+    lines.append('<MntTotal>%s</MntTotal>' % (neto + exento + iva))
+    return '\n                    '.join(lines), neto + exento + iva
+
+
+def _dte_xml(dte_type, folio, references=()):
+    """
+    DTE con la misma forma (elementos, orden e indentación) que renderiza
+    l10n_cl_edi_certification.dte_certification_template.
+    """
+    exempt = dte_type == '34'
+    items = [('Servicio de prueba', 2, 15000), ('Insumo de prueba', 1, 9990)]
+    amounts = sum(round(qty * price) for _name, qty, price in items)
+    totales, total = _totales(dte_type, 0 if exempt else amounts, amounts if exempt else 0)
+
+    detalle = ''.join('''
+            <Detalle>
+                <NroLinDet>%s</NroLinDet>
+                <NmbItem>%s</NmbItem>
+                <DscItem></DscItem>
+                <QtyItem>%.6f</QtyItem>
+                <PrcItem>%.6f</PrcItem>
+                <MontoItem>%s</MontoItem>
+            </Detalle>''' % (line, name, qty, price, round(qty * price))
+                      for line, (name, qty, price) in enumerate(items, 1))
+    referencias = ''.join('''
+            <Referencia>
+                <NroLinRef>%s</NroLinRef>
+                <TpoDocRef>%s</TpoDocRef>
+                <FolioRef>%s</FolioRef>
+                <FchRef>%s</FchRef>%s
+                <RazonRef>%s</RazonRef>
+            </Referencia>''' % (line, tpo_doc, folio_ref, FCH_EMIS,
+                                '\n                <CodRef>%s</CodRef>' % cod_ref if cod_ref else '', razon)
+                          for line, (tpo_doc, folio_ref, cod_ref, razon) in enumerate(references, 1))
+
+    return '''<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0">
+            <Documento ID="F{folio}T{dte_type}">
+            <Encabezado>
+                <IdDoc>
+                    <TipoDTE>{dte_type}</TipoDTE>
+                    <Folio>{folio}</Folio>
+                    <FchEmis>{fch_emis}</FchEmis>
+                </IdDoc>
+                <Emisor>
+                    <RUTEmisor>{rut_emisor}</RUTEmisor>
+                    <RznSoc>Empresa de Prueba SpA</RznSoc>
+                    <GiroEmis>Servicios informáticos</GiroEmis>
+                    <Acteco>620200</Acteco>
+                    <DirOrigen>Av. Siempre Viva 123</DirOrigen>
+                    <CmnaOrigen>Santiago</CmnaOrigen>
+                </Emisor>
+                <Receptor>
+                    <RUTRecep>{rut_receptor}</RUTRecep>
+                    <RznSocRecep>Cliente de Prueba</RznSocRecep>
+                    <GiroRecep>Comercio</GiroRecep>
+                    <DirRecep>Calle Falsa 456</DirRecep>
+                    <CmnaRecep>Providencia</CmnaRecep>
+                </Receptor>
+                <Totales>
+                    {totales}
+                </Totales>
+            </Encabezado>{detalle}{referencias}
+<TED version="1.0">
+<DD>
+<RE>{rut_emisor}</RE>
+<TD>{dte_type}</TD>
+<F>{folio}</F>
+<FE>{fch_emis}</FE>
+<RR>{rut_receptor}</RR>
+<RSR>Cliente de Prueba</RSR>
+<MNT>{total}</MNT>
+<IT1>Servicio de prueba</IT1>
+<TSTED>2026-01-15T10:00:00</TSTED>
+</DD>
+<FRMT algoritmo="SHA1withRSA">AAAA</FRMT>
+</TED>
+        <TmstFirma>2026-01-15T10:00:00</TmstFirma>
+            </Documento>
+        </DTE>'''.format(
+        folio=folio, dte_type=dte_type, fch_emis=FCH_EMIS, rut_emisor=RUT_EMISOR, rut_receptor=RUT_RECEPTOR,
+        totales=totales, total=total, detalle=detalle, referencias=referencias,
+    )
+
+
+SET_REFERENCE = ('SET', '4514789', None, 'CASO 4514789-1')
+
+
+class TestDteStructureValidator(BaseCase):
+    """Cada tipo de DTE que emiten los generadores pasa la validación previa a la firma."""
+
+    def assertValid(self, xml):
+        self.assertEqual(DteStructureValidator().validate(xml), [])
+
+    def test_factura_33(self):
+        self.assertValid(_dte_xml('33', 10, [SET_REFERENCE]))
+
+    def test_factura_exenta_34(self):
+        # TasaIVA va en el XML aunque el documento sea exento
+        self.assertValid(_dte_xml('34', 10, [SET_REFERENCE]))
+
+    def test_factura_compra_46(self):
+        self.assertValid(_dte_xml('46', 10, [SET_REFERENCE]))
+
+    def test_guia_despacho_52(self):
+        self.assertValid(_dte_xml('52', 10, [SET_REFERENCE]))
+
+    def test_nota_debito_56(self):
+        self.assertValid(_dte_xml('56', 10, [SET_REFERENCE, ('61', '5', '3', 'ANULA NOTA DE CREDITO')]))
+
+    def test_nota_credito_61(self):
+        self.assertValid(_dte_xml('61', 10, [SET_REFERENCE, ('33', '7', '3', 'DEVOLUCION DE MERCADERIAS')]))
+
+    def test_exenta_con_monto_afecto(self):
+        xml = _dte_xml('34', 10).replace('<MntExe>', '<MntNeto>100</MntNeto>\n<MntExe>')
+        errors = DteStructureValidator().validate(xml)
+        self.assertIn('F10T34: Totales: MntNeto no corresponde en una Factura No Afecta o Exenta Electrónica', errors)
+
+    def test_nota_credito_sin_codref(self):
+        errors = DteStructureValidator().validate(_dte_xml('61', 10, [SET_REFERENCE]))
+        self.assertIn('F10T61: Una Nota de Crédito Electrónica debe referenciar el documento que modifica '
+                      '(Referencia con CodRef)', errors)
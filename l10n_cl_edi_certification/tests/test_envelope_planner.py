@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import BaseCase
+
+from odoo.addons.l10n_cl_edi_certification.services.envelope_planner import (
+    ENVELOPE_OVERHEAD_BYTES,
+    EnvelopePlanner,
+)
+
+
+class _Document:
+    """Documento mínimo con los campos que usa EnvelopePlanner"""
+
+    def __init__(self, document_type_code, folio, reference=None):
+        self.document_type_code = document_type_code
+        self.folio = folio
+        self.reference_doc_type, self.reference_folio = reference or (False, False)
+
+    def __repr__(self):
+        return 'F%sT%s' % (self.folio, self.document_type_code)
+
+
+def _names(shards):
+    return [[repr(doc) for doc in shard] for shard in shards]
+
+
+class TestEnvelopePlanner(BaseCase):
+
+    def test_max_documents(self):
+        documents = [_Document('33', folio) for folio in range(1, 6)]
+        shards = EnvelopePlanner(0, 2).plan(documents, {})
+        self.assertEqual(_names(shards), [['F1T33', 'F2T33'], ['F3T33', 'F4T33'], ['F5T33']])
+
+    def test_max_bytes(self):
+        documents = [_Document('33', folio) for folio in range(1, 5)]
+        sizes = dict.fromkeys(documents, 1000)
+        shards = EnvelopePlanner(ENVELOPE_OVERHEAD_BYTES + 2500, 0).plan(documents, sizes)
+        self.assertEqual(_names(shards), [['F1T33', 'F2T33'], ['F3T33', 'F4T33']])
+
+    def test_no_limits(self):
+        documents = [_Document('33', folio) for folio in range(1, 4)]
+        self.assertEqual(len(EnvelopePlanner(0, 0).plan(documents, {})), 1)
+
+    def test_invoices_before_credit_and_debit_notes(self):
+        documents = [
+            _Document('56', 1, ('61', 1)),
+            _Document('61', 1, ('33', 2)),
+            _Document('34', 1),
+            _Document('33', 2),
+            _Document('33', 1),
+        ]
+        shards = EnvelopePlanner(0, 0).plan(documents, {})
+        self.assertEqual(_names(shards), [['F1T33', 'F2T33', 'F1T34', 'F1T61', 'F1T56']])
+
+    def test_reference_group_stays_together(self):
+        # F2T33 ← F1T61 ← F1T56 forman un grupo de 3 que no cabe junto a F1T33
+        documents = [
+            _Document('33', 1),
+            _Document('33', 2),
+            _Document('61', 1, ('33', 2)),
+            _Document('56', 1, ('61', 1)),
+            _Document('33', 3),
+        ]
+        shards = EnvelopePlanner(0, 3).plan(documents, {})
+        self.assertEqual(_names(shards), [['F1T33'], ['F2T33', 'F1T61', 'F1T56'], ['F3T33']])
+
+    def test_reference_outside_the_set(self):
+        documents = [_Document('61', 1, ('33', 99)), _Document('33', 1)]
+        shards = EnvelopePlanner(0, 1).plan(documents, {})
+        self.assertEqual(_names(shards), [['F1T33'], ['F1T61']])
+
+    def test_group_larger_than_an_envelope_is_split(self):
+        documents = [
+            _Document('33', 1),
+            _Document('61', 1, ('33', 1)),
+            _Document('61', 2, ('33', 1)),
+        ]
+        with self.assertLogs('odoo.addons.l10n_cl_edi_certification.services.envelope_planner', 'WARNING'):
+            shards = EnvelopePlanner(0, 2).plan(documents, {})
+        self.assertEqual(_names(shards), [['F1T33', 'F1T61'], ['F2T61']])
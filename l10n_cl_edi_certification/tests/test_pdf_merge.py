@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import tempfile
+
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Table
+
+from odoo.tests import BaseCase
+
+from odoo.addons.l10n_cl_edi_certification.services.pdf_merge import PdfPageWriter, _PdfSource, REFERENCE_RE
+
+
+def _pdf(titles):
+    """PDF de ReportLab (en un archivo temporal) con una página por título"""
+    styles = getSampleStyleSheet()
+    story = []
+    for title in titles:
+        if story:
+            story.append(PageBreak())
+        story.extend([Paragraph(title, styles['Title']), Table([['Folio', 'Monto'], [title, '1000']])])
+    output = tempfile.TemporaryFile()
+    SimpleDocTemplate(output).build(story)
+    return output
+
+
+def _page_contents(source):
+    """Stream de contenido de cada página, en orden"""
+    contents = []
+    for number in source.page_numbers():
+        body = source.read_object(number)[0]
+        reference = REFERENCE_RE.search(body[body.index(b'/Contents'):])
+        contents.append(source.read_object(int(reference.group(1)))[1])
+    return contents
+
+
+class TestPdfPageWriter(BaseCase):
+
+    def test_append_keeps_pages_in_order(self):
+        parts = [_pdf(['F1T33', 'F2T33', 'F3T33']), _pdf(['F1T61', 'F2T61'])]
+        expected = []
+        with tempfile.TemporaryFile() as output:
+            writer = PdfPageWriter(output)
+            for part in parts:
+                expected.extend(_page_contents(_PdfSource(part)))
+                writer.append(part)
+                part.close()
+            writer.close()
+
+            merged = _PdfSource(output)
+            self.assertEqual(len(list(merged.page_numbers())), 5)
+            self.assertEqual(_page_contents(merged), expected)
+
+    def test_close_without_pages(self):
+        with tempfile.TemporaryFile() as output:
+            with self.assertRaises(ValueError):
+                PdfPageWriter(output).close()
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+import base64
+import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+from lxml import etree
+from markupsafe import Markup
+
+from odoo.tests import BaseCase, TransactionCase, tagged
+
+from odoo.addons.l10n_cl_edi_certification.services.xmldsig import XmlDsigBuilder, XmlDsigVerifier, c14n_digest
+
+URI = '#F1T33'
+DIGEST_VALUE = 'AAAAAAAAAAAAAAAAAAAAAAAAAAA='
+SIGNATURE_VALUE = 'AAAA'
+KEY_INFO = SimpleNamespace(
+    modulus='AAAAAAAA',
+    exponent='AQAB',
+    certificate='\nAAAAAAAA\nAAAA',
+)
+
+# Salida de l10n_cl_edi.signed_info_template_with_xsi, canonicalizada
+GOLDEN_SIGNED_INFO = (
+    '<SignedInfo xmlns="http://www.w3.org/2000/09/xmldsig#" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+    '<CanonicalizationMethod Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315"></CanonicalizationMethod>\n'
+    '<SignatureMethod Algorithm="http://www.w3.org/2000/09/xmldsig#rsa-sha1"></SignatureMethod>\n'
+    '<Reference URI="#F1T33">\n'
+    '<Transforms>\n'
+    '<Transform Algorithm="http://www.w3.org/TR/2001/REC-xml-c14n-20010315"></Transform>\n'
+    '</Transforms>\n'
+    '<DigestMethod Algorithm="http://www.w3.org/2000/09/xmldsig#sha1"></DigestMethod>\n'
+    '<DigestValue>AAAAAAAAAAAAAAAAAAAAAAAAAAA=</DigestValue>\n'
+    '</Reference>\n'
+    '</SignedInfo>'
+)
+
+# Salida de l10n_cl_edi.signature_template con el SignedInfo anterior
+GOLDEN_SIGNATURE = (
+    '<Signature xmlns="http://www.w3.org/2000/09/xmldsig#">\n'
+    + GOLDEN_SIGNED_INFO + '\n'
+    '<SignatureValue>AAAA</SignatureValue>\n'
+    '<KeyInfo>\n'
+    '<KeyValue>\n'
+    '<RSAKeyValue>\n'
+    '<Modulus>AAAAAAAA</Modulus>\n'
+    '<Exponent>AQAB</Exponent>\n'
+    '</RSAKeyValue>\n'
+    '</KeyValue>\n'
+    '<X509Data>\n'
+    '<X509Certificate>\n'
+    'AAAAAAAA\n'
+    'AAAA</X509Certificate>\n'
+    '</X509Data>\n'
+    '</KeyInfo>\n'
+    '</Signature>'
+)
+
+
+class TestXmlDsigBuilder(BaseCase):
+    """XmlDsigBuilder debe reproducir byte a byte las plantillas de firma de l10n_cl_edi."""
+
+    def test_signed_info(self):
+        self.assertEqual(XmlDsigBuilder.signed_info(URI, DIGEST_VALUE), GOLDEN_SIGNED_INFO)
+
+    def test_signature(self):
+        self.assertEqual(
+            XmlDsigBuilder.signature(GOLDEN_SIGNED_INFO, SIGNATURE_VALUE, KEY_INFO),
+            GOLDEN_SIGNATURE,
+        )
+
+
+DTE_XML = '''<DTE xmlns="http://www.sii.cl/SiiDte" version="1.0">
+<Documento ID="F%(folio)sT33">
+<Encabezado>
+<IdDoc>
+<TipoDTE>33</TipoDTE>
+<Folio>%(folio)s</Folio>
+<FchEmis>2026-01-15</FchEmis>
+</IdDoc>
+</Encabezado>
+<TmstFirma>2026-01-15T10:00:00</TmstFirma>
+</Documento>
+</DTE>'''
+
+ENVELOPE_XML = '''<EnvioDTE xmlns="http://www.sii.cl/SiiDte" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" version="1.0">
+<SetDTE ID="SetDoc">
+<Caratula version="1.0">
+<RutEmisor>76123456-7</RutEmisor>
+</Caratula>
+</SetDTE>
+</EnvioDTE>'''
+
+
+def _b64_int(value):
+    return base64.b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big')).decode()
+
+
+class TestXmlDsigVerifier(BaseCase):
+    """XmlDsigVerifier con firmas reales (llave y certificado generados en el test)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Certificado de prueba')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(cls.private_key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(cls.private_key, hashes.SHA256())
+        )
+        numbers = cls.private_key.public_key().public_numbers()
+        cls.key_info = SimpleNamespace(
+            modulus=_b64_int(numbers.n),
+            exponent=_b64_int(numbers.e),
+            certificate=base64.b64encode(certificate.public_bytes(serialization.Encoding.DER)).decode(),
+        )
+
+    def setUp(self):
+        super().setUp()
+        XmlDsigVerifier._verified.clear()
+
+    def _sign(self, parent, target):
+        """Firma target (por su ID) y agrega la Signature al final de parent"""
+        signed_info = XmlDsigBuilder.signed_info(
+            '#' + target.get('ID'), base64.b64encode(c14n_digest(target)).decode())
+        signature_value = self.private_key.sign(signed_info.encode(), padding.PKCS1v15(), hashes.SHA1())
+        signature = XmlDsigBuilder.signature(
+            signed_info, base64.b64encode(signature_value).decode(), self.key_info)
+        parent.append(etree.fromstring(signature))
+
+    def _signed_dte(self, folio=1):
+        dte = etree.fromstring(DTE_XML % {'folio': folio})
+        self._sign(dte, dte[0])
+        return dte
+
+    def _signed_envelope(self, folios):
+        envelope = etree.fromstring(ENVELOPE_XML)
+        set_dte = envelope[0]
+        for folio in folios:
+            # Cada DTE se firma como documento propio y se copia tal cual
+            set_dte.append(etree.fromstring(etree.tostring(self._signed_dte(folio))))
+        self._sign(envelope, set_dte)
+        return envelope
+
+    def test_valid_signature(self):
+        self.assertEqual(XmlDsigVerifier.verify(self._signed_dte()), (1, []))
+
+    def test_tampered_folio(self):
+        dte = self._signed_dte()
+        dte.find('.//{http://www.sii.cl/SiiDte}Folio').text = '2'
+        count, errors = XmlDsigVerifier.verify(dte)
+        self.assertEqual(count, 1)
+        self.assertEqual(errors, ['Firma 1 (#F1T33): el digest no coincide (el contenido firmado fue modificado)'])
+
+    def test_tampered_signature_value(self):
+        dte = self._signed_dte()
+        signature_value = dte.find('.//{http://www.w3.org/2000/09/xmldsig#}SignatureValue')
+        value = bytearray(base64.b64decode(signature_value.text))
+        value[0] ^= 1
+        signature_value.text = base64.b64encode(bytes(value)).decode()
+        self.assertEqual(XmlDsigVerifier.verify(dte), (1, [
+            'Firma 1 (#F1T33): el SignatureValue no corresponde al SignedInfo y al certificado',
+        ]))
+
+    def test_nested_dte_in_envelope(self):
+        envelope = self._signed_envelope([1, 2])
+        self.assertEqual(XmlDsigVerifier.verify(envelope), (3, []))
+
+        envelope.find('.//{http://www.sii.cl/SiiDte}Folio').text = '3'
+        count, errors = XmlDsigVerifier.verify(envelope)
+        self.assertEqual(count, 3)
+        self.assertEqual(errors, [
+            'Firma 1 (#F1T33): el digest no coincide (el contenido firmado fue modificado)',
+            'Firma 3 (#SetDoc): el digest no coincide (el contenido firmado fue modificado)',
+        ])
+
+    def test_cache_hit(self):
+        envelope = self._signed_envelope([1, 2])
+        self.assertEqual(XmlDsigVerifier.verify(envelope), (3, []))
+
+        # Misma firma y mismo contenido: no se vuelve a verificar con RSA
+        with patch.object(XmlDsigVerifier, '_check_signature_value') as check_signature_value:
+            self.assertEqual(XmlDsigVerifier.verify(envelope), (3, []))
+            self.assertEqual(XmlDsigVerifier.verify(self._signed_envelope([1, 2])), (3, []))
+        check_signature_value.assert_not_called()
+
+        # Un contenido distinto no usa el caché
+        with patch.object(XmlDsigVerifier, '_check_signature_value') as check_signature_value:
+            XmlDsigVerifier.verify(self._signed_envelope([1, 3]))
+        self.assertEqual(check_signature_value.call_count, 2)
+
+
+@tagged('post_install', '-at_install')
+class TestXmlDsigTemplates(TransactionCase):
+    """Las plantillas QWeb de l10n_cl_edi siguen coincidiendo con los golden strings."""
+
+    def test_signed_info_template(self):
+        signed_info = self.env['ir.qweb']._render('l10n_cl_edi.signed_info_template_with_xsi', {
+            'uri': URI,
+            'digest_value': DIGEST_VALUE,
+        })
+        self.assertEqual(
+            etree.tostring(etree.fromstring(signed_info), method='c14n').decode(),
+            GOLDEN_SIGNED_INFO,
+        )
+
+    def test_signature_template(self):
+        signature = self.env['ir.qweb']._render('l10n_cl_edi.signature_template', {
+            'signed_info': Markup(GOLDEN_SIGNED_INFO),
+            'signature_value': SIGNATURE_VALUE,
+            'modulus': KEY_INFO.modulus,
+            'exponent': KEY_INFO.exponent,
+            'certificate': KEY_INFO.certificate,
+        })
+        if isinstance(signature, bytes):
+            signature = signature.decode('utf-8')
+        self.assertEqual(str(signature).strip(), GOLDEN_SIGNATURE)
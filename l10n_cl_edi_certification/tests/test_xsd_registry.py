@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from lxml import etree
+
+from odoo.tests import BaseCase
+
+from odoo.addons.l10n_cl_edi_certification.services import xsd_registry
+from odoo.addons.l10n_cl_edi_certification.services.xsd_registry import XsdRegistry
+
+MAIN_XSD = b'''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:t="urn:test:types"
+           targetNamespace="urn:test:main" xmlns="urn:test:main" elementFormDefault="qualified">
+  <xs:import namespace="urn:test:types" schemaLocation="Types_v10.xsd"/>
+  <xs:element name="Documento">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="Folio" type="t:FolioType"/>
+      </xs:sequence>
+    </xs:complexType>
+  </xs:element>
+</xs:schema>
+'''
+
+TYPES_XSD = b'''<?xml version="1.0" encoding="UTF-8"?>
+<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:test:types">
+  <xs:simpleType name="FolioType">
+    <xs:restriction base="xs:positiveInteger">
+      <xs:maxInclusive value="%d"/>
+    </xs:restriction>
+  </xs:simpleType>
+</xs:schema>
+'''
+
+
+def _document(folio):
+    return etree.fromstring('<Documento xmlns="urn:test:main"><Folio>%s</Folio></Documento>' % folio)
+
+
+class TestXsdRegistry(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.schemas_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.schemas_dir)
+        self._write('Main_v10.xsd', MAIN_XSD)
+        self._write('Types_v10.xsd', TYPES_XSD % 999)
+
+        patchers = [
+            patch.object(xsd_registry, 'SCHEMAS_DIR', self.schemas_dir),
+            patch.dict(xsd_registry.SCHEMA_FILES, {'Main': 'Main_v10.xsd'}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        XsdRegistry.clear()
+        self.addCleanup(XsdRegistry.clear)
+
+    def _write(self, filename, content, mtime_ns=None):
+        path = os.path.join(self.schemas_dir, filename)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def test_import_is_resolved(self):
+        entry = XsdRegistry.get('Main')
+        self.assertEqual(sorted(os.path.basename(path) for path in entry.mtimes), ['Main_v10.xsd', 'Types_v10.xsd'])
+        self.assertEqual(entry.validate(_document(10)), [])
+        errors = entry.validate(_document(1000))
+        self.assertEqual(len(errors), 1)
+        self.assertIn('1000', errors[0])
+        self.assertIs(XsdRegistry.get('Main'), entry)
+
+    def test_missing_schema(self):
+        os.remove(os.path.join(self.schemas_dir, 'Main_v10.xsd'))
+        self.assertIsNone(XsdRegistry.get('Main'))
+        self.assertIsNone(XsdRegistry.validate('Main', _document(10)))
+
+    def test_imported_file_change_recompiles(self):
+        entry = XsdRegistry.get('Main')
+        mtime_ns = os.stat(os.path.join(self.schemas_dir, 'Types_v10.xsd')).st_mtime_ns
+        self._write('Types_v10.xsd', TYPES_XSD % 9999, mtime_ns=mtime_ns + 10 ** 9)
+
+        updated = XsdRegistry.get('Main')
+        self.assertIsNot(updated, entry)
+        self.assertEqual(updated.validate(_document(1000)), [])
+
+    def test_concurrent_validation(self):
+        # Folios válidos e inválidos intercalados: cada hilo debe recibir los
+        # errores de su propio documento (el error_log del esquema es compartido)
+        folios = list(range(990, 1010)) * 10
+
+        def check(folio):
+            return folio, XsdRegistry.get('Main'), XsdRegistry.validate('Main', _document(folio))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(check, folios))
+
+        self.assertEqual(len({id(entry) for _folio, entry, _errors in results}), 1)
+        for folio, _entry, errors in results:
+            if folio <= 999:
+                self.assertEqual(errors, [], folio)
+            else:
+                self.assertEqual(len(errors), 1, folio)
+                self.assertIn(str(folio), errors[0])
+
+    def test_sources_loaded_once(self):
+        sources = {'Main_v10.xsd': MAIN_XSD, 'Types_v10.xsd': TYPES_XSD % 999}
+        requested = []
+
+        def load_source(name):
+            requested.append(name)
+            return sources.get(name)
+
+        entry = XsdRegistry.get_from_sources('adjunto', 'Main_v10.xsd', 'v1', load_source)
+        self.assertEqual(entry.validate(_document(10)), [])
+        # El esquema de reporte de errores se compila sin volver a pedir las fuentes
+        self.assertEqual(len(entry.validate(_document(1000))), 1)
+        self.assertIs(XsdRegistry.get_from_sources('adjunto', 'Main_v10.xsd', 'v1', load_source), entry)
+        self.assertEqual(sorted(requested), ['Main_v10.xsd', 'Types_v10.xsd'])
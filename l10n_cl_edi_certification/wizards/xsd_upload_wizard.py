@@ -129,6 +129,10 @@ class XsdUploadWizard(models.TransientModel):
                 })
                 uploaded.append(filename)
 
+        # La ubicación de los esquemas se resuelve una vez y queda en caché (ver ValidationService)
+        if uploaded or updated:
+            self.env.registry.clear_cache()
+
         # Mensaje de resultado
         messages = []
         if uploaded:
@@ -166,6 +170,7 @@ class XsdUploadWizard(models.TransientModel):
             raise UserError(_('No hay esquemas XSD instalados para eliminar.'))
 
         attachments.unlink()
+        self.env.registry.clear_cache()
 
         return {
             'type': 'ir.actions.client',